@@ -1,18 +1,42 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_file, g, has_request_context, make_response, Response, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import hashlib
 import jwt
 import datetime
 import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 import bcrypt
 from urllib.parse import urlparse
 import re
+import select
+import click
+import json
+import base64
+import pickle
+import gzip
+import io
+import mimetypes
+import secrets
+import tempfile
+import itertools
+from collections import OrderedDict
 
-app = Flask(__name__, static_folder='static', static_url_path='')
+try:
+    import brotli
+except ImportError:  # Optional: assets are then served with gzip only
+    brotli = None
+
+# Static files are served from an in-memory manifest (see Frontend Routes), not Flask's static route
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Environment configuration
@@ -20,116 +44,1091 @@ DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///task_manager.db')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
 
 # Database setup
-DATABASE = 'task_manager.db'
 IS_POSTGRESQL = DATABASE_URL.startswith('postgresql://')
+# SQLite file from sqlite:///<path>; anything else falls back to the default file
+DATABASE = DATABASE_URL[len('sqlite:///'):] if DATABASE_URL.startswith('sqlite:///') else 'task_manager.db'
 
-def init_db():
-    """Initialize database with tables and sample data"""
-    # Define table schemas for both SQLite and PostgreSQL
-    if IS_POSTGRESQL:
-        # PostgreSQL table creation
-        users_table = '''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        '''
-        
-        tracks_table = '''
-            CREATE TABLE IF NOT EXISTS tracks (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                color VARCHAR(7) DEFAULT '#3B82F6',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        '''
-        
-        goals_table = '''
-            CREATE TABLE IF NOT EXISTS goals (
-                id SERIAL PRIMARY KEY,
-                track_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                target_value INTEGER DEFAULT 1,
-                current_value INTEGER DEFAULT 0,
-                unit VARCHAR(50) DEFAULT 'times',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (track_id) REFERENCES tracks (id) ON DELETE CASCADE
-            )
-        '''
-        
-        tasks_table = '''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id SERIAL PRIMARY KEY,
-                goal_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                completed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (goal_id) REFERENCES goals (id) ON DELETE CASCADE
-            )
-        '''
-    else:
-        # SQLite table creation
-        users_table = '''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        '''
-        
-        tracks_table = '''
-            CREATE TABLE IF NOT EXISTS tracks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                color TEXT DEFAULT '#3B82F6',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        '''
-        
-        goals_table = '''
-            CREATE TABLE IF NOT EXISTS goals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                track_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                target_value INTEGER DEFAULT 1,
-                current_value INTEGER DEFAULT 0,
-                unit TEXT DEFAULT 'times',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (track_id) REFERENCES tracks (id)
-            )
+# Schema migrations
+# Table definitions for the first migration, for both SQLite and PostgreSQL
+POSTGRES_USERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+POSTGRES_TRACKS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS tracks (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        color VARCHAR(7) DEFAULT '#3B82F6',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+'''
+
+POSTGRES_GOALS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS goals (
+        id SERIAL PRIMARY KEY,
+        track_id INTEGER NOT NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        target_value INTEGER DEFAULT 1,
+        current_value INTEGER DEFAULT 0,
+        unit VARCHAR(50) DEFAULT 'times',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (track_id) REFERENCES tracks (id) ON DELETE CASCADE
+    )
+'''
+
+POSTGRES_TASKS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id SERIAL PRIMARY KEY,
+        goal_id INTEGER NOT NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        completed BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (goal_id) REFERENCES goals (id) ON DELETE CASCADE
+    )
+'''
+
+SQLITE_USERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+SQLITE_TRACKS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS tracks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        color TEXT DEFAULT '#3B82F6',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+'''
+
+SQLITE_GOALS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS goals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        track_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        target_value INTEGER DEFAULT 1,
+        current_value INTEGER DEFAULT 0,
+        unit TEXT DEFAULT 'times',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (track_id) REFERENCES tracks (id)
+    )
+'''
+
+SQLITE_TASKS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        goal_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        completed BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (goal_id) REFERENCES goals (id)
+    )
+'''
+
+FOREIGN_KEY_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_tracks_user_created ON tracks (user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_goals_track_created ON goals (track_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_goal_created ON tasks (goal_id, created_at)'
+]
+
+KEYSET_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_goals_track_created_id ON goals (track_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_goal_created_id ON tasks (goal_id, created_at, id)',
+    'DROP INDEX IF EXISTS idx_goals_track_created',
+    'DROP INDEX IF EXISTS idx_tasks_goal_created'
+]
+
+# Progress rollups: goals carry task counters and tracks carry goal and task
+# counters. Triggers keep them current inside the transaction of every write,
+# whether it comes from the item routes, /api/batch or a bulk import.
+ROLLUP_COLUMNS = [
+    'ALTER TABLE goals ADD COLUMN task_count INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE goals ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE tracks ADD COLUMN goal_count INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE tracks ADD COLUMN task_count INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE tracks ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0'
+]
+
+# Source-of-truth expression for every counter, used to backfill, check and repair
+ROLLUP_EXPRESSIONS = {
+    'goals': {
+        'task_count': 'SELECT COUNT(*) FROM tasks WHERE tasks.goal_id = goals.id',
+        'completed_count': 'SELECT COUNT(*) FROM tasks WHERE tasks.goal_id = goals.id AND tasks.completed',
+    },
+    'tracks': {
+        'goal_count': 'SELECT COUNT(*) FROM goals WHERE goals.track_id = tracks.id',
+        'task_count': 'SELECT COUNT(*) FROM tasks JOIN goals ON tasks.goal_id = goals.id WHERE goals.track_id = tracks.id',
+        'completed_count': 'SELECT COUNT(*) FROM tasks JOIN goals ON tasks.goal_id = goals.id WHERE goals.track_id = tracks.id AND tasks.completed',
+    },
+}
+
+def rollup_drift_condition(table, expressions=ROLLUP_EXPRESSIONS):
+    return ' OR '.join(f'{column} <> ({expression})' for column, expression in expressions[table].items())
+
+def rollup_rebuild_statements(expressions):
+    """Only rows that drifted are rewritten"""
+    return [
+        f"UPDATE {table} SET {', '.join(f'{column} = ({expression})' for column, expression in columns.items())} WHERE {rollup_drift_condition(table, expressions)}"
+        for table, columns in expressions.items()
+    ]
+
+ROLLUP_REBUILD = rollup_rebuild_statements(ROLLUP_EXPRESSIONS)
+
+SQLITE_COMPLETED = 'CASE WHEN {row}.completed THEN 1 ELSE 0 END'
+SQLITE_ROLLUP_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_rollup_insert AFTER INSERT ON tasks
+    BEGIN
+        UPDATE goals SET task_count = task_count + 1, completed_count = completed_count + ({SQLITE_COMPLETED.format(row='NEW')}) WHERE id = NEW.goal_id;
+        UPDATE tracks SET task_count = task_count + 1, completed_count = completed_count + ({SQLITE_COMPLETED.format(row='NEW')})
+        WHERE id = (SELECT track_id FROM goals WHERE id = NEW.goal_id);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_rollup_delete AFTER DELETE ON tasks
+    BEGIN
+        UPDATE goals SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')}) WHERE id = OLD.goal_id;
+        UPDATE tracks SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')})
+        WHERE id = (SELECT track_id FROM goals WHERE id = OLD.goal_id);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_rollup_complete AFTER UPDATE OF completed ON tasks
+    WHEN OLD.goal_id = NEW.goal_id AND ({SQLITE_COMPLETED.format(row='OLD')}) <> ({SQLITE_COMPLETED.format(row='NEW')})
+    BEGIN
+        UPDATE goals SET completed_count = completed_count + (CASE WHEN NEW.completed THEN 1 ELSE -1 END) WHERE id = NEW.goal_id;
+        UPDATE tracks SET completed_count = completed_count + (CASE WHEN NEW.completed THEN 1 ELSE -1 END)
+        WHERE id = (SELECT track_id FROM goals WHERE id = NEW.goal_id);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_rollup_move AFTER UPDATE OF goal_id ON tasks
+    WHEN OLD.goal_id IS NOT NEW.goal_id
+    BEGIN
+        UPDATE goals SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')}) WHERE id = OLD.goal_id;
+        UPDATE tracks SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')})
+        WHERE id = (SELECT track_id FROM goals WHERE id = OLD.goal_id);
+        UPDATE goals SET task_count = task_count + 1, completed_count = completed_count + ({SQLITE_COMPLETED.format(row='NEW')}) WHERE id = NEW.goal_id;
+        UPDATE tracks SET task_count = task_count + 1, completed_count = completed_count + ({SQLITE_COMPLETED.format(row='NEW')})
+        WHERE id = (SELECT track_id FROM goals WHERE id = NEW.goal_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS goals_rollup_insert AFTER INSERT ON goals
+    BEGIN
+        UPDATE tracks SET goal_count = goal_count + 1, task_count = task_count + NEW.task_count, completed_count = completed_count + NEW.completed_count
+        WHERE id = NEW.track_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS goals_rollup_delete AFTER DELETE ON goals
+    BEGIN
+        UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+        WHERE id = OLD.track_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS goals_rollup_move AFTER UPDATE OF track_id ON goals
+    WHEN OLD.track_id IS NOT NEW.track_id
+    BEGIN
+        UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+        WHERE id = OLD.track_id;
+        UPDATE tracks SET goal_count = goal_count + 1, task_count = task_count + NEW.task_count, completed_count = completed_count + NEW.completed_count
+        WHERE id = NEW.track_id;
+    END
+    '''
+]
+
+POSTGRES_ROLLUP_TRIGGERS = [
+    '''
+    CREATE OR REPLACE FUNCTION tasks_rollup() RETURNS trigger AS $$
+    DECLARE
+        parent INTEGER;
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.goal_id = NEW.goal_id THEN
+            UPDATE goals SET completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = NEW.goal_id RETURNING track_id INTO parent;
+            UPDATE tracks SET completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = parent;
+            RETURN NULL;
+        END IF;
+        -- A goal deleted by cascade is already gone here; its own trigger settles the track
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE goals SET task_count = task_count - 1, completed_count = completed_count - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = OLD.goal_id RETURNING track_id INTO parent;
+            UPDATE tracks SET task_count = task_count - 1, completed_count = completed_count - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = parent;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE goals SET task_count = task_count + 1, completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int
+            WHERE id = NEW.goal_id RETURNING track_id INTO parent;
+            UPDATE tracks SET task_count = task_count + 1, completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int
+            WHERE id = parent;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION goals_rollup() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+            WHERE id = OLD.track_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE tracks SET goal_count = goal_count + 1, task_count = task_count + NEW.task_count, completed_count = completed_count + NEW.completed_count
+            WHERE id = NEW.track_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS tasks_rollup ON tasks',
+    'CREATE TRIGGER tasks_rollup AFTER INSERT OR DELETE ON tasks FOR EACH ROW EXECUTE FUNCTION tasks_rollup()',
+    'DROP TRIGGER IF EXISTS tasks_rollup_update ON tasks',
+    '''
+    CREATE TRIGGER tasks_rollup_update AFTER UPDATE OF goal_id, completed ON tasks FOR EACH ROW
+    WHEN (OLD.goal_id IS DISTINCT FROM NEW.goal_id OR OLD.completed IS DISTINCT FROM NEW.completed)
+    EXECUTE FUNCTION tasks_rollup()
+    ''',
+    'DROP TRIGGER IF EXISTS goals_rollup ON goals',
+    'CREATE TRIGGER goals_rollup AFTER INSERT OR DELETE ON goals FOR EACH ROW EXECUTE FUNCTION goals_rollup()',
+    'DROP TRIGGER IF EXISTS goals_rollup_move ON goals',
+    '''
+    CREATE TRIGGER goals_rollup_move AFTER UPDATE OF track_id ON goals FOR EACH ROW
+    WHEN (OLD.track_id IS DISTINCT FROM NEW.track_id)
+    EXECUTE FUNCTION goals_rollup()
+    '''
+]
+
+# Full-text search. SQLite keeps one FTS5 table per entity, rowid = entity id,
+# with an ``owner`` column holding a 'u<user_id>' token so a search only walks
+# the posting lists of one user. Owners never change: goals cannot move between
+# tracks and tasks only move between goals of the same user. PostgreSQL needs
+# no copy of the text, just a GIN index on the same weighted tsvector expression
+# the search query uses.
+SEARCH_SOURCES = {
+    # table: (title column, owner token of NEW, FROM clause joining each row to its owner)
+    'tracks': ('name', "'u' || NEW.user_id", 'tracks'),
+    'goals': ('title', "(SELECT 'u' || user_id FROM tracks WHERE id = NEW.track_id)",
+              'goals JOIN tracks ON tracks.id = goals.track_id'),
+    'tasks': ('title', "(SELECT 'u' || tracks.user_id FROM goals JOIN tracks ON tracks.id = goals.track_id WHERE goals.id = NEW.goal_id)",
+              'tasks JOIN goals ON goals.id = tasks.goal_id JOIN tracks ON tracks.id = goals.track_id')
+}
+
+def sqlite_search_triggers(table):
+    """Triggers keeping one table's FTS5 copy in sync"""
+    title, owner, _ = SEARCH_SOURCES[table]
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {table}_fts (rowid, owner, title, body) VALUES (NEW.id, {owner}, NEW.{title}, NEW.description);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {title}, description ON {table}
+        BEGIN
+            UPDATE {table}_fts SET title = NEW.{title}, body = NEW.description WHERE rowid = NEW.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM {table}_fts WHERE rowid = OLD.id;
+        END
         '''
-        
-        tasks_table = '''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                goal_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                completed BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (goal_id) REFERENCES goals (id)
-            )
+    ]
+
+def sqlite_search_statements(table):
+    """FTS5 table, sync triggers and backfill for one searchable table"""
+    title, _, joined = SEARCH_SOURCES[table]
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(owner, title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        *sqlite_search_triggers(table),
+        f"INSERT INTO {table}_fts (rowid, owner, title, body) SELECT {table}.id, 'u' || tracks.user_id, {table}.{title}, {table}.description FROM {joined}"
+    ]
+
+SQLITE_SEARCH_INDEX = [statement for table in SEARCH_SOURCES for statement in sqlite_search_statements(table)]
+
+def search_document(table, alias=None):
+    """Weighted tsvector of a row: title (A) and description (B)"""
+    prefix = f'{alias}.' if alias else ''
+    title = SEARCH_SOURCES[table][0]
+    return (f"(setweight(to_tsvector('simple', coalesce({prefix}{title}, '')), 'A') || "
+            f"setweight(to_tsvector('simple', coalesce({prefix}description, '')), 'B'))")
+
+POSTGRES_SEARCH_INDEX = [
+    f'CREATE INDEX IF NOT EXISTS idx_{table}_search ON {table} USING GIN ({search_document(table)})'
+    for table in SEARCH_SOURCES
+]
+
+# Change feed. change_log holds one row per track, goal and task, live or
+# deleted (a tombstone), stamped with the owner's data_version at the time of
+# the write. Writers bump data_version first, so the row lock on users orders a
+# user's transactions and versions become visible in order; /api/changes is a
+# keyset range scan over (user_id, version). Triggers keep it current for every
+# write path. Deletes reuse the owner stored in change_log because cascaded
+# children can no longer reach their track.
+CHANGE_ENTITIES = {'tracks': 'track', 'goals': 'goal', 'tasks': 'task'}
+CHANGE_OWNERS = {
+    'tracks': 'NEW.user_id',
+    'goals': '(SELECT user_id FROM tracks WHERE id = NEW.track_id)',
+    'tasks': '(SELECT tracks.user_id FROM goals JOIN tracks ON tracks.id = goals.track_id WHERE goals.id = NEW.goal_id)'
+}
+# Without foreign key enforcement (SQLITE_TUNED=false) deleting a parent leaves
+# its children behind, so the parent's trigger tombstones them too
+SQLITE_CHANGE_CHILDREN = {
+    'tracks': "(entity = 'goal' AND entity_id IN (SELECT id FROM goals WHERE track_id = OLD.id)) OR "
+              "(entity = 'task' AND entity_id IN (SELECT tasks.id FROM tasks JOIN goals ON goals.id = tasks.goal_id WHERE goals.track_id = OLD.id))",
+    'goals': "(entity = 'task' AND entity_id IN (SELECT id FROM tasks WHERE goal_id = OLD.id))",
+    'tasks': None
+}
+
+CHANGE_LOG_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        entity VARCHAR(8) NOT NULL,
+        entity_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (entity, entity_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_change_log_user_version ON change_log (user_id, version, entity, entity_id)'
+]
+
+CHANGE_LOG_BACKFILL = [
+    """INSERT INTO change_log (entity, entity_id, user_id, version, updated_at)
+       SELECT 'track', tracks.id, tracks.user_id, users.data_version, COALESCE(tracks.created_at, CURRENT_TIMESTAMP)
+       FROM tracks JOIN users ON users.id = tracks.user_id""",
+    """INSERT INTO change_log (entity, entity_id, user_id, version, updated_at)
+       SELECT 'goal', goals.id, tracks.user_id, users.data_version, COALESCE(goals.created_at, CURRENT_TIMESTAMP)
+       FROM goals JOIN tracks ON tracks.id = goals.track_id JOIN users ON users.id = tracks.user_id""",
+    """INSERT INTO change_log (entity, entity_id, user_id, version, updated_at)
+       SELECT 'task', tasks.id, tracks.user_id, users.data_version, COALESCE(tasks.created_at, CURRENT_TIMESTAMP)
+       FROM tasks JOIN goals ON goals.id = tasks.goal_id JOIN tracks ON tracks.id = goals.track_id JOIN users ON users.id = tracks.user_id"""
+]
+
+def sqlite_change_upsert(table):
+    """Trigger statement recording a live row of one table in change_log"""
+    return f'''
+            INSERT INTO change_log (entity, entity_id, user_id, version, deleted, updated_at)
+            SELECT '{CHANGE_ENTITIES[table]}', NEW.id, id, data_version, FALSE, CURRENT_TIMESTAMP FROM users WHERE id = {CHANGE_OWNERS[table]}
+            ON CONFLICT (entity, entity_id) DO UPDATE SET version = excluded.version, deleted = FALSE, updated_at = excluded.updated_at;'''
+
+def sqlite_change_tombstone(table):
+    """change_log condition matching a deleted row of one table and its children"""
+    tombstone = f"(entity = '{CHANGE_ENTITIES[table]}' AND entity_id = OLD.id)"
+    if SQLITE_CHANGE_CHILDREN[table]:
+        tombstone += f' OR {SQLITE_CHANGE_CHILDREN[table]}'
+    return tombstone
+
+def sqlite_change_triggers(table):
+    """Triggers recording inserts, updates and deletes of one table in change_log"""
+    upsert = sqlite_change_upsert(table)
+    tombstone = sqlite_change_tombstone(table)
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_change_insert AFTER INSERT ON {table}
+        BEGIN{upsert}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_change_update AFTER UPDATE ON {table}
+        BEGIN{upsert}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_change_delete AFTER DELETE ON {table}
+        BEGIN
+            UPDATE change_log SET deleted = TRUE, updated_at = CURRENT_TIMESTAMP,
+                version = (SELECT data_version FROM users WHERE users.id = change_log.user_id)
+            WHERE {tombstone};
+        END
         '''
+    ]
+
+SQLITE_CHANGE_LOG = CHANGE_LOG_TABLES + [statement for table in CHANGE_ENTITIES for statement in sqlite_change_triggers(table)]
+
+def postgres_log_change(keep_tombstones=False):
+    """log_change() trigger function; keep_tombstones leaves rows that are already tombstones alone"""
+    return f'''
+    CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$
+    DECLARE
+        kind VARCHAR(8) := CASE TG_TABLE_NAME WHEN 'tracks' THEN 'track' WHEN 'goals' THEN 'goal' ELSE 'task' END;
+        owner INTEGER;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            UPDATE change_log SET deleted = TRUE, updated_at = CURRENT_TIMESTAMP, version = users.data_version
+            FROM users
+            WHERE change_log.entity = kind AND change_log.entity_id = OLD.id AND users.id = change_log.user_id{' AND NOT change_log.deleted' if keep_tombstones else ''}
+            RETURNING change_log.user_id INTO owner;
+        ELSE
+            IF TG_TABLE_NAME = 'tracks' THEN
+                owner := {CHANGE_OWNERS['tracks']};
+            ELSIF TG_TABLE_NAME = 'goals' THEN
+                owner := {CHANGE_OWNERS['goals']};
+            ELSE
+                owner := {CHANGE_OWNERS['tasks']};
+            END IF;
+            INSERT INTO change_log (entity, entity_id, user_id, version, deleted, updated_at)
+            SELECT kind, NEW.id, id, data_version, FALSE, CURRENT_TIMESTAMP FROM users WHERE id = owner
+            ON CONFLICT (entity, entity_id) DO UPDATE SET version = EXCLUDED.version, deleted = FALSE, updated_at = EXCLUDED.updated_at;
+        END IF;
+        -- Delivered on commit, once per user and transaction; wakes long-polls in every worker
+        IF owner IS NOT NULL THEN
+            PERFORM pg_notify('data_changes', owner::text);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    '''
+
+POSTGRES_CHANGE_LOG = CHANGE_LOG_TABLES + [postgres_log_change()] + [
+    statement
+    for table in CHANGE_ENTITIES
+    for statement in (
+        f'DROP TRIGGER IF EXISTS {table}_change ON {table}',
+        f'CREATE TRIGGER {table}_change AFTER INSERT OR DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION log_change()',
+        f'DROP TRIGGER IF EXISTS {table}_change_update ON {table}',
+        f'CREATE TRIGGER {table}_change_update AFTER UPDATE ON {table} FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION log_change()'
+    )
+]
+
+# Row versions for optimistic concurrency: every PUT or PATCH increments the
+# row's version, and an If-Match on it turns a lost update into a 412. Rollup
+# counters are written by triggers that leave version alone, so completing a
+# task never conflicts with an edit of its goal.
+ROW_VERSION_COLUMNS = [
+    f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'
+    for table in ('tracks', 'goals', 'tasks')
+]
+
+# SQLite can only change a foreign key by rebuilding the table: copy it into a
+# table declared with ON DELETE CASCADE (same columns, in the order migrations
+# 1, 6 and 9 left them), swap that in and recreate the indexes and triggers the
+# old table took with it. Rows orphaned by deletes without enforcement go
+# first, through the triggers, so counters, search and change log follow.
+# migrate_db runs with foreign keys off, as a rebuild requires.
+SQLITE_CASCADE_TABLES = {
+    'tasks': (
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('goal_id', 'INTEGER NOT NULL REFERENCES goals (id) ON DELETE CASCADE'),
+        ('title', 'TEXT NOT NULL'),
+        ('description', 'TEXT'),
+        ('completed', 'BOOLEAN DEFAULT FALSE'),
+        ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('version', 'INTEGER NOT NULL DEFAULT 1')
+    ),
+    'goals': (
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('track_id', 'INTEGER NOT NULL REFERENCES tracks (id) ON DELETE CASCADE'),
+        ('title', 'TEXT NOT NULL'),
+        ('description', 'TEXT'),
+        ('target_value', 'INTEGER DEFAULT 1'),
+        ('current_value', 'INTEGER DEFAULT 0'),
+        ('unit', "TEXT DEFAULT 'times'"),
+        ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('task_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('completed_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('version', 'INTEGER NOT NULL DEFAULT 1')
+    ),
+    'tracks': (
+        ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        ('user_id', 'INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE'),
+        ('name', 'TEXT NOT NULL'),
+        ('description', 'TEXT'),
+        ('color', "TEXT DEFAULT '#3B82F6'"),
+        ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('goal_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('task_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('completed_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('version', 'INTEGER NOT NULL DEFAULT 1')
+    )
+}
+
+def sqlite_rebuild_statements(table):
+    """Swap a table for a copy declared with SQLITE_CASCADE_TABLES, keeping its AUTOINCREMENT position"""
+    columns = SQLITE_CASCADE_TABLES[table]
+    definitions = ',\n            '.join(f'{name} {definition}' for name, definition in columns)
+    names = ', '.join(name for name, _ in columns)
+    return [
+        f'''
+        CREATE TABLE {table}_rebuild (
+            {definitions}
+        )
+        ''',
+        f'INSERT INTO {table}_rebuild ({names}) SELECT {names} FROM {table}',
+        f"DELETE FROM sqlite_sequence WHERE name = '{table}_rebuild'",
+        f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}_rebuild', seq FROM sqlite_sequence WHERE name = '{table}'",
+        f'DROP TABLE {table}',
+        f'ALTER TABLE {table}_rebuild RENAME TO {table}'
+    ]
+
+SQLITE_CASCADE_REBUILD = [
+    'DELETE FROM tracks WHERE user_id NOT IN (SELECT id FROM users)',
+    'DELETE FROM goals WHERE track_id NOT IN (SELECT id FROM tracks)',
+    'DELETE FROM tasks WHERE goal_id NOT IN (SELECT id FROM goals)',
+    # Triggers on the other tables name the table being swapped out; without
+    # legacy renames SQLite rejects the rename while that table is missing
+    'PRAGMA legacy_alter_table = ON',
+    *(statement for table in SQLITE_CASCADE_TABLES for statement in sqlite_rebuild_statements(table)),
+    'PRAGMA legacy_alter_table = OFF',
+    *FOREIGN_KEY_INDEXES,
+    *KEYSET_INDEXES,
+    *SQLITE_ROLLUP_TRIGGERS,
+    *(statement for table in SEARCH_SOURCES for statement in sqlite_search_triggers(table)),
+    *(statement for table in CHANGE_ENTITIES for statement in sqlite_change_triggers(table))
+]
+
+# Recurring goals (see reset_due_goals): the period and when it next ends, in
+# UTC. Only recurring goals are indexed, and only they are ever due.
+RECURRENCE_COLUMNS = [
+    'ALTER TABLE goals ADD COLUMN recurrence VARCHAR(10)',
+    'ALTER TABLE goals ADD COLUMN next_reset_at TIMESTAMP',
+    'CREATE INDEX IF NOT EXISTS idx_goals_next_reset_at ON goals (next_reset_at) WHERE next_reset_at IS NOT NULL'
+]
+
+# Completion history (see Stats). completion_events gets one row per task per
+# UTC day it was checked, appended by a trigger when completed goes from false
+# to true, so every write path records it and unchecking a task or a recurring
+# reset never rewrites history. Rows are clustered on (user, goal, day) for
+# per-goal range scans. completion_days is the daily rollup per track that
+# weekly counts, heatmaps and overall streaks read; it only grows when an
+# event is actually appended, so checking a task twice in a day counts once.
+SQLITE_COMPLETION_HISTORY = [
+    '''
+    CREATE TABLE IF NOT EXISTS completion_events (
+        user_id INTEGER NOT NULL,
+        goal_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        task_id INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, goal_id, day, task_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS completion_days (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        track_id INTEGER NOT NULL,
+        completions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, track_id)
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_completion_event AFTER UPDATE OF completed ON tasks
+    WHEN ({SQLITE_COMPLETED.format(row='NEW')}) = 1 AND ({SQLITE_COMPLETED.format(row='OLD')}) = 0
+    BEGIN
+        INSERT OR IGNORE INTO completion_events (user_id, goal_id, day, task_id, track_id)
+        SELECT t.user_id, g.id, date('now'), NEW.id, t.id FROM goals g JOIN tracks t ON g.track_id = t.id WHERE g.id = NEW.goal_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS completion_events_daily AFTER INSERT ON completion_events
+    BEGIN
+        INSERT OR IGNORE INTO completion_days (user_id, day, track_id) VALUES (NEW.user_id, NEW.day, NEW.track_id);
+        UPDATE completion_days SET completions = completions + 1 WHERE user_id = NEW.user_id AND day = NEW.day AND track_id = NEW.track_id;
+    END
+    '''
+]
+
+POSTGRES_COMPLETION_HISTORY = [
+    '''
+    CREATE TABLE IF NOT EXISTS completion_events (
+        user_id INTEGER NOT NULL,
+        goal_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        task_id INTEGER NOT NULL,
+        track_id INTEGER NOT NULL,
+        completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, goal_id, day, task_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS completion_days (
+        user_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        track_id INTEGER NOT NULL,
+        completions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, track_id)
+    )
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION record_completion() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO completion_events (user_id, goal_id, day, task_id, track_id)
+        SELECT t.user_id, g.id, (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::date, NEW.id, t.id
+        FROM goals g JOIN tracks t ON g.track_id = t.id WHERE g.id = NEW.goal_id
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION count_completion() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO completion_days (user_id, day, track_id, completions) VALUES (NEW.user_id, NEW.day, NEW.track_id, 1)
+        ON CONFLICT (user_id, day, track_id) DO UPDATE SET completions = completion_days.completions + 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS tasks_completion_event ON tasks',
+    '''
+    CREATE TRIGGER tasks_completion_event AFTER UPDATE OF completed ON tasks FOR EACH ROW
+    WHEN (NEW.completed AND NOT COALESCE(OLD.completed, FALSE))
+    EXECUTE FUNCTION record_completion()
+    ''',
+    'DROP TRIGGER IF EXISTS completion_events_daily ON completion_events',
+    'CREATE TRIGGER completion_events_daily AFTER INSERT ON completion_events FOR EACH ROW EXECUTE FUNCTION count_completion()'
+]
+
+# When each user last wrote. Read-your-writes routing keeps users who wrote
+# recently on the primary, and the newest value doubles as a replication
+# heartbeat: a replica's lag is how far its newest value trails the primary's.
+WRITTEN_AT_COLUMN = [
+    'ALTER TABLE users ADD COLUMN written_at TIMESTAMP',
+    'CREATE INDEX IF NOT EXISTS idx_users_written_at ON users (written_at)'
+]
+
+# Deferred deletes: deleting a track or goal only stamps deleted_at, which
+# every read and ownership check filters on, so the request writes one row
+# however much sits below it. The purger (see Purge) removes the rows later,
+# children first, in bounded chunks. What the delete triggers did at the time
+# of deletion now happens when the row is marked: the goal's counters leave its
+# track, and the row and everything below it become tombstones in change_log.
+# Purging a marked row or its children counts and tombstones nothing again.
+SOFT_DELETE_TABLES = ('tracks', 'goals')
+SOFT_DELETE_COLUMNS = [
+    statement
+    for table in SOFT_DELETE_TABLES
+    for statement in (
+        f'ALTER TABLE {table} ADD COLUMN deleted_at TIMESTAMP',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_deleted_at ON {table} (deleted_at) WHERE deleted_at IS NOT NULL'
+    )
+]
+
+# Counter expressions once goals marked deleted no longer count towards their track
+LIVE_ROLLUP_EXPRESSIONS = {
+    'goals': ROLLUP_EXPRESSIONS['goals'],
+    'tracks': {column: f'{expression} AND goals.deleted_at IS NULL' for column, expression in ROLLUP_EXPRESSIONS['tracks'].items()}
+}
+
+# Rows below a marked track or goal, tombstoned along with it
+CHANGE_DESCENDANTS = {
+    'tracks': {
+        'goal': 'SELECT id FROM goals WHERE track_id = OLD.id',
+        'task': 'SELECT tasks.id FROM tasks JOIN goals ON goals.id = tasks.goal_id WHERE goals.track_id = OLD.id'
+    },
+    'goals': {'task': 'SELECT id FROM tasks WHERE goal_id = OLD.id'}
+}
+
+def change_log_mark_deleted(table):
+    """Trigger statements tombstoning a marked track or goal and the rows below it (one per entity, so each is a key lookup)"""
+    entities = {CHANGE_ENTITIES[table]: 'OLD.id', **CHANGE_DESCENDANTS[table]}
+    return ''.join(f'''
+            UPDATE change_log SET deleted = TRUE, updated_at = CURRENT_TIMESTAMP,
+                version = (SELECT data_version FROM users WHERE users.id = change_log.user_id)
+            WHERE entity = '{entity}' AND entity_id IN ({ids}) AND NOT deleted;''' for entity, ids in entities.items())
+
+MARKED_DELETED = 'OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL'
+
+SQLITE_SOFT_DELETE_TRIGGERS = [
+    'DROP TRIGGER IF EXISTS tasks_rollup_delete',
+    f'''
+    CREATE TRIGGER tasks_rollup_delete AFTER DELETE ON tasks
+    BEGIN
+        UPDATE goals SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')}) WHERE id = OLD.goal_id;
+        UPDATE tracks SET task_count = task_count - 1, completed_count = completed_count - ({SQLITE_COMPLETED.format(row='OLD')})
+        WHERE id = (SELECT track_id FROM goals WHERE id = OLD.goal_id AND deleted_at IS NULL);
+    END
+    ''',
+    'DROP TRIGGER IF EXISTS goals_rollup_delete',
+    '''
+    CREATE TRIGGER goals_rollup_delete AFTER DELETE ON goals
+    WHEN OLD.deleted_at IS NULL
+    BEGIN
+        UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+        WHERE id = OLD.track_id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS goals_rollup_mark_deleted AFTER UPDATE OF deleted_at ON goals
+    WHEN {MARKED_DELETED}
+    BEGIN
+        UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+        WHERE id = OLD.track_id;
+    END
+    ''',
+    *(
+        statement
+        for table in CHANGE_ENTITIES
+        for statement in (
+            f'DROP TRIGGER IF EXISTS {table}_change_delete',
+            f'''
+            CREATE TRIGGER {table}_change_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE change_log SET deleted = TRUE, updated_at = CURRENT_TIMESTAMP,
+                    version = (SELECT data_version FROM users WHERE users.id = change_log.user_id)
+                WHERE ({sqlite_change_tombstone(table)}) AND NOT deleted;
+            END
+            '''
+        )
+    ),
+    *(
+        statement
+        for table in SOFT_DELETE_TABLES
+        for statement in (
+            f'DROP TRIGGER IF EXISTS {table}_change_update',
+            f'''
+            CREATE TRIGGER {table}_change_update AFTER UPDATE ON {table}
+            WHEN NEW.deleted_at IS NULL
+            BEGIN{sqlite_change_upsert(table)}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_mark_deleted AFTER UPDATE OF deleted_at ON {table}
+            WHEN {MARKED_DELETED}
+            BEGIN{change_log_mark_deleted(table)}
+            END
+            '''
+        )
+    )
+]
+
+POSTGRES_SOFT_DELETE_TRIGGERS = [
+    '''
+    CREATE OR REPLACE FUNCTION tasks_rollup() RETURNS trigger AS $$
+    DECLARE
+        parent INTEGER;
+    BEGIN
+        -- parent stays NULL under a goal marked deleted: it already left its track's counters
+        IF TG_OP = 'UPDATE' AND OLD.goal_id = NEW.goal_id THEN
+            UPDATE goals SET completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = NEW.goal_id RETURNING CASE WHEN deleted_at IS NULL THEN track_id END INTO parent;
+            UPDATE tracks SET completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = parent;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE goals SET task_count = task_count - 1, completed_count = completed_count - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = OLD.goal_id RETURNING CASE WHEN deleted_at IS NULL THEN track_id END INTO parent;
+            UPDATE tracks SET task_count = task_count - 1, completed_count = completed_count - COALESCE(OLD.completed, FALSE)::int
+            WHERE id = parent;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE goals SET task_count = task_count + 1, completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int
+            WHERE id = NEW.goal_id RETURNING CASE WHEN deleted_at IS NULL THEN track_id END INTO parent;
+            UPDATE tracks SET task_count = task_count + 1, completed_count = completed_count + COALESCE(NEW.completed, FALSE)::int
+            WHERE id = parent;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION goals_rollup() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' AND OLD.deleted_at IS NOT NULL THEN
+            RETURN NULL;  -- Settled when the goal was marked deleted
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tracks SET goal_count = goal_count - 1, task_count = task_count - OLD.task_count, completed_count = completed_count - OLD.completed_count
+            WHERE id = OLD.track_id;
+        END IF;
+        IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.deleted_at IS NULL) THEN
+            UPDATE tracks SET goal_count = goal_count + 1, task_count = task_count + NEW.task_count, completed_count = completed_count + NEW.completed_count
+            WHERE id = NEW.track_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS goals_rollup_mark_deleted ON goals',
+    f'CREATE TRIGGER goals_rollup_mark_deleted AFTER UPDATE OF deleted_at ON goals FOR EACH ROW WHEN ({MARKED_DELETED}) EXECUTE FUNCTION goals_rollup()',
+    postgres_log_change(keep_tombstones=True),
+    f'''
+    CREATE OR REPLACE FUNCTION log_mark_deleted() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'tracks' THEN{change_log_mark_deleted('tracks')}
+            PERFORM pg_notify('data_changes', ({CHANGE_OWNERS['tracks']})::text);
+        ELSE{change_log_mark_deleted('goals')}
+            PERFORM pg_notify('data_changes', ({CHANGE_OWNERS['goals']})::text);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    *(
+        statement
+        for table in SOFT_DELETE_TABLES
+        for statement in (
+            f'DROP TRIGGER IF EXISTS {table}_change_update ON {table}',
+            f'CREATE TRIGGER {table}_change_update AFTER UPDATE ON {table} FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.* AND NEW.deleted_at IS NULL) EXECUTE FUNCTION log_change()',
+            f'DROP TRIGGER IF EXISTS {table}_change_mark_deleted ON {table}',
+            f'CREATE TRIGGER {table}_change_mark_deleted AFTER UPDATE OF deleted_at ON {table} FOR EACH ROW WHEN ({MARKED_DELETED}) EXECUTE FUNCTION log_mark_deleted()'
+        )
+    )
+]
+
+# A task inserted already completed (created that way, or imported) is a
+# completion on the day it was inserted, like one checked by an update
+SQLITE_COMPLETION_ON_INSERT = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_completion_insert AFTER INSERT ON tasks
+    WHEN ({SQLITE_COMPLETED.format(row='NEW')}) = 1
+    BEGIN
+        INSERT OR IGNORE INTO completion_events (user_id, goal_id, day, task_id, track_id)
+        SELECT t.user_id, g.id, date('now'), NEW.id, t.id FROM goals g JOIN tracks t ON g.track_id = t.id WHERE g.id = NEW.goal_id;
+    END
+    '''
+]
+
+POSTGRES_COMPLETION_ON_INSERT = [
+    'DROP TRIGGER IF EXISTS tasks_completion_insert ON tasks',
+    '''
+    CREATE TRIGGER tasks_completion_insert AFTER INSERT ON tasks FOR EACH ROW
+    WHEN (NEW.completed)
+    EXECUTE FUNCTION record_completion()
+    '''
+]
+
+# Deleting a goal takes its completions out of its tracks' daily counts when
+# it is marked, as deleting a track does through the live-track filter (see
+# Stats); the events themselves go when the purger removes the goal
+GOAL_COMPLETIONS = '(SELECT day, track_id FROM completion_events WHERE user_id = {owner} AND goal_id = NEW.id)'
+
+SQLITE_GOAL_COMPLETIONS_MARK_DELETED = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS goals_completion_mark_deleted AFTER UPDATE OF deleted_at ON goals
+    WHEN {MARKED_DELETED}
+    BEGIN
+        UPDATE completion_days SET completions = completions - (
+            SELECT COUNT(*) FROM completion_events e
+            WHERE e.user_id = completion_days.user_id AND e.goal_id = NEW.id
+                AND e.day = completion_days.day AND e.track_id = completion_days.track_id
+        )
+        WHERE user_id = (SELECT user_id FROM tracks WHERE id = NEW.track_id)
+            AND (day, track_id) IN {GOAL_COMPLETIONS.format(owner='(SELECT user_id FROM tracks WHERE id = NEW.track_id)')};
+        DELETE FROM completion_days
+        WHERE user_id = (SELECT user_id FROM tracks WHERE id = NEW.track_id) AND completions <= 0
+            AND (day, track_id) IN {GOAL_COMPLETIONS.format(owner='(SELECT user_id FROM tracks WHERE id = NEW.track_id)')};
+    END
+    '''
+]
+
+POSTGRES_GOAL_COMPLETIONS_MARK_DELETED = [
+    f'''
+    CREATE OR REPLACE FUNCTION uncount_goal_completions() RETURNS trigger AS $$
+    DECLARE
+        owner INTEGER;
+    BEGIN
+        SELECT user_id INTO owner FROM tracks WHERE id = NEW.track_id;
+        UPDATE completion_days d SET completions = d.completions - e.completions
+        FROM (SELECT day, track_id, COUNT(*) AS completions FROM completion_events
+              WHERE user_id = owner AND goal_id = NEW.id GROUP BY day, track_id) e
+        WHERE d.user_id = owner AND d.day = e.day AND d.track_id = e.track_id;
+        DELETE FROM completion_days WHERE user_id = owner AND completions <= 0
+            AND (day, track_id) IN {GOAL_COMPLETIONS.format(owner='owner')};
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS goals_completion_mark_deleted ON goals',
+    f'CREATE TRIGGER goals_completion_mark_deleted AFTER UPDATE OF deleted_at ON goals FOR EACH ROW WHEN ({MARKED_DELETED}) EXECUTE FUNCTION uncount_goal_completions()'
+]
+
+# Ordered (version, description, SQLite statements, PostgreSQL statements).
+# Append new migrations to the end; never edit one that has been released.
+MIGRATIONS = [
+    (1, 'Create users, tracks, goals and tasks tables',
+     [SQLITE_USERS_TABLE, SQLITE_TRACKS_TABLE, SQLITE_GOALS_TABLE, SQLITE_TASKS_TABLE],
+     [POSTGRES_USERS_TABLE, POSTGRES_TRACKS_TABLE, POSTGRES_GOALS_TABLE, POSTGRES_TASKS_TABLE]),
+    (2, 'Index foreign keys used by ownership joins and created_at ordering',
+     FOREIGN_KEY_INDEXES,
+     FOREIGN_KEY_INDEXES),
+    (3, 'Extend goal and task listing indexes with id for keyset pagination',
+     KEYSET_INDEXES,
+     KEYSET_INDEXES),
+    (4, 'Track a per-user data version for conditional GETs',
+     ['ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'],
+     ['ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0']),
+    (5, 'Add revoked token list',
+     ['CREATE TABLE IF NOT EXISTS revoked_tokens (token_hash TEXT PRIMARY KEY, expires_at INTEGER NOT NULL)'],
+     ['CREATE TABLE IF NOT EXISTS revoked_tokens (token_hash VARCHAR(64) PRIMARY KEY, expires_at BIGINT NOT NULL)']),
+    (6, 'Add trigger-maintained task and goal counters to goals and tracks',
+     ROLLUP_COLUMNS + SQLITE_ROLLUP_TRIGGERS + ROLLUP_REBUILD,
+     ROLLUP_COLUMNS + POSTGRES_ROLLUP_TRIGGERS + ROLLUP_REBUILD),
+    (7, 'Add full-text search indexes over tracks, goals and tasks',
+     SQLITE_SEARCH_INDEX,
+     POSTGRES_SEARCH_INDEX),
+    (8, 'Add change log with tombstones for the delta-sync feed',
+     SQLITE_CHANGE_LOG + CHANGE_LOG_BACKFILL,
+     POSTGRES_CHANGE_LOG + CHANGE_LOG_BACKFILL),
+    (9, 'Add row versions to tracks, goals and tasks for If-Match updates',
+     ROW_VERSION_COLUMNS,
+     ROW_VERSION_COLUMNS),
+    (10, 'Rebuild SQLite tracks, goals and tasks with ON DELETE CASCADE foreign keys',
+     SQLITE_CASCADE_REBUILD,
+     []),
+    (11, 'Add recurrence and next reset time to goals',
+     RECURRENCE_COLUMNS,
+     RECURRENCE_COLUMNS),
+    (12, 'Add append-only task completion history with daily rollups per track',
+     SQLITE_COMPLETION_HISTORY,
+     POSTGRES_COMPLETION_HISTORY),
+    (13, 'Record when each user last wrote, for read-your-writes replica routing',
+     WRITTEN_AT_COLUMN,
+     WRITTEN_AT_COLUMN),
+    (14, 'Mark deleted tracks and goals for the background purger instead of cascading in the request',
+     SOFT_DELETE_COLUMNS + SQLITE_SOFT_DELETE_TRIGGERS,
+     SOFT_DELETE_COLUMNS + POSTGRES_SOFT_DELETE_TRIGGERS),
+    (15, 'Record completion history for tasks inserted already completed',
+     SQLITE_COMPLETION_ON_INSERT,
+     POSTGRES_COMPLETION_ON_INSERT),
+    (16, "Take a deleted goal's completions out of the daily counts",
+     SQLITE_GOAL_COMPLETIONS_MARK_DELETED,
+     POSTGRES_GOAL_COMPLETIONS_MARK_DELETED),
+]
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+SCHEMA_MIGRATIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Advisory lock key that serializes migration runs across processes (PostgreSQL)
+SCHEMA_LOCK_ID = 20250904
+
+def get_schema_version():
+    """Return the highest applied migration version, 0 for an empty database"""
+    table = execute_query(
+        "SELECT to_regclass('schema_migrations') AS name" if IS_POSTGRESQL else "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'",
+        fetch_one=True
+    )
+    if not table or not table['name']:
+        return 0
+    row = execute_query('SELECT MAX(version) AS version FROM schema_migrations', fetch_one=True)
+    return row['version'] or 0
+
+def migrate_db(target_version=None):
+    """Apply pending migrations in order and return the versions applied
+
+    The whole run holds a database-wide lock (an advisory lock on PostgreSQL,
+    a write transaction on SQLite), so concurrent callers wait for each other
+    and find nothing left to do instead of racing to run the same DDL.
+    """
+    applied = []
+    try:
+        with db_session():
+            if IS_POSTGRESQL:
+                execute_query('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_ID,), fetch_one=True)
+            else:
+                # Table rebuilds (migration 10) need enforcement off, and SQLite
+                # only lets it change outside a transaction
+                execute_query('PRAGMA foreign_keys = OFF')
+                execute_query('BEGIN IMMEDIATE')
+            execute_query(SCHEMA_MIGRATIONS_TABLE)
+            current_version = get_schema_version()
+            
+            for version, description, sqlite_statements, postgres_statements in MIGRATIONS:
+                if version <= current_version or (target_version is not None and version > target_version):
+                    continue
+                for statement in postgres_statements if IS_POSTGRESQL else sqlite_statements:
+                    execute_query(statement)
+                execute_query(
+                    'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)' if IS_POSTGRESQL else 'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                    (version, description)
+                )
+                applied.append(version)
+    finally:
+        if not IS_POSTGRESQL and SQLITE_TUNED:
+            execute_query('PRAGMA foreign_keys = ON')
     
-    # Create tables
-    execute_query(users_table)
-    execute_query(tracks_table)
-    execute_query(goals_table)
-    execute_query(tasks_table)
+    for version in applied:
+        print(f"Applied migration {version}")
+    return applied
+
+def find_rollup_drift():
+    """Return {table: [(id, user_id), ...]} for rows whose rollup counters disagree with their tasks"""
+    drift = {}
+    for table in LIVE_ROLLUP_EXPRESSIONS:
+        owner = 'user_id' if table == 'tracks' else '(SELECT user_id FROM tracks WHERE tracks.id = goals.track_id) AS user_id'
+        rows = execute_query(f'SELECT id, {owner} FROM {table} WHERE {rollup_drift_condition(table, LIVE_ROLLUP_EXPRESSIONS)} ORDER BY id', fetch_all=True)
+        drift[table] = [(row['id'], row['user_id']) for row in rows]
+    return drift
+
+def rebuild_rollups():
+    """Recompute drifted counters from the tasks table and return what was repaired"""
+    with db_session():
+        drift = find_rollup_drift()
+        for user_id in {user_id for rows in drift.values() for _, user_id in rows if user_id is not None}:
+            bump_data_version(user_id)
+            invalidate_cache(f'user:{user_id}')
+        for statement in rollup_rebuild_statements(LIVE_ROLLUP_EXPRESSIONS):
+            execute_query(statement)
+    return drift
+
+def check_schema():
+    """Startup check: return True if the schema is current, warn otherwise
+
+    Workers only ever read the version; DDL runs from migrate_db via the CLI
+    or the gunicorn master, never concurrently from every worker.
+    """
+    version = get_schema_version()
+    if version < LATEST_SCHEMA_VERSION:
+        print(f"WARNING: database schema is at version {version}, code expects {LATEST_SCHEMA_VERSION}; run 'flask --app app db upgrade'")
+        return False
+    return True
+
+# Sample data for the seeded user, in the import format (see Import / Export)
+SAMPLE_DATA = [
+    {'type': 'track', 'id': 1, 'name': 'Morning Routine', 'description': 'Daily morning activities', 'color': '#10B981'},
+    {'type': 'track', 'id': 2, 'name': 'Exercise & Health', 'description': 'Physical fitness and wellness', 'color': '#EF4444'},
+    {'type': 'track', 'id': 3, 'name': 'Work Productivity', 'description': 'Professional tasks and goals', 'color': '#3B82F6'},
+    {'type': 'track', 'id': 4, 'name': 'Learning & Growth', 'description': 'Personal development', 'color': '#8B5CF6'},
+    {'type': 'track', 'id': 5, 'name': 'Social Connections', 'description': 'Relationships and networking', 'color': '#F59E0B'},
+    {'type': 'track', 'id': 6, 'name': 'Creative Projects', 'description': 'Artistic and creative pursuits', 'color': '#EC4899'},
+    {'type': 'track', 'id': 7, 'name': 'Evening Wind-down', 'description': 'End of day routines', 'color': '#6366F1'},
+    {'type': 'goal', 'id': 1, 'track_id': 1, 'title': 'Wake up early', 'description': 'Consistent 6 AM wake-up time', 'target_value': 7, 'unit': 'days per week', 'recurrence': 'weekly'},
+    {'type': 'task', 'goal_id': 1, 'title': 'Set alarm for 6 AM', 'description': 'Use consistent alarm time'},
+    {'type': 'task', 'goal_id': 1, 'title': 'Get out of bed immediately', 'description': 'No snoozing allowed'},
+    {'type': 'task', 'goal_id': 1, 'title': 'Drink water first thing', 'description': 'Hydrate upon waking'},
+]
+
+def init_db():
+    """Initialize database with tables and sample data"""
+    migrate_db()
     
     # Check if Rob van Dijk exists
     user = execute_query('SELECT id FROM users WHERE email = %s' if IS_POSTGRESQL else 'SELECT id FROM users WHERE email = ?', 
@@ -137,120 +1136,858 @@ def init_db():
     
     if not user:
         # Create Rob van Dijk user with bcrypt password hashing
-        password_hash = bcrypt.hashpw('password123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = hash_password('password123')
         
-        if IS_POSTGRESQL:
-            user_id = execute_query(
-                'INSERT INTO users (email, password_hash, name) VALUES (%s, %s, %s) RETURNING id',
-                ('rob.vandijk@example.com', password_hash, 'Rob van Dijk')
+        with db_session():
+            user_id = write_returning(
+                f'INSERT INTO users (email, password_hash, name) VALUES ({PARAM}, {PARAM}, {PARAM}) RETURNING *',
+                ('rob.vandijk@example.com', password_hash, 'Rob van Dijk'), 'users'
             )['id']
-        else:
-            execute_query(
-                'INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)',
-                ('rob.vandijk@example.com', password_hash, 'Rob van Dijk')
-            )
-            user_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-        
-        # Create sample tracks, goals, and tasks
-        tracks_data = [
-            ('Morning Routine', 'Daily morning activities', '#10B981'),
-            ('Exercise & Health', 'Physical fitness and wellness', '#EF4444'),
-            ('Work Productivity', 'Professional tasks and goals', '#3B82F6'),
-            ('Learning & Growth', 'Personal development', '#8B5CF6'),
-            ('Social Connections', 'Relationships and networking', '#F59E0B'),
-            ('Creative Projects', 'Artistic and creative pursuits', '#EC4899'),
-            ('Evening Wind-down', 'End of day routines', '#6366F1')
-        ]
-        
-        for track_name, track_desc, track_color in tracks_data:
-            if IS_POSTGRESQL:
-                track_id = execute_query(
-                    'INSERT INTO tracks (user_id, name, description, color) VALUES (%s, %s, %s, %s) RETURNING id',
-                    (user_id, track_name, track_desc, track_color)
-                )['id']
-            else:
-                execute_query(
-                    'INSERT INTO tracks (user_id, name, description, color) VALUES (?, ?, ?, ?)',
-                    (user_id, track_name, track_desc, track_color)
-                )
-                track_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-            
-            # Add sample goals and tasks for each track
-            if track_name == 'Morning Routine':
-                if IS_POSTGRESQL:
-                    goal_id = execute_query(
-                        'INSERT INTO goals (track_id, title, description, target_value, unit) VALUES (%s, %s, %s, %s, %s) RETURNING id',
-                        (track_id, 'Wake up early', 'Consistent 6 AM wake-up time', 7, 'days per week')
-                    )['id']
-                else:
-                    execute_query(
-                        'INSERT INTO goals (track_id, title, description, target_value, unit) VALUES (?, ?, ?, ?, ?)',
-                        (track_id, 'Wake up early', 'Consistent 6 AM wake-up time', 7, 'days per week')
-                    )
-                    goal_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-                
-                tasks = [
-                    ('Set alarm for 6 AM', 'Use consistent alarm time'),
-                    ('Get out of bed immediately', 'No snoozing allowed'),
-                    ('Drink water first thing', 'Hydrate upon waking')
-                ]
-                for task_title, task_desc in tasks:
-                    if IS_POSTGRESQL:
-                        execute_query(
-                            'INSERT INTO tasks (goal_id, title, description) VALUES (%s, %s, %s)',
-                            (goal_id, task_title, task_desc)
-                        )
-                    else:
-                        execute_query(
-                            'INSERT INTO tasks (goal_id, title, description) VALUES (?, ?, ?)',
-                            (goal_id, task_title, task_desc)
-                        )
+            # Sample tracks, goals and tasks go through the bulk importer in the same transaction
+            import_user_data(user_id, SAMPLE_DATA)
     
     print("Database initialized successfully")
 
-def get_db_connection():
-    """Get database connection - supports both SQLite and PostgreSQL"""
+# SQLite tuning (SQLITE_TUNED=false keeps the library defaults): WAL lets
+# readers run alongside a writer, synchronous=NORMAL only syncs the WAL at
+# checkpoints (a power loss can lose the last commits, never corrupt the file),
+# and the busy timeout covers writers in other processes. New files use
+# incremental auto-vacuum (it must be set before WAL), so the purger can hand
+# freed pages back. Request writes go through the group-commit writer below.
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', 'true').lower() == 'true'
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', '256'))
+SQLITE_PRAGMAS = [
+    'PRAGMA auto_vacuum = INCREMENTAL',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}',
+    'PRAGMA foreign_keys = ON'
+]
+
+def get_db_connection(shared=False, replica_url=None):
+    """Open a new database connection - supports both SQLite and PostgreSQL
+
+    A shared SQLite connection may be used from several threads (one at a time)
+    and leaves transaction control to the caller. replica_url opens a read
+    replica instead of the primary; SQLite replicas are opened query-only and
+    their journal mode is left to whatever keeps them current.
+    """
     if IS_POSTGRESQL:
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = psycopg2.connect(replica_url or DATABASE_URL)
         return conn
+    database = replica_url[len('sqlite:///'):] if replica_url else DATABASE
+    if not SQLITE_TUNED:
+        conn = sqlite3.connect(database)
+        conn.row_factory = sqlite3.Row
     else:
-        conn = sqlite3.connect(DATABASE)
+        conn = sqlite3.connect(
+            database, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=SQLITE_CACHED_STATEMENTS,
+            check_same_thread=not shared, isolation_level=None if shared else ''
+        )
         conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            if not (replica_url and pragma.startswith('PRAGMA journal_mode')):
+                conn.execute(pragma)
+    if replica_url:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+# Connection pooling
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+class ConnectionPool:
+    """Common checkout bookkeeping for the backend specific pools"""
+
+    def __init__(self, replica_url=None):
+        self.replica_url = replica_url
+        self._reset_stats()
+        # Connections must never be shared between a gunicorn master and its
+        # workers, so every forked child starts with an empty pool.
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset_stats(self):
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.connections_opened = 0
+        self.connect_time_total = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _record_checkout(self, wait_time, waited):
+        with self._stats_lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            if waited:
+                self.waits += 1
+
+    def _record_checkin(self):
+        with self._stats_lock:
+            self.in_use -= 1
+
+    def _open_connection(self):
+        started = time.perf_counter()
+        conn = get_db_connection(replica_url=self.replica_url)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.connections_opened += 1
+            self.connect_time_total += elapsed
+        metrics.observe('db_connect_duration_seconds', (), elapsed)
+        return conn
+
+    def _after_fork(self):
+        self._reset_stats()
+
+    def stats(self):
+        """Return a snapshot of checkout wait times and pool saturation"""
+        with self._stats_lock:
+            return {
+                'backend': 'postgresql' if IS_POSTGRESQL else 'sqlite',
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'saturated_checkouts': self.waits,
+                'timeouts': self.timeouts,
+                'wait_time_total_ms': round(self.wait_time_total * 1000, 3),
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'connections_opened': self.connections_opened,
+                'connect_time_total_ms': round(self.connect_time_total * 1000, 3),
+            }
+
+class PostgresConnectionPool(ConnectionPool):
+    """Bounded, fork-safe pool of PostgreSQL connections"""
+
+    def __init__(self, max_size, timeout, replica_url=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._inherited = []
+        super().__init__(replica_url)
+
+    def _after_fork(self):
+        super()._after_fork()
+        # Keep references to the parent's sockets instead of closing them:
+        # closing would terminate the parent's sessions on the server.
+        self._inherited.extend(self._idle)
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+
+    def getconn(self):
+        """Check out a connection, waiting up to ``timeout`` when saturated"""
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        waited = False
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    with self._stats_lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                waited = True
+                self._cond.wait(remaining)
+
+        if conn is None or conn.closed:
+            try:
+                conn = self._open_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        self._record_checkout(time.perf_counter() - started, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection, rolling back any unfinished transaction"""
+        self._record_checkin()
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._cond:
+            if close or conn.closed:
+                self._size -= 1
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+class SQLiteConnectionPool(ConnectionPool):
+    """Per-thread reused SQLite connections"""
+
+    def __init__(self, replica_url=None):
+        self._local = threading.local()
+        self._inherited = []
+        super().__init__(replica_url)
+
+    def _after_fork(self):
+        super()._after_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._inherited.append(conn)
+        self._local = threading.local()
+
+    def getconn(self):
+        """Return this thread's connection, opening it on first use"""
+        started = time.perf_counter()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            self._local.depth = 0
+        self._local.depth += 1
+        self._record_checkout(time.perf_counter() - started, False)
         return conn
 
+    def putconn(self, conn, close=False):
+        """Release this thread's connection once its outermost user is done"""
+        self._record_checkin()
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if close:
+            conn.close()
+            self._local.conn = None
+
+# Group commit: requests queued for the SQLite write connection join the open
+# transaction; it is committed once nobody is waiting, after this many
+# requests, or when it has been open this long at a hand-off or when the next
+# request takes the connection, so a member waits for at most one unit of work
+# started inside the window
+SQLITE_GROUP_COMMIT_MAX = int(os.getenv('SQLITE_GROUP_COMMIT_MAX', '64'))
+SQLITE_GROUP_COMMIT_WINDOW = float(os.getenv('SQLITE_GROUP_COMMIT_WINDOW', '0.01'))
+
+class WriteFailed(Exception):
+    """The group commit a request was part of failed and was rolled back"""
+
+class WriteGroup:
+    """Requests sharing one SQLite transaction, and the outcome of its commit"""
+
+    def __init__(self):
+        self.opened_at = time.monotonic()
+        self.members = 0
+        self.done = threading.Event()
+        self.error = None
+
+class GroupCommitWriter:
+    """The process's single SQLite write connection, committing requests in groups
+
+    A request that writes takes the connection for the rest of its unit of
+    work, which runs inside a savepoint of the open group transaction, so an
+    error response still rolls back only that request. Handing the connection
+    on, a request commits the group unless another request is queued to join
+    it; the last one in line commits for everyone. Requests return only after
+    their group committed, and all of them fail if that commit fails. Readers
+    keep their own connections and, under WAL, never wait for the writer.
+    """
+
+    def __init__(self, max_group, window):
+        self.max_group = max_group
+        self.window = window
+        self._inherited = []
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Like the pools, never close a parent's connection in a forked child
+        if getattr(self, '_conn', None) is not None:
+            self._inherited.append(self._conn)
+        self._cond = threading.Condition()
+        self._conn = None
+        self._busy = False
+        self._waiting = 0
+        self._group = None
+        self.transactions = 0
+        self.commits = 0
+        self.failed_commits = 0
+        self.wait_time_total = 0.0
+
+    def begin(self):
+        """Wait for the write connection and open a savepoint on it for the caller"""
+        started = time.perf_counter()
+        with self._cond:
+            self._waiting += 1
+            while self._busy:
+                self._cond.wait()
+            self._waiting -= 1
+            self._busy = True
+            self.wait_time_total += time.perf_counter() - started
+        try:
+            if self._conn is None:
+                self._conn = get_db_connection(shared=True)
+            if self._group is not None and not self._joinable(self._group):
+                # Time or size ran out while this request was queued: commit
+                # for the members already in, who should not wait on its work
+                self._commit()
+            if self._group is None:
+                self._conn.execute('BEGIN IMMEDIATE')
+                self._group = WriteGroup()
+            self._conn.execute('SAVEPOINT request')
+        except BaseException:
+            self._hand_off()
+            raise
+        return self._conn
+
+    def finish(self, commit):
+        """End the caller's savepoint; when committing, return once its group has committed"""
+        group = self._group
+        try:
+            if not self._conn.in_transaction:
+                # SQLite rolled the whole transaction back after an error
+                self._fail(sqlite3.OperationalError('Write transaction was rolled back'))
+            elif commit:
+                self._conn.execute('RELEASE request')
+                group.members += 1
+            else:
+                self._conn.execute('ROLLBACK TO request')
+                self._conn.execute('RELEASE request')
+        except sqlite3.Error as e:
+            self._fail(e)
+        finally:
+            self._hand_off()
+        if commit:
+            group.done.wait()
+            if group.error is not None:
+                raise WriteFailed(str(group.error)) from group.error
+
+    def _fail(self, error):
+        """Roll back the open group and fail every request in it"""
+        group, self._group = self._group, None
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+        group.error = error
+        group.done.set()
+        self.failed_commits += 1
+
+    def _joinable(self, group):
+        """Whether another request may still add its work to the open group"""
+        return group.members < self.max_group and time.monotonic() - group.opened_at < self.window
+
+    def _commit(self):
+        """Commit the open group (or roll back an empty one) and wake its members"""
+        group = self._group
+        try:
+            self._conn.execute('COMMIT' if group.members else 'ROLLBACK')
+        except sqlite3.Error as e:
+            self._fail(e)
+        else:
+            self._group = None
+            self.transactions += group.members
+            self.commits += 1 if group.members else 0
+            group.done.set()
+
+    def _hand_off(self):
+        """Commit the group unless a queued request may still join it, then release the connection"""
+        group = self._group
+        if group is not None:
+            with self._cond:
+                waiting = self._waiting
+            if not (waiting and self._joinable(group)):
+                self._commit()
+        with self._cond:
+            self._busy = False
+            self._cond.notify()
+
+    def stats(self):
+        """Return commit counts and time spent queued for the write connection"""
+        return {
+            'transactions': self.transactions,
+            'group_commits': self.commits,
+            'failed_commits': self.failed_commits,
+            'transactions_per_commit': round(self.transactions / self.commits, 2) if self.commits else 0.0,
+            'wait_time_total_ms': round(self.wait_time_total * 1000, 3)
+        }
+
+db_pool = PostgresConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT) if IS_POSTGRESQL else SQLiteConnectionPool()
+db_writer = GroupCommitWriter(SQLITE_GROUP_COMMIT_MAX, SQLITE_GROUP_COMMIT_WINDOW) if not IS_POSTGRESQL and SQLITE_TUNED else None
+_session = threading.local()
+
+@contextmanager
+def db_session(write=False):
+    """Yield the connection for the current unit of work.
+
+    Inside a request all queries share one request-scoped connection and
+    transaction, finished by the request hooks below. Outside a request the
+    outermost db_session checks a connection out of the pool and commits or
+    rolls back when it exits.
+
+    With the SQLite group-commit writer, a request's first write moves it onto
+    the write connection for the rest of the request (execute_query does this
+    for INSERT, UPDATE and DELETE). Pass write=True before writing through
+    the yielded connection directly. A write likewise moves a @read_only
+    route off its read replica, so the request reads its own writes.
+    """
+    if has_request_context():
+        if write and g.pop('read_replica', None) is not None:
+            conn = g.pop('db_conn', None)
+            if conn is not None:
+                g.pop('db_conn_pool').putconn(conn)
+        if write and db_writer is not None and not g.get('db_writing'):
+            conn = g.pop('db_conn', None)
+            if conn is not None:
+                g.pop('db_conn_pool').putconn(conn)
+            g.db_conn = db_writer.begin()
+            g.db_writing = True
+            g.db_connections = g.get('db_connections', 0) + 1
+        elif 'db_conn' not in g:
+            replica = g.get('read_replica')
+            g.db_conn_pool = replica.pool if replica is not None else db_pool
+            g.db_conn = g.db_conn_pool.getconn()
+            g.db_connections = g.get('db_connections', 0) + 1
+        yield g.db_conn
+        return
+
+    conn = getattr(_session, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+
+    conn = db_pool.getconn()
+    _session.conn = conn
+    _session.after_commit = []
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        for callback in _session.after_commit:
+            callback()
+    finally:
+        _session.conn = None
+        db_pool.putconn(conn)
+
+def on_commit(callback):
+    """Run callback after the current transaction commits (now if none is open)"""
+    if has_request_context():
+        g.setdefault('after_commit', []).append(callback)
+    elif getattr(_session, 'conn', None) is not None:
+        _session.after_commit.append(callback)
+    else:
+        callback()
+
+@app.after_request
+def finish_request_transaction(response):
+    """Commit the request's transaction, or roll it back on error responses"""
+    conn = g.get('db_conn')
+    if g.pop('db_writing', False):
+        g.pop('db_conn')
+        try:
+            db_writer.finish(response.status_code < 400)
+        except WriteFailed as e:
+            print(f"Group commit failed: {e}")
+            response = make_response(jsonify({'error': 'Changes could not be saved, retry shortly'}), 503)
+            response.headers['Retry-After'] = '1'
+    elif conn is not None:
+        if response.status_code < 400:
+            conn.commit()
+        else:
+            conn.rollback()
+    if response.status_code < 400:
+        for callback in g.pop('after_commit', []):
+            callback()
+    return response
+
+@app.teardown_request
+def release_request_connection(exc):
+    """Return the request-scoped connection to the pool"""
+    conn = g.pop('db_conn', None)
+    if g.pop('db_writing', False):
+        db_writer.finish(False)
+    elif conn is not None:
+        g.pop('db_conn_pool').putconn(conn)
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
 def execute_query(query, params=None, fetch_one=False, fetch_all=False):
     """Execute database query with proper cursor handling"""
-    conn = get_db_connection()
-    try:
+    write = query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+    with db_session(write) as conn:
         if IS_POSTGRESQL:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
         else:
             cursor = conn.cursor()
         
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
+        site = query_site()
+        started = time.perf_counter()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+        except Exception as e:
+            print(f"Database error: {e}")
+            trace_query(site, query, time.perf_counter() - started, 0, failed=True)
+            raise e
         
         if fetch_one:
             result = cursor.fetchone()
+            rows = 0 if result is None else 1
         elif fetch_all:
             result = cursor.fetchall()
+            rows = len(result)
         else:
             # For INSERT operations, return the inserted row or lastrowid
             if IS_POSTGRESQL:
-                result = cursor.fetchone() if 'RETURNING' in query.upper() else None
+                result = cursor.fetchone() if cursor.description is not None else None
             else:
                 result = cursor.lastrowid
+            rows = max(cursor.rowcount, 0)
         
-        conn.commit()
+        trace_query(site, query, time.perf_counter() - started, rows)
         return result
-    except Exception as e:
-        conn.rollback()
-        print(f"Database error: {e}")
-        raise e
-    finally:
-        conn.close()
+
+# Metrics
+# Counters and histograms are kept in-process behind a single lock. Each worker
+# periodically writes a snapshot to METRICS_DIR and /api/metrics merges the
+# snapshots of every worker, so a scrape sees the whole gunicorn server.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'http_requests_total': ('counter', 'Requests handled, by route, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by route and method'),
+    'db_queries_total': ('counter', 'execute_query calls by call site'),
+    'db_query_seconds_total': ('counter', 'Time spent in execute_query by call site'),
+    'db_query_rows_total': ('counter', 'Rows returned or affected by call site'),
+    'db_query_errors_total': ('counter', 'Failed execute_query calls by call site'),
+    'db_connect_duration_seconds': ('histogram', 'Time to open a new database connection'),
+    'db_pool_checkouts_total': ('counter', 'Connection pool checkouts'),
+    'db_pool_saturated_checkouts_total': ('counter', 'Checkouts that had to wait for a connection'),
+    'db_pool_timeouts_total': ('counter', 'Checkouts that timed out'),
+    'db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a pooled connection'),
+    'db_pool_in_use': ('gauge', 'Connections currently checked out'),
+    'db_write_transactions_total': ('counter', 'Request transactions committed through the SQLite group-commit writer'),
+    'db_group_commits_total': ('counter', 'SQLite group commits'),
+    'db_group_commit_failures_total': ('counter', 'SQLite group commits that failed and were rolled back'),
+    'db_write_wait_seconds_total': ('counter', 'Time requests spent queued for the SQLite write connection'),
+    'cache_operations_total': ('counter', 'Read cache operations by result'),
+    'token_cache_operations_total': ('counter', 'Verified token cache lookups by result'),
+    'password_pool_pending': ('gauge', 'Password hashing jobs queued or running'),
+    'password_pool_rejected_total': ('counter', 'Logins rejected because the password pool was full'),
+    'asgi_requests_shed_total': ('counter', 'Requests refused with 503 at the ASGI_MAX_REQUESTS limit'),
+    'db_replica_checkouts_total': ('counter', 'Connections checked out from each read replica pool'),
+    'db_replica_fallbacks_total': ('counter', 'Requests rerun on the primary after their read replica failed'),
+    'db_replica_stale_reads_total': ('counter', "Requests sent back to the primary because the replica had not applied the user's data version"),
+    'db_replica_healthy': ('gauge', 'Whether each read replica is serving reads'),
+    'db_replica_lag_seconds': ('gauge', 'Seconds each read replica trails the primary at its last check'),
+    'recurring_goal_resets_total': ('counter', 'Recurring goals reset by the in-process scheduler'),
+    'recurring_goal_reset_failures_total': ('counter', 'Scheduled recurring goal reset runs that failed'),
+    'purged_rows_total': ('counter', 'Rows of deleted tracks and goals removed by the in-process purger'),
+    'purged_orphans_total': ('counter', 'Rows whose parent was gone removed by the in-process purger'),
+    'purge_failures_total': ('counter', 'Purger runs that failed'),
+}
+
+class Metrics:
+    """Process-local counters and histograms with cross-worker snapshots"""
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = float('-inf')  # First request after a fork flushes immediately
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def record_query(self, site, elapsed, rows, failed=False):
+        """Record one execute_query call under a single lock acquisition"""
+        labels = (('site', site),)
+        with self._lock:
+            counters = self._counters
+            for name, amount in (('db_queries_total', 1), ('db_query_seconds_total', elapsed), ('db_query_rows_total', rows)):
+                key = (name, labels)
+                counters[key] = counters.get(key, 0) + amount
+            if failed:
+                key = ('db_query_errors_total', labels)
+                counters[key] = counters.get(key, 0) + 1
+
+    def snapshot(self):
+        """Return this process's series, including pool and cache statistics"""
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        gauges = []
+
+        pool = db_pool.stats()
+        counters += [
+            ['db_pool_checkouts_total', {}, pool['checkouts']],
+            ['db_pool_saturated_checkouts_total', {}, pool['saturated_checkouts']],
+            ['db_pool_timeouts_total', {}, pool['timeouts']],
+            ['db_pool_wait_seconds_total', {}, pool['wait_time_total_ms'] / 1000]
+        ]
+        gauges.append(['db_pool_in_use', {}, pool['in_use']])
+        if db_writer is not None:
+            writer = db_writer.stats()
+            counters += [
+                ['db_write_transactions_total', {}, writer['transactions']],
+                ['db_group_commits_total', {}, writer['group_commits']],
+                ['db_group_commit_failures_total', {}, writer['failed_commits']],
+                ['db_write_wait_seconds_total', {}, writer['wait_time_total_ms'] / 1000]
+            ]
+
+        for replica in read_replicas.stats():
+            labels = {'replica': replica['name']}
+            counters += [
+                ['db_replica_checkouts_total', labels, replica['checkouts']],
+                ['db_replica_fallbacks_total', labels, replica['fallbacks']],
+                ['db_replica_stale_reads_total', labels, replica['stale_reads']]
+            ]
+            gauges.append(['db_replica_healthy', labels, int(replica['healthy'])])
+            if replica['lag_seconds'] is not None:
+                gauges.append(['db_replica_lag_seconds', labels, replica['lag_seconds']])
+
+        for result, value in read_cache.stats().items():
+            if result != 'backend':
+                counters.append(['cache_operations_total', {'result': result}, value])
+        for result, value in token_cache.stats().items():
+            if result != 'size':
+                counters.append(['token_cache_operations_total', {'result': result}, value])
+
+        resets = reset_scheduler.stats()
+        counters += [
+            ['recurring_goal_resets_total', {}, resets['goals_reset']],
+            ['recurring_goal_reset_failures_total', {}, resets['failures']]
+        ]
+        purges = purger.stats()
+        counters += [
+            ['purged_rows_total', {}, purges['rows_purged']],
+            ['purged_orphans_total', {}, purges['orphans_purged']],
+            ['purge_failures_total', {}, purges['failures']]
+        ]
+
+        hasher = password_hasher.stats()
+        counters.append(['password_pool_rejected_total', {}, hasher['rejected']])
+        gauges.append(['password_pool_pending', {}, hasher['pending']])
+
+        return {'pid': os.getpid(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def flush(self, force=False):
+        """Write this worker's snapshot to METRICS_DIR if the interval has passed"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        self._flushed_at = now
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Metrics flush failed: {e}")
+
+    def collect(self):
+        """Snapshots of every worker; only this process's when METRICS_DIR is unset"""
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Being replaced or removed by its worker
+        return snapshots
+
+    def render(self):
+        """Merge all worker snapshots and format them as Prometheus text"""
+        series = {}
+        for snapshot in self.collect():
+            # Counters from exited workers still count; their gauges do not
+            live = process_alive(snapshot['pid'])
+            for kind in ('counters', 'gauges', 'histograms'):
+                if kind == 'gauges' and not live:
+                    continue
+                for name, labels, value in snapshot[kind]:
+                    key = (name, tuple(sorted(labels.items())))
+                    if kind == 'histograms':
+                        merged = series.get(key)
+                        series[key] = value if merged is None else [a + b for a, b in zip(merged, value)]
+                    else:
+                        series[key] = series.get(key, 0) + value
+
+        lines = []
+        for name, (kind, description) in METRIC_HELP.items():
+            entries = sorted((labels, value) for (series_name, labels), value in series.items() if series_name == name)
+            if not entries:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in entries:
+                if kind != 'histogram':
+                    lines.append(f'{name}{format_labels(labels)} {format_metric_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", repr(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {value[-1]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_metric_value(value[-2])}')
+                lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset_directory(self):
+        """Remove snapshots left by a previous server run (gunicorn master only)"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.startswith('metrics-'):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+def process_alive(pid):
+    """Whether a worker process with this pid still exists"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def format_metric_value(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+# Generic helpers that are skipped when naming a query's call site
+QUERY_SITE_SKIP = {'write_returning', 'delete_returning'}
+
+def query_site():
+    """Name the execute_query call site as function:line"""
+    frame = sys._getframe(2)
+    while frame.f_code.co_name in QUERY_SITE_SKIP and frame.f_back is not None:
+        frame = frame.f_back
+    return f'{frame.f_code.co_name}:{frame.f_lineno}'
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+
+# Query tracing
+# Every execute_query call is counted per request and passed to query_hooks as
+# hook(site, query, elapsed, rows, failed). Routes declare how many round trips
+# they may make with @query_budget; bench/query_budget.py checks every route.
+QUERY_DEBUG_HEADERS = os.getenv('QUERY_DEBUG_HEADERS', 'false').lower() in ('1', 'true', 'yes')
+QUERY_BUDGETS = {}
+query_hooks = []
+
+def trace_query(site, query, elapsed, rows, failed=False):
+    """Record one execute_query call in metrics, the request counters and query_hooks"""
+    metrics.record_query(site, elapsed, rows, failed)
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_time = g.get('query_time', 0.0) + elapsed
+    for hook in query_hooks:
+        hook(site, query, elapsed, rows, failed)
+
+def query_budget(queries, connections=1):
+    """Declare the most execute_query round trips and connections a route may use"""
+    def decorator(f):
+        QUERY_BUDGETS[f.__name__] = {'queries': queries, 'connections': connections}
+        return f
+    return decorator
+
+@app.after_request
+def add_query_debug_headers(response):
+    """Report per-request query count and DB time in debug mode"""
+    if not (QUERY_DEBUG_HEADERS or app.debug):
+        return response
+    count = g.get('query_count', 0)
+    connections = g.get('db_connections', 0)
+    response.headers['X-Query-Count'] = str(count)
+    response.headers['X-Query-Time-Ms'] = f"{g.get('query_time', 0.0) * 1000:.3f}"
+    response.headers['X-DB-Connections'] = str(connections)
+    budget = QUERY_BUDGETS.get(request.endpoint)
+    if budget and (count > budget['queries'] or connections > budget['connections']):
+        print(f"Query budget exceeded by {request.endpoint}: {count} queries, {connections} connections (budget {budget['queries']}, {budget['connections']})")
+    return response
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    """Record route latency after the response, including the commit"""
+    started = g.get('request_started')
+    if started is None:
+        return
+    endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+    status = g.get('response_status', 500) if exc is None else 500
+    metrics.inc('http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+    metrics.observe('http_request_duration_seconds', (('endpoint', endpoint), ('method', request.method)), time.perf_counter() - started)
+    metrics.flush()
 
 def validate_email(email):
     """Validate email format"""
@@ -270,27 +2007,1009 @@ def validate_color(color):
     pattern = r'^#[0-9A-Fa-f]{6}$'
     return re.match(pattern, color) is not None
 
-def token_required(f):
-    """Decorator for routes that require authentication"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
+# Verified token cache
+# token_required skips the HMAC check and claim parsing for tokens it has
+# already verified. Entries expire with the token's own exp claim, the whole
+# cache is dropped when SECRET_KEY changes, and revoked tokens are rejected
+# before the cache is consulted.
+TOKEN_LIFETIME = datetime.timedelta(days=7)
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_REVOCATION_REFRESH = float(os.getenv('TOKEN_REVOCATION_REFRESH', '30'))
+
+class TokenCache:
+    """Bounded LRU of verified tokens: sha256(token) -> (user_id, exp)"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._secret = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest, now):
+        """Return the cached (user_id, exp) for a token digest, or None"""
+        with self._lock:
+            if self._secret != app.config['SECRET_KEY']:
+                self._entries.clear()
+                self._secret = app.config['SECRET_KEY']
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry
+
+    def put(self, digest, user_id, exp, secret):
+        """Remember a token verified with ``secret``"""
+        with self._lock:
+            if secret != self._secret:
+                return
+            self._entries[digest] = (user_id, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+class RevocationList:
+    """Digests of revoked tokens, reloaded from the database periodically"""
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._loaded_at = None
+
+    def is_revoked(self, digest, now):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self.reload(now)
+        expires_at = self._revoked.get(digest)
+        return expires_at is not None and expires_at > now
+
+    def reload(self, now):
+        rows = execute_query(
+            'SELECT token_hash, expires_at FROM revoked_tokens WHERE expires_at > %s' if IS_POSTGRESQL else 'SELECT token_hash, expires_at FROM revoked_tokens WHERE expires_at > ?',
+            (int(now),), fetch_all=True
+        )
+        with self._lock:
+            self._revoked = {row['token_hash']: row['expires_at'] for row in rows}
+            self._loaded_at = time.monotonic()
+
+    def revoke(self, digest, expires_at):
+        """Persist a revocation and apply it to this process immediately"""
+        execute_query(
+            'INSERT INTO revoked_tokens (token_hash, expires_at) VALUES (%s, %s) ON CONFLICT (token_hash) DO NOTHING' if IS_POSTGRESQL else 'INSERT OR IGNORE INTO revoked_tokens (token_hash, expires_at) VALUES (?, ?)',
+            (digest, int(expires_at))
+        )
+        execute_query(
+            'DELETE FROM revoked_tokens WHERE expires_at <= %s' if IS_POSTGRESQL else 'DELETE FROM revoked_tokens WHERE expires_at <= ?',
+            (int(time.time()),)
+        )
+        with self._lock:
+            self._revoked = dict(self._revoked, **{digest: expires_at})
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+revoked_tokens = RevocationList(TOKEN_REVOCATION_REFRESH)
+
+def token_required(f):
+    """Decorator for routes that require authentication"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token:
             return jsonify({'error': 'Token is missing'}), 401
         
-        try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-        except:
+        if token.startswith('Bearer '):
+            token = token[7:]
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        
+        if revoked_tokens.is_revoked(digest, now):
             return jsonify({'error': 'Token is invalid'}), 401
         
+        cached_token = token_cache.get(digest, now)
+        if cached_token:
+            current_user_id, exp = cached_token
+        else:
+            secret = app.config['SECRET_KEY']
+            try:
+                data = jwt.decode(token, secret, algorithms=['HS256'])
+                current_user_id = data['user_id']
+            except:
+                return jsonify({'error': 'Token is invalid'}), 401
+            exp = data.get('exp')
+            if exp is not None:
+                token_cache.put(digest, current_user_id, exp, secret)
+            else:
+                exp = now + TOKEN_LIFETIME.total_seconds()
+        
+        g.token_digest = digest
+        g.token_exp = exp
         return f(current_user_id, *args, **kwargs)
     return decorated
 
+# Password hashing
+# bcrypt runs on a small dedicated thread pool (it releases the GIL while
+# hashing) so a burst of logins is capped at PASSWORD_WORKERS concurrent
+# hashes per process, and requests beyond PASSWORD_QUEUE_LIMIT waiting jobs
+# are rejected immediately instead of piling up behind each other.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', '2'))
+PASSWORD_QUEUE_LIMIT = int(os.getenv('PASSWORD_QUEUE_LIMIT', '8'))
+PASSWORD_TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', '5'))
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password hashing pool cannot take more work"""
+
+class PasswordHasher:
+    """Bounded bcrypt worker pool with queue-depth admission control"""
+
+    def __init__(self, workers, queue_limit, timeout):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise PasswordPoolBusy('Password hashing pool is saturated')
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PasswordPoolBusy('Password hashing timed out')
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def check(self, password, password_hash):
+        """Return True if password matches the stored bcrypt hash"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def hash(self, password):
+        """Hash a password with the configured BCRYPT_ROUNDS"""
+        return self._run(hash_password, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'pending': self._pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+password_hasher = PasswordHasher(PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT, PASSWORD_TIMEOUT)
+
+def hash_password(password):
+    """Hash a password synchronously with the configured BCRYPT_ROUNDS"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def password_needs_rehash(password_hash):
+    """True when a stored hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(password_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+# Data access helpers shared by the item routes and /api/batch
+def parse_track_data(data):
+    """Validate and sanitize a track payload, returning (fields, error)"""
+    name = data.get('name')
+    description = data.get('description', '')
+    color = data.get('color', '#3B82F6')
+    
+    if not name:
+        return None, 'Track name is required'
+    
+    if not validate_color(color):
+        color = '#3B82F6'  # Default color if invalid
+    
+    return {
+        'name': sanitize_input(name, 255),
+        'description': sanitize_input(description, 1000),
+        'color': color
+    }, None
+
+def parse_goal_data(data):
+    """Validate a goal payload, returning (fields, error)"""
+    if not data.get('title'):
+        return None, 'Goal title is required'
+    
+    fields = {
+        'title': data.get('title'),
+        'description': data.get('description', ''),
+        'target_value': data.get('target_value', 1),
+        'current_value': data.get('current_value', 0),
+        'unit': data.get('unit', 'times')
+    }
+    for name in ('target_value', 'current_value'):
+        error = field_type_error(name, fields[name])
+        if error:
+            return None, error
+    # Without the key an update keeps the goal's schedule (see update_record)
+    if 'recurrence' in data:
+        recurrence = data['recurrence']
+        if recurrence is not None and recurrence not in RECURRENCES:
+            return None, RECURRENCE_ERROR
+        fields['recurrence'] = recurrence
+        fields['next_reset_at'] = next_reset_time(recurrence)
+    return fields, None
+
+def parse_task_data(data):
+    """Validate a task payload, returning (fields, error)"""
+    if not data.get('title'):
+        return None, 'Task title is required'
+    
+    completed = data.get('completed', False)
+    error = field_type_error('completed', completed)
+    if error:
+        return None, error
+    
+    return {
+        'title': data.get('title'),
+        'description': data.get('description', ''),
+        'completed': completed
+    }, None
+
+# Fields a PATCH may send; the keys of the body are the field mask
+PATCH_FIELDS = {
+    'tracks': ('name', 'description', 'color'),
+    'goals': ('title', 'description', 'target_value', 'current_value', 'unit', 'recurrence'),
+    'tasks': ('title', 'description', 'completed'),
+}
+# JSON type each PATCH field must have, as (Python types, wording for the error)
+PATCH_FIELD_TYPES = {
+    'name': (str, 'a string'),
+    'title': (str, 'a string'),
+    'description': ((str, type(None)), 'a string or null'),
+    'color': (str, 'a hex value like #3B82F6'),
+    'unit': (str, 'a string'),
+    'target_value': (int, 'an integer'),
+    'current_value': (int, 'an integer'),
+    'completed': (bool, 'true or false'),
+}
+
+def field_type_error(name, value):
+    """Return the error for a field value of the wrong JSON type, or None"""
+    types, wording = PATCH_FIELD_TYPES.get(name, (object, None))
+    # bool is an int subclass, but true is not a number
+    if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+        return f"{name.replace('_', ' ').capitalize()} must be {wording}"
+    return None
+
+def parse_patch_data(table, data):
+    """Validate a partial payload, returning (fields, error) with only the fields sent"""
+    if not isinstance(data, dict) or not data:
+        return None, 'At least one field is required'
+    
+    unknown = sorted(set(data) - set(PATCH_FIELDS[table]))
+    if unknown:
+        return None, f"Unknown or read-only fields: {', '.join(unknown)}"
+    
+    fields = dict(data)
+    for name, value in fields.items():
+        error = field_type_error(name, value)
+        if error:
+            return None, error
+    for required in ('name', 'title'):
+        if required in fields and not fields[required]:
+            return None, f'{required.capitalize()} cannot be empty'
+    if table == 'tracks':
+        if 'name' in fields:
+            fields['name'] = sanitize_input(fields['name'], 255)
+        if 'description' in fields:
+            fields['description'] = sanitize_input(fields['description'], 1000)
+        if 'color' in fields and not validate_color(fields['color']):
+            return None, 'Color must be a hex value like #3B82F6'
+    if 'recurrence' in fields:
+        if fields['recurrence'] is not None and fields['recurrence'] not in RECURRENCES:
+            return None, RECURRENCE_ERROR
+        fields['next_reset_at'] = next_reset_time(fields['recurrence'])
+    
+    return fields, None
+
+# Writes are single statements: ownership is part of the WHERE clause and the
+# row comes back through RETURNING (PostgreSQL, SQLite >= 3.35). Older SQLite
+# re-reads the row on the same connection instead.
+SUPPORTS_RETURNING = IS_POSTGRESQL or sqlite3.sqlite_version_info >= (3, 35, 0)
+PARAM = '%s' if IS_POSTGRESQL else '?'
+# Rows marked deleted (see migration 14) and everything below them are gone for every caller
+GOAL_OWNED = f'goals.deleted_at IS NULL AND EXISTS (SELECT 1 FROM tracks t WHERE t.id = goals.track_id AND t.user_id = {PARAM} AND t.deleted_at IS NULL)'
+TASK_OWNED = f'''EXISTS (
+    SELECT 1 FROM goals g JOIN tracks t ON g.track_id = t.id
+    WHERE g.id = tasks.goal_id AND t.user_id = {PARAM} AND g.deleted_at IS NULL AND t.deleted_at IS NULL
+)'''
+
+def write_returning(query, params, table, row_id=None):
+    """Run an INSERT/UPDATE ... RETURNING * and return the row, or None if nothing was written
+
+    Pass row_id for updates so the fallback for old SQLite knows which row to
+    re-read; inserts use last_insert_rowid(). changes() makes the fallback
+    return None when the write matched no row.
+    """
+    if SUPPORTS_RETURNING:
+        # fetch_all steps the statement to completion before the commit
+        rows = execute_query(query, params, fetch_all=True)
+        return rows[0] if rows else None
+    execute_query(query.rsplit(' RETURNING ', 1)[0], params)
+    if row_id is None:
+        return execute_query(f'SELECT * FROM {table} WHERE changes() > 0 AND id = last_insert_rowid()', fetch_one=True)
+    return execute_query(f'SELECT * FROM {table} WHERE changes() > 0 AND id = ?', (row_id,), fetch_one=True)
+
+def delete_returning(query, params, select_query):
+    """Run a DELETE ... RETURNING and return the deleted row, or None if nothing matched"""
+    if SUPPORTS_RETURNING:
+        rows = execute_query(query, params, fetch_all=True)
+        return rows[0] if rows else None
+    row = execute_query(select_query, params, fetch_one=True)
+    if row:
+        execute_query(query.rsplit(' RETURNING ', 1)[0], params)
+    return row
+
+# Equality that also holds between two NULLs
+SAME_VALUE = 'IS NOT DISTINCT FROM' if IS_POSTGRESQL else 'IS'
+
+# Ownership condition per table; each takes the user id as its only parameter
+OWNED = {'tracks': f'user_id = {PARAM} AND deleted_at IS NULL', 'goals': GOAL_OWNED, 'tasks': TASK_OWNED}
+
+def update_record(table, row_id, user_id, fields, versions=None):
+    """Set the given fields on a row owned by user_id and return the updated row, or None
+
+    The row's version is incremented. With versions (from If-Match) the row is
+    only written while its version is one of them; get_row_version tells a
+    conflict from a missing row afterwards.
+    """
+    assignments = ''
+    params = []
+    for column, value in fields.items():
+        if column == 'next_reset_at':
+            # Only a recurrence that actually changes restarts the schedule, so
+            # resending it never postpones a reset that is already due
+            assignments += f'next_reset_at = CASE WHEN recurrence {SAME_VALUE} {PARAM} THEN next_reset_at ELSE {PARAM} END, '
+            params.extend((fields['recurrence'], value))
+        else:
+            assignments += f'{column} = {PARAM}, '
+            params.append(value)
+    query = f'UPDATE {table} SET {assignments}version = version + 1 WHERE id = {PARAM} AND {OWNED[table]}'
+    params.extend((row_id, user_id))
+    if versions:
+        query += f" AND version IN ({', '.join([PARAM] * len(versions))})"
+        params.extend(versions)
+    return write_returning(f'{query} RETURNING *', params, table, row_id)
+
+def get_row_version(table, row_id, user_id):
+    """Return the current version of a row owned by user_id, or None if there is none"""
+    row = execute_query(f'SELECT version FROM {table} WHERE id = {PARAM} AND {OWNED[table]}', (row_id, user_id), fetch_one=True)
+    return row['version'] if row else None
+
+def insert_track(user_id, fields):
+    """Insert a track and return the new row"""
+    return write_returning(
+        f'INSERT INTO tracks (user_id, name, description, color) VALUES ({PARAM}, {PARAM}, {PARAM}, {PARAM}) RETURNING *',
+        (user_id, fields['name'], fields['description'], fields['color']), 'tracks'
+    )
+
+def update_track_record(track_id, user_id, fields, versions=None):
+    """Update a track owned by user_id and return the updated row, or None"""
+    return update_record('tracks', track_id, user_id, fields, versions)
+
+def delete_track_record(track_id, user_id):
+    """Mark a track owned by user_id deleted and return it, or None (the purger removes its goals and tasks)"""
+    return write_returning(
+        f'UPDATE tracks SET deleted_at = CURRENT_TIMESTAMP WHERE id = {PARAM} AND {OWNED["tracks"]} RETURNING id',
+        (track_id, user_id), 'tracks', track_id
+    )
+
+def insert_goal(track_id, user_id, fields):
+    """Insert a goal into a track owned by user_id and return the new row, or None"""
+    return write_returning(
+        f'''INSERT INTO goals (track_id, title, description, target_value, unit, recurrence, next_reset_at)
+            SELECT id, {PARAM}, {PARAM}, {PARAM}, {PARAM}, {PARAM}, {PARAM} FROM tracks WHERE id = {PARAM} AND user_id = {PARAM} AND deleted_at IS NULL RETURNING *''',
+        (fields['title'], fields['description'], fields['target_value'], fields['unit'], fields.get('recurrence'), fields.get('next_reset_at'),
+         track_id, user_id), 'goals'
+    )
+
+def update_goal_record(goal_id, user_id, fields, versions=None):
+    """Update a goal owned by user_id and return the updated row, or None"""
+    return update_record('goals', goal_id, user_id, fields, versions)
+
+def delete_goal_record(goal_id, user_id):
+    """Mark a goal owned by user_id deleted and return its id and track_id, or None (the purger removes its tasks)
+
+    A recurring goal also leaves the reset schedule.
+    """
+    return write_returning(
+        f'UPDATE goals SET deleted_at = CURRENT_TIMESTAMP, next_reset_at = NULL WHERE id = {PARAM} AND {GOAL_OWNED} RETURNING id, track_id',
+        (goal_id, user_id), 'goals', goal_id
+    )
+
+def insert_task(goal_id, user_id, fields):
+    """Insert a task into a goal owned by user_id and return the new row, or None"""
+    return write_returning(
+        f'''INSERT INTO tasks (goal_id, title, description, completed)
+            SELECT g.id, {PARAM}, {PARAM}, {PARAM} FROM goals g JOIN tracks t ON g.track_id = t.id
+            WHERE g.id = {PARAM} AND t.user_id = {PARAM} AND g.deleted_at IS NULL AND t.deleted_at IS NULL RETURNING *''',
+        (fields['title'], fields['description'], fields['completed'], goal_id, user_id), 'tasks'
+    )
+
+def update_task_record(task_id, user_id, fields, versions=None):
+    """Update a task owned by user_id and return the updated row, or None"""
+    return update_record('tasks', task_id, user_id, fields, versions)
+
+def delete_task_record(task_id, user_id):
+    """Delete a task owned by user_id and return its id and goal_id, or None"""
+    return delete_returning(
+        f'DELETE FROM tasks WHERE id = {PARAM} AND {TASK_OWNED} RETURNING id, goal_id',
+        (task_id, user_id),
+        f'SELECT id, goal_id FROM tasks WHERE id = {PARAM} AND {TASK_OWNED}'
+    )
+
+# Conditional GET support
+def get_data_version(user_id):
+    """Return the user's data version, bumped by every write to their tracks, goals or tasks
+
+    The same lookup tells @read_only whether the user wrote within
+    READ_YOUR_WRITES_WINDOW seconds, and which version a replica must have
+    applied to serve them (see Read replicas).
+    """
+    row = execute_query(
+        f'SELECT data_version, {RECENT_WRITE} AS recent_write FROM users WHERE id = {PARAM}',
+        (RECENT_WRITE_PARAM, user_id), fetch_one=True
+    )
+    if has_request_context():
+        g.recent_write = bool(row['recent_write']) if row else False
+        g.data_version = row['data_version'] if row else 0
+    return row['data_version'] if row else 0
+
+def bump_data_version(user_id):
+    """Invalidate the user's ETags; runs in the same transaction as the write
+
+    Call it before writing: the row lock it takes on users serializes the
+    user's writers, so change_log versions (see /api/changes) commit in order.
+    """
+    execute_query(
+        f'UPDATE users SET data_version = data_version + 1, written_at = CURRENT_TIMESTAMP WHERE id = {PARAM}',
+        (user_id,)
+    )
+    on_commit(lambda: change_notifier.notify(user_id))
+
+def conditional_get(f):
+    """Decorator for read routes: ETag from the user's data version, 304 on If-None-Match
+
+    The version is a single primary-key lookup on users, so a matching poll
+    never touches the tracks, goals or tasks tables.
+    """
+    @wraps(f)
+    def decorated(current_user_id, *args, **kwargs):
+        version = get_data_version(current_user_id)
+        etag = hashlib.sha256(f'{current_user_id}:{version}:{request.full_path}'.encode('utf-8')).hexdigest()[:32]
+        
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(f(current_user_id, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Authorization')
+        return response
+    return decorated
+
+# Read replicas
+# DATABASE_READ_URL lists replicas of the primary (comma-separated, same kind
+# of database): PostgreSQL standbys, or SQLite copies kept current by another
+# tool. Routes marked @read_only run their queries on a healthy replica,
+# except for users who wrote within READ_YOUR_WRITES_WINDOW seconds and for
+# the rest of a request once it writes; those read the primary. A thread in
+# each worker checks every replica each REPLICA_CHECK_INTERVAL seconds: it
+# must be reachable, fully migrated and at most REPLICA_MAX_LAG seconds
+# behind, measured as the gap between the newest users.written_at on the
+# primary and on the replica. Keep the lag limit within the window, or a
+# user could read from a replica that has not seen their last write. As a
+# last check a request only stays on a replica whose copy of the user's data
+# version matches the primary's, so replica reads are never older than the
+# version they are cached and ETagged under.
+READ_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_READ_URL', '').split(',') if url.strip()]
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '5'))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', str(READ_YOUR_WRITES_WINDOW)))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '2'))
+REPLICA_ERRORS = (psycopg2.Error, sqlite3.Error)
+
+# True when users.written_at falls inside the window; takes the window as its parameter
+if IS_POSTGRESQL:
+    RECENT_WRITE = "written_at > CURRENT_TIMESTAMP - INTERVAL '1 second' * %s"
+    RECENT_WRITE_PARAM = READ_YOUR_WRITES_WINDOW
+else:
+    RECENT_WRITE = "written_at > datetime('now', ?)"
+    RECENT_WRITE_PARAM = f'-{READ_YOUR_WRITES_WINDOW} seconds'
+
+def as_timestamp(value):
+    """Return a TIMESTAMP column value as a datetime (SQLite stores ISO strings)"""
+    return value if value is None or isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+class ReadReplica:
+    """One replica's connection pool and health"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.pool = PostgresConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, url) if IS_POSTGRESQL else SQLiteConnectionPool(url)
+        self.healthy = False
+        self.lag = None
+        self.error = 'Not checked yet'
+        self.fallbacks = 0
+        self.stale_reads = 0
+
+    def mark(self, error, lag=None):
+        """Record a health check result; error is None when the replica may serve reads"""
+        if (error is None) != self.healthy:
+            print(f"Read replica {self.name} is {'up' if error is None else 'down'}" + (f': {error}' if error else ''))
+        self.healthy = error is None
+        self.error = error
+        self.lag = lag
+
+class ReplicaRouter:
+    """Picks a healthy replica for @read_only routes and keeps replica health current"""
+
+    def __init__(self, urls, interval, max_lag):
+        self.replicas = []
+        for url in urls:
+            if url.startswith('postgresql://') != IS_POSTGRESQL or not (IS_POSTGRESQL or url.startswith('sqlite:///')):
+                print(f'WARNING: ignoring read replica {len(self.replicas) + 1}: it must be the same kind of database as DATABASE_URL')
+                continue
+            self.replicas.append(ReadReplica(f'replica{len(self.replicas) + 1}', url))
+        self.interval = interval
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._thread = None
+        # next() on a count is atomic, so handler threads never share a turn
+        self._turns = itertools.count(1)
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        """Return the next healthy replica, round robin, or None"""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turns) % len(healthy)]
+
+    def ensure_running(self):
+        """Start the health check thread on the first request of each process"""
+        if not self.replicas or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='replica-health', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Read replica check failed: {e}")
+            time.sleep(self.interval)
+
+    def check(self):
+        """Check every replica against the primary's newest write"""
+        with db_session():
+            primary = as_timestamp(execute_query('SELECT MAX(written_at) AS written_at FROM users', fetch_one=True)['written_at'])
+        for replica in self.replicas:
+            self._check(replica, primary)
+
+    def _check(self, replica, primary):
+        try:
+            conn = replica.pool.getconn()
+        except (PoolTimeout, *REPLICA_ERRORS) as e:
+            replica.mark(f'{type(e).__name__}: {e}')
+            return
+        close = False
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor) if IS_POSTGRESQL else conn.cursor()
+            cursor.execute('SELECT MAX(version) AS version FROM schema_migrations')
+            version = cursor.fetchone()['version']
+            cursor.execute('SELECT MAX(written_at) AS written_at FROM users')
+            written = as_timestamp(cursor.fetchone()['written_at'])
+        except REPLICA_ERRORS as e:
+            close = True
+            replica.mark(f'{type(e).__name__}: {e}')
+            return
+        finally:
+            replica.pool.putconn(conn, close=close)
+        if version != LATEST_SCHEMA_VERSION:
+            replica.mark(f'Schema version {version}, expected {LATEST_SCHEMA_VERSION}')
+            return
+        if primary is None:
+            lag = 0.0
+        elif written is None:
+            lag = float('inf')
+        else:
+            lag = max((primary - written).total_seconds(), 0.0)
+        replica.mark(None if lag <= self.max_lag else f'{lag:.1f}s behind the primary', lag)
+
+    def stats(self):
+        """Return health, lag and checkouts per replica"""
+        return [{
+            'name': replica.name,
+            'healthy': replica.healthy,
+            'lag_seconds': None if replica.lag in (None, float('inf')) else round(replica.lag, 3),
+            'error': replica.error,
+            'fallbacks': replica.fallbacks,
+            'stale_reads': replica.stale_reads,
+            'checkouts': replica.pool.checkouts
+        } for replica in self.replicas]
+
+    def health(self):
+        """Return whether each replica is up, without error details (/api/health is public)"""
+        return [{'name': replica.name, 'healthy': replica.healthy} for replica in self.replicas]
+
+read_replicas = ReplicaRouter(READ_REPLICA_URLS, REPLICA_CHECK_INTERVAL, REPLICA_MAX_LAG)
+
+@app.before_request
+def start_replica_checks():
+    read_replicas.ensure_running()
+
+def read_only(f):
+    """Decorator for read routes whose queries may run on a read replica
+
+    Place it below @conditional_get: its data-version lookup runs on the
+    primary and also tells whether the user wrote recently, so routes without
+    it stay on the primary. A replica that has not applied that version yet
+    hands the request back to the primary. If the replica fails mid-request
+    it is marked down and the route runs again on the primary.
+    """
+    @wraps(f)
+    def decorated(current_user_id, *args, **kwargs):
+        replica = read_replicas.choose() if g.get('recent_write') is False and not g.get('db_writing') else None
+        if replica is None:
+            return f(current_user_id, *args, **kwargs)
+
+        # The version lookup's connection goes back before the replica's is taken
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            conn.commit()
+            g.pop('db_conn_pool').putconn(conn)
+        g.read_replica = replica
+        try:
+            row = execute_query(f'SELECT data_version FROM users WHERE id = {PARAM}', (current_user_id,), fetch_one=True)
+            if row is None or row['data_version'] != g.get('data_version'):
+                replica.stale_reads += 1
+                g.pop('read_replica')
+                conn = g.pop('db_conn', None)
+                if conn is not None:
+                    g.pop('db_conn_pool').putconn(conn)
+            return f(current_user_id, *args, **kwargs)
+        except REPLICA_ERRORS as e:
+            if g.get('read_replica') is not replica:
+                raise
+            replica.mark(f'{type(e).__name__}: {e}')
+            replica.fallbacks += 1
+            g.pop('read_replica')
+            conn = g.pop('db_conn', None)
+            if conn is not None:
+                g.pop('db_conn_pool').putconn(conn, close=True)
+            return f(current_user_id, *args, **kwargs)
+    return decorated
+
+# Read cache
+# Results of the list endpoints and ownership lookups are cached under keys
+# tagged with the entities they depend on. Writes invalidate tags, not keys:
+# every tag carries a version and an entry is only served while the tag
+# versions it was filled under are still current.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')
+CACHE_TTL = float(os.getenv('CACHE_TTL', '300'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join(
+    tempfile.gettempdir(),
+    'task_manager_cache_%s.db' % hashlib.sha256((DATABASE_URL if IS_POSTGRESQL else os.path.abspath(DATABASE)).encode('utf-8')).hexdigest()[:12]
+))
+CACHE_MISS = object()
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by the cache backends"""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'expired': 0, 'evictions': 0, 'sets': 0, 'invalidations': 0}
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counters, backend=self.name)
+
+class NullCache(CacheStats):
+    """Cache backend that stores nothing (CACHE_BACKEND=none)"""
+    name = 'none'
+
+    def get(self, key):
+        self.count('misses')
+        return CACHE_MISS
+
+    def tag_versions(self, tags):
+        return {}
+
+    def set(self, key, value, versions):
+        pass
+
+    def invalidate(self, tags):
+        pass
+
+class MemoryCache(CacheStats):
+    """In-process LRU cache bounded by the pickled size of its values"""
+    name = 'memory'
+
+    def __init__(self, max_bytes, ttl):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        self._tag_clock = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.count('misses')
+                return CACHE_MISS
+            blob, versions, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.count('expired')
+                self.count('misses')
+                return CACHE_MISS
+            if any(self._tags.get(tag, 0) != version for tag, version in versions.items()):
+                self._remove(key)
+                self.count('stale')
+                self.count('misses')
+                return CACHE_MISS
+            self._entries.move_to_end(key)
+        self.count('hits')
+        return pickle.loads(blob)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return {tag: self._tags.get(tag, 0) for tag in tags}
+
+    def set(self, key, value, versions):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (blob, versions, time.monotonic() + self.ttl)
+            self._size += len(blob)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.count('evictions')
+        self.count('sets')
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_clock += 1
+                self._tags[tag] = self._tag_clock
+        self.count('invalidations', len(tags))
+
+    def _remove(self, key):
+        blob, _, _ = self._entries.pop(key)
+        self._size -= len(blob)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+class SQLiteCache(CacheStats):
+    """LRU cache in a local SQLite file shared by every worker on the host"""
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes, ttl):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    versions TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute('SELECT value, versions, expires_at, accessed_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.count('misses')
+            return CACHE_MISS
+        blob, versions, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at < now:
+            conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self.count('expired')
+            self.count('misses')
+            return CACHE_MISS
+        versions = json.loads(versions)
+        if versions != self.tag_versions(versions):
+            conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self.count('stale')
+            self.count('misses')
+            return CACHE_MISS
+        if now - accessed_at > 1:
+            conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, key))
+        self.count('hits')
+        return pickle.loads(blob)
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        rows = self._conn().execute(
+            'SELECT tag, version FROM cache_tags WHERE tag IN (%s)' % ', '.join('?' * len(tags)), tags
+        ).fetchall()
+        versions = dict.fromkeys(tags, 0)
+        versions.update(rows)
+        return versions
+
+    def set(self, key, value, versions):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, versions, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, blob, json.dumps(versions), len(blob), now + self.ttl, now)
+        )
+        self.count('sets')
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+        while total > self.max_bytes:
+            victims = conn.execute('SELECT key, size FROM cache_entries ORDER BY accessed_at LIMIT 64').fetchall()
+            if not victims:
+                break
+            conn.executemany('DELETE FROM cache_entries WHERE key = ?', [(victim,) for victim, _ in victims])
+            total -= sum(size for _, size in victims)
+            self.count('evictions', len(victims))
+
+    def invalidate(self, tags):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            clock = conn.execute('SELECT COALESCE(MAX(version), 0) FROM cache_tags').fetchone()[0]
+            conn.executemany(
+                'INSERT INTO cache_tags (tag, version) VALUES (?, ?) ON CONFLICT (tag) DO UPDATE SET version = excluded.version',
+                [(tag, clock + offset) for offset, tag in enumerate(tags, 1)]
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.count('invalidations', len(tags))
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+def create_read_cache():
+    """Build the cache backend selected by CACHE_BACKEND"""
+    if CACHE_BACKEND == 'none':
+        return NullCache()
+    if CACHE_BACKEND == 'memory':
+        return MemoryCache(CACHE_MAX_BYTES, CACHE_TTL)
+    if CACHE_BACKEND == 'sqlite':
+        return SQLiteCache(CACHE_PATH, CACHE_MAX_BYTES, CACHE_TTL)
+    raise ValueError(f'Unknown CACHE_BACKEND: {CACHE_BACKEND}')
+
+read_cache = create_read_cache()
+if hasattr(read_cache, '_after_fork'):
+    os.register_at_fork(after_in_child=read_cache._after_fork)
+
+def cached(key, tags, loader):
+    """Return the cached value for key, or load it and cache it under tags
+
+    Tag versions are captured before the loader runs, so a write committed
+    while loading leaves the new entry already stale instead of serving old
+    data until the TTL expires.
+    """
+    value = read_cache.get(key)
+    if value is not CACHE_MISS:
+        return value
+    versions = read_cache.tag_versions(tags)
+    value = loader()
+    read_cache.set(key, value, versions)
+    return value
+
+def invalidate_cache(*tags):
+    """Invalidate cache tags once the current transaction has committed"""
+    on_commit(lambda: read_cache.invalidate(tags))
+
+def track_owner(track_id):
+    """Return the user id owning a track, or None (cached)"""
+    def load():
+        track = execute_query(
+            f'SELECT user_id FROM tracks WHERE id = {PARAM} AND deleted_at IS NULL',
+            (track_id,), fetch_one=True
+        )
+        return track['user_id'] if track else None
+    return cached(f'own:track:{track_id}', [f'track:{track_id}'], load)
+
+def goal_owner(goal_id):
+    """Return (user id, track id) owning a goal, or (None, None) (cached)
+
+    The goal's track is re-checked through track_owner, so deleting a track
+    also hides its goals without enumerating them.
+    """
+    def load():
+        goal = execute_query(
+            f'SELECT track_id FROM goals WHERE id = {PARAM} AND deleted_at IS NULL',
+            (goal_id,), fetch_one=True
+        )
+        return goal['track_id'] if goal else None
+    track_id = cached(f'own:goal:{goal_id}', [f'goal:{goal_id}'], load)
+    if track_id is None:
+        return None, None
+    return track_owner(track_id), track_id
+
 # API Routes
 @app.route('/api/auth/login', methods=['POST'])
+@query_budget(2)
 def login():
     """User login endpoint"""
     data = request.get_json()
@@ -316,15 +3035,29 @@ def login():
     if not user:
         return jsonify({'error': 'Invalid email or password'}), 401
     
-    # Check password with bcrypt
-    if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-        return jsonify({'error': 'Invalid email or password'}), 401
+    # Check password with bcrypt on the bounded hashing pool
+    try:
+        if not password_hasher.check(password, user['password_hash']):
+            return jsonify({'error': 'Invalid email or password'}), 401
+    except PasswordPoolBusy:
+        return jsonify({'error': 'Too many logins in progress, please retry'}), 503, {'Retry-After': '1'}
+    
+    # Transparently upgrade hashes made with a different BCRYPT_ROUNDS
+    if password_needs_rehash(user['password_hash']):
+        try:
+            execute_query(
+                'UPDATE users SET password_hash = %s WHERE id = %s' if IS_POSTGRESQL else 'UPDATE users SET password_hash = ? WHERE id = ?',
+                (password_hasher.hash(password), user['id'])
+            )
+        except PasswordPoolBusy:
+            pass  # Retried on the next login
     
     # Generate JWT token
     token = jwt.encode({
         'user_id': user['id'],
         'email': user['email'],
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7)
+        'exp': datetime.datetime.utcnow() + TOKEN_LIFETIME,
+        'jti': secrets.token_hex(8)  # Makes every token unique so one can be revoked alone
     }, app.config['SECRET_KEY'], algorithm='HS256')
     
     return jsonify({
@@ -336,394 +3069,1931 @@ def login():
         }
     })
 
+@app.route('/api/auth/logout', methods=['POST'])
+@query_budget(2)
+@token_required
+def logout(current_user_id):
+    """Revoke the token used for this request"""
+    revoked_tokens.revoke(g.token_digest, g.token_exp)
+    token_cache.discard(g.token_digest)
+    return jsonify({'message': 'Logged out successfully'})
+
 @app.route('/api/tracks', methods=['GET'])
+@query_budget(5, connections=3)  # Version lookups on the primary and on a read replica if any, the rest on the replica (the primary again if it is behind)
 @token_required
+@conditional_get
+@read_only
 def get_tracks(current_user_id):
-    """Get all tracks for the current user"""
-    tracks = execute_query(
-        'SELECT * FROM tracks WHERE user_id = %s ORDER BY created_at' if IS_POSTGRESQL else 'SELECT * FROM tracks WHERE user_id = ? ORDER BY created_at',
-        (current_user_id,), fetch_all=True
-    )
+    """Get all tracks for the current user
+
+    Pass ``expand=goals`` or ``expand=goals,tasks`` to receive the whole
+    nested tree in one request instead of fetching each level separately.
+    """
+    expand = {part.strip() for part in request.args.get('expand', '').split(',') if part.strip()}
+    if expand - {'goals', 'tasks'}:
+        return jsonify({'error': 'expand must be goals or goals,tasks'}), 400
+    
+    def load():
+        tracks = execute_query(
+            f'SELECT * FROM tracks WHERE user_id = {PARAM} AND deleted_at IS NULL ORDER BY created_at',
+            (current_user_id,), fetch_all=True
+        )
+        tracks = [dict(track) for track in tracks]
+        if expand:
+            attach_goals_and_tasks(current_user_id, tracks, include_tasks='tasks' in expand)
+        return tracks
+    
+    # Tracks carry rollup counters, so task writes (tree:) invalidate them too
+    tags = [f'tracks:{current_user_id}', f'user:{current_user_id}', f'tree:{current_user_id}']
+    tracks = cached(f"tracks:{current_user_id}:{','.join(sorted(expand))}", tags, load)
+    
+    return jsonify(tracks)
+
+def attach_goals_and_tasks(user_id, tracks, include_tasks=False):
+    """Nest goals (and optionally tasks) under tracks with one query per level"""
+    goals = execute_query(f'''
+        SELECT g.* FROM goals g
+        JOIN tracks t ON g.track_id = t.id
+        WHERE t.user_id = {PARAM} AND t.deleted_at IS NULL AND g.deleted_at IS NULL
+        ORDER BY g.created_at
+    ''', (user_id,), fetch_all=True)
+    
+    goals_by_track = {track['id']: [] for track in tracks}
+    goals_by_id = {}
+    for goal in goals:
+        goal = dict(goal)
+        if include_tasks:
+            goal['tasks'] = []
+        goals_by_id[goal['id']] = goal
+        goals_by_track.setdefault(goal['track_id'], []).append(goal)
+    
+    if include_tasks:
+        tasks = execute_query(f'''
+            SELECT tk.* FROM tasks tk
+            JOIN goals g ON tk.goal_id = g.id
+            JOIN tracks t ON g.track_id = t.id
+            WHERE t.user_id = {PARAM} AND t.deleted_at IS NULL AND g.deleted_at IS NULL
+            ORDER BY tk.created_at
+        ''', (user_id,), fetch_all=True)
+        for task in tasks:
+            goals_by_id[task['goal_id']]['tasks'].append(dict(task))
+    
+    for track in tracks:
+        track['goals'] = goals_by_track[track['id']]
+
+@app.route('/api/tracks/summary', methods=['GET'])
+@query_budget(4, connections=3)  # Version lookups on the primary and on a read replica if any, the rest on the replica (the primary again if it is behind)
+@token_required
+@conditional_get
+@read_only
+def get_tracks_summary(current_user_id):
+    """Progress per track and goal from the rollup counters, without reading any tasks"""
+    def load():
+        tracks = execute_query(
+            f'SELECT id, name, color, goal_count, task_count, completed_count FROM tracks WHERE user_id = {PARAM} AND deleted_at IS NULL ORDER BY created_at',
+            (current_user_id,), fetch_all=True
+        )
+        goals = execute_query(f'''
+            SELECT g.id, g.track_id, g.title, g.current_value, g.target_value, g.unit, g.task_count, g.completed_count
+            FROM goals g
+            JOIN tracks t ON g.track_id = t.id
+            WHERE t.user_id = {PARAM} AND t.deleted_at IS NULL AND g.deleted_at IS NULL
+            ORDER BY g.created_at
+        ''', (current_user_id,), fetch_all=True)
+        
+        summary = []
+        goals_by_track = {}
+        for track in tracks:
+            track = dict(track, percent_complete=percent_complete(track['completed_count'], track['task_count']), goals=[])
+            goals_by_track[track['id']] = track['goals']
+            summary.append(track)
+        for goal in goals:
+            goal = dict(goal, percent_complete=percent_complete(goal['completed_count'], goal['task_count']))
+            goals_by_track[goal.pop('track_id')].append(goal)
+        return summary
     
-    return jsonify([dict(track) for track in tracks])
+    tags = [f'tracks:{current_user_id}', f'user:{current_user_id}', f'tree:{current_user_id}']
+    return jsonify(cached(f'summary:{current_user_id}', tags, load))
+
+def percent_complete(completed, total):
+    """Whole-number percentage of completed tasks, None when there are no tasks"""
+    return round(completed * 100 / total) if total else None
 
 @app.route('/api/tracks', methods=['POST'])
+@query_budget(2)
 @token_required
 def create_track(current_user_id):
     """Create a new track"""
-    data = request.get_json()
-    name = data.get('name')
-    description = data.get('description', '')
-    color = data.get('color', '#3B82F6')
-    
-    if not name:
-        return jsonify({'error': 'Track name is required'}), 400
-    
-    # Validate and sanitize inputs
-    name = sanitize_input(name, 255)
-    description = sanitize_input(description, 1000)
+    fields, error = parse_track_data(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not validate_color(color):
-        color = '#3B82F6'  # Default color if invalid
-    
-    if IS_POSTGRESQL:
-        track = execute_query(
-            'INSERT INTO tracks (user_id, name, description, color) VALUES (%s, %s, %s, %s) RETURNING *',
-            (current_user_id, name, description, color), fetch_one=True
-        )
-    else:
-        execute_query(
-            'INSERT INTO tracks (user_id, name, description, color) VALUES (?, ?, ?, ?)',
-            (current_user_id, name, description, color)
-        )
-        track_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-        track = execute_query('SELECT * FROM tracks WHERE id = ?', (track_id,), fetch_one=True)
+    bump_data_version(current_user_id)
+    track = insert_track(current_user_id, fields)
+    invalidate_cache(f'tracks:{current_user_id}')
     
-    return jsonify(dict(track)), 201
+    return item_response(track, 201)
 
 @app.route('/api/goals', methods=['GET'])
+@query_budget(4, connections=3)  # Version lookups on the primary and on a read replica if any, the rest on the replica (the primary again if it is behind)
 @token_required
+@conditional_get
+@read_only
 def get_goals(current_user_id):
-    """Get goals for a specific track"""
-    track_id = request.args.get('track_id')
+    """Get goals for a specific track
+
+    Pass ``limit`` and/or ``cursor`` for keyset pagination; the response is
+    then ``{"items": [...], "next_cursor": ...}``.
+    """
+    track_id = request.args.get('track_id', type=int)
     if not track_id:
         return jsonify({'error': 'track_id parameter required'}), 400
     
-    # Verify track belongs to user
-    track = execute_query(
-        'SELECT * FROM tracks WHERE id = %s AND user_id = %s' if IS_POSTGRESQL else 'SELECT * FROM tracks WHERE id = ? AND user_id = ?',
-        (track_id, current_user_id), fetch_one=True
-    )
+    page, error = parse_page_args()
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not track:
+    # Verify track belongs to user
+    if track_owner(track_id) != current_user_id:
         return jsonify({'error': 'Track not found'}), 404
     
-    goals = execute_query(
-        'SELECT * FROM goals WHERE track_id = %s ORDER BY created_at' if IS_POSTGRESQL else 'SELECT * FROM goals WHERE track_id = ? ORDER BY created_at',
-        (track_id,), fetch_all=True
-    )
-    
-    return jsonify([dict(goal) for goal in goals])
+    tags = [f'goals:{track_id}', f'track:{track_id}', f'user:{current_user_id}', f'tree:{current_user_id}']
+    return list_page('goals', 'track_id', track_id, page, tags)
 
 @app.route('/api/tasks', methods=['GET'])
+@query_budget(5, connections=3)  # Version lookups on the primary and on a read replica if any, the rest on the replica (the primary again if it is behind)
 @token_required
+@conditional_get
+@read_only
 def get_tasks(current_user_id):
-    """Get tasks for a specific goal"""
-    goal_id = request.args.get('goal_id')
+    """Get tasks for a specific goal (paginated like get_goals)"""
+    goal_id = request.args.get('goal_id', type=int)
     if not goal_id:
         return jsonify({'error': 'goal_id parameter required'}), 400
     
-    # Verify goal belongs to user (through track)
-    goal = execute_query('''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = %s AND t.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = ? AND t.user_id = ?
-    ''', (goal_id, current_user_id), fetch_one=True)
+    page, error = parse_page_args()
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not goal:
+    # Verify goal belongs to user (through track)
+    owner_id, track_id = goal_owner(goal_id)
+    if owner_id != current_user_id:
         return jsonify({'error': 'Goal not found'}), 404
     
-    tasks = execute_query(
-        'SELECT * FROM tasks WHERE goal_id = %s ORDER BY created_at' if IS_POSTGRESQL else 'SELECT * FROM tasks WHERE goal_id = ? ORDER BY created_at',
-        (goal_id,), fetch_all=True
-    )
+    tags = [f'tasks:{goal_id}', f'goal:{goal_id}', f'track:{track_id}', f'user:{current_user_id}']
+    return list_page('tasks', 'goal_id', goal_id, page, tags)
+
+# Keyset pagination for goal and task listings
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+MAX_UNPAGINATED_ROWS = int(os.getenv('MAX_UNPAGINATED_ROWS', '1000'))
+
+def encode_cursor(row):
+    """Encode the (created_at, id) position of a row as an opaque cursor"""
+    created_at = row['created_at']
+    if isinstance(created_at, datetime.datetime):
+        created_at = created_at.isoformat(sep=' ')
+    raw = json.dumps([created_at, row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor into (created_at, id), raising ValueError if malformed"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(created_at, str) or isinstance(row_id, bool) or not isinstance(row_id, int):
+        raise ValueError('Invalid cursor')
+    return created_at, row_id
+
+def parse_page_args():
+    """Read limit/cursor query parameters, returning (page, error)
+
+    ``page`` is None for unpaginated requests, otherwise a dict with the page
+    size and the decoded cursor position (or None for the first page).
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None, None
+    
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_SIZE))
+    except ValueError:
+        return None, 'limit must be an integer'
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return None, f'limit must be between 1 and {MAX_PAGE_SIZE}'
+    
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return None, str(e)
+    
+    return {'limit': limit, 'after': after}, None
+
+def list_page(table, parent_column, parent_id, page, tags):
+    """List goals or tasks of one parent in (created_at, id) order
+
+    Each page is an index range scan on (parent, created_at, id). Unpaginated
+    calls keep returning a plain list, capped at MAX_UNPAGINATED_ROWS with an
+    X-Next-Cursor header when truncated. Pages are cached under ``tags``.
+    """
+    placeholder = '%s' if IS_POSTGRESQL else '?'
+    limit = page['limit'] if page else MAX_UNPAGINATED_ROWS
+    after = page['after'] if page else None
+    
+    query = f'SELECT * FROM {table} WHERE {parent_column} = {placeholder}'
+    if table in SOFT_DELETE_TABLES:
+        query += ' AND deleted_at IS NULL'
+    params = [parent_id]
+    if after:
+        query += f' AND (created_at, id) > ({placeholder}, {placeholder})'
+        params.extend(after)
+    query += f' ORDER BY created_at, id LIMIT {placeholder}'
+    params.append(limit + 1)
+    
+    key = f"{table}:{parent_id}:{limit}:{','.join(map(str, after)) if after else ''}"
+    rows = cached(key, tags, lambda: [dict(row) for row in execute_query(query, params, fetch_all=True)])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
     
-    return jsonify([dict(task) for task in tasks])
+    if page:
+        return jsonify({'items': rows, 'next_cursor': next_cursor})
+    
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# Optimistic concurrency
+# Item writes answer with the row's version as a strong ETag ("3"). A client
+# that sends it back in If-Match only updates the row it last saw; if another
+# request updated it first, the write matches nothing and the client gets 412
+# with the current version, instead of silently overwriting that change.
+def if_match_versions():
+    """Versions named by If-Match: None when absent or *, else a list (empty if none is a version)"""
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    return [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+
+def versioned_update(table, row_id, user_id, fields):
+    """Update an owned row under the request's If-Match; returns (row, None) or (None, error response)"""
+    versions = if_match_versions()
+    # Only weak or malformed tags: no version can match, but 404 still wins over 412
+    row = update_record(table, row_id, user_id, fields, versions) if versions != [] else None
+    if row:
+        return row, None
+    
+    name = table[:-1].capitalize()
+    current = get_row_version(table, row_id, user_id) if versions is not None else None
+    if current is None:
+        return None, (jsonify({'error': f'{name} not found'}), 404)
+    response = make_response(jsonify({'error': f'{name} was changed by another request', 'version': current}), 412)
+    response.set_etag(str(current))
+    return None, response
+
+def item_response(row, status=200):
+    """JSON response for one written row, tagged with its version"""
+    response = make_response(jsonify(dict(row)), status)
+    response.set_etag(str(row['version']))
+    return response
 
 # Additional CRUD Operations for Tracks
 @app.route('/api/tracks/<int:track_id>', methods=['PUT'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
 @token_required
 def update_track(current_user_id, track_id):
     """Update a track"""
-    data = request.get_json()
-    name = data.get('name')
-    description = data.get('description', '')
-    color = data.get('color', '#3B82F6')
-    
-    if not name:
-        return jsonify({'error': 'Track name is required'}), 400
+    fields, error = parse_track_data(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Validate and sanitize inputs
-    name = sanitize_input(name, 255)
-    description = sanitize_input(description, 1000)
-    
-    if not validate_color(color):
-        color = '#3B82F6'  # Default color if invalid
+    bump_data_version(current_user_id)
+    # Update track (only if it belongs to the user)
+    updated_track, error = versioned_update('tracks', track_id, current_user_id, fields)
+    if error:
+        return error
     
-    # Verify track belongs to user
-    track = execute_query(
-        'SELECT * FROM tracks WHERE id = %s AND user_id = %s' if IS_POSTGRESQL else 'SELECT * FROM tracks WHERE id = ? AND user_id = ?',
-        (track_id, current_user_id), fetch_one=True
-    )
+    invalidate_cache(f'tracks:{current_user_id}')
     
-    if not track:
-        return jsonify({'error': 'Track not found'}), 404
+    return item_response(updated_track)
+
+@app.route('/api/tracks/<int:track_id>', methods=['PATCH'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
+@token_required
+def patch_track(current_user_id, track_id):
+    """Update only the track fields present in the body"""
+    fields, error = parse_patch_data('tracks', request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Update track
-    updated_track = execute_query(
-        'UPDATE tracks SET name = %s, description = %s, color = %s WHERE id = %s AND user_id = %s RETURNING *' if IS_POSTGRESQL else 'UPDATE tracks SET name = ?, description = ?, color = ? WHERE id = ? AND user_id = ?',
-        (name, description, color, track_id, current_user_id), fetch_one=True
-    )
+    bump_data_version(current_user_id)
+    # Update track (only if it belongs to the user)
+    updated_track, error = versioned_update('tracks', track_id, current_user_id, fields)
+    if error:
+        return error
     
-    if not updated_track:
-        return jsonify({'error': 'Failed to update track'}), 500
+    invalidate_cache(f'tracks:{current_user_id}')
     
-    return jsonify(dict(updated_track))
+    return item_response(updated_track)
 
 @app.route('/api/tracks/<int:track_id>', methods=['DELETE'])
+@query_budget(2)
 @token_required
 def delete_track(current_user_id, track_id):
     """Delete a track and all associated goals and tasks"""
-    # Verify track belongs to user
-    track = execute_query(
-        'SELECT * FROM tracks WHERE id = %s AND user_id = %s' if IS_POSTGRESQL else 'SELECT * FROM tracks WHERE id = ? AND user_id = ?',
-        (track_id, current_user_id), fetch_one=True
-    )
-    
-    if not track:
+    bump_data_version(current_user_id)
+    # Delete track if it belongs to the user (cascade will handle goals and tasks)
+    if not delete_track_record(track_id, current_user_id):
         return jsonify({'error': 'Track not found'}), 404
     
-    # Delete track (cascade will handle goals and tasks)
-    execute_query(
-        'DELETE FROM tracks WHERE id = %s AND user_id = %s' if IS_POSTGRESQL else 'DELETE FROM tracks WHERE id = ? AND user_id = ?',
-        (track_id, current_user_id)
-    )
+    invalidate_cache(f'tracks:{current_user_id}', f'track:{track_id}', f'tree:{current_user_id}')
     
     return jsonify({'message': 'Track deleted successfully'})
 
 # CRUD Operations for Goals
 @app.route('/api/goals', methods=['POST'])
+@query_budget(2)
 @token_required
 def create_goal(current_user_id):
     """Create a new goal"""
     data = request.get_json()
     track_id = data.get('track_id')
-    title = data.get('title')
-    description = data.get('description', '')
-    target_value = data.get('target_value', 1)
-    unit = data.get('unit', 'times')
     
-    if not track_id or not title:
+    if not track_id or not data.get('title'):
         return jsonify({'error': 'Track ID and title are required'}), 400
     
-    # Verify track belongs to user
-    track = execute_query(
-        'SELECT * FROM tracks WHERE id = %s AND user_id = %s' if IS_POSTGRESQL else 'SELECT * FROM tracks WHERE id = ? AND user_id = ?',
-        (track_id, current_user_id), fetch_one=True
-    )
+    fields, error = parse_goal_data(data)
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not track:
+    bump_data_version(current_user_id)
+    # Create goal (only in a track that belongs to the user)
+    goal = insert_goal(track_id, current_user_id, fields)
+    if not goal:
         return jsonify({'error': 'Track not found'}), 404
     
-    # Create goal
-    if IS_POSTGRESQL:
-        goal = execute_query(
-            'INSERT INTO goals (track_id, title, description, target_value, unit) VALUES (%s, %s, %s, %s, %s) RETURNING *',
-            (track_id, title, description, target_value, unit), fetch_one=True
-        )
-    else:
-        execute_query(
-            'INSERT INTO goals (track_id, title, description, target_value, unit) VALUES (?, ?, ?, ?, ?)',
-            (track_id, title, description, target_value, unit)
-        )
-        goal_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-        goal = execute_query('SELECT * FROM goals WHERE id = ?', (goal_id,), fetch_one=True)
+    invalidate_cache(f"goals:{goal['track_id']}", f'tree:{current_user_id}')
     
-    return jsonify(dict(goal)), 201
+    return item_response(goal, 201)
 
 @app.route('/api/goals/<int:goal_id>', methods=['PUT'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
 @token_required
 def update_goal(current_user_id, goal_id):
     """Update a goal"""
-    data = request.get_json()
-    title = data.get('title')
-    description = data.get('description', '')
-    target_value = data.get('target_value', 1)
-    current_value = data.get('current_value', 0)
-    unit = data.get('unit', 'times')
+    fields, error = parse_goal_data(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not title:
-        return jsonify({'error': 'Goal title is required'}), 400
+    bump_data_version(current_user_id)
+    # Update goal (only if it belongs to the user through its track)
+    updated_goal, error = versioned_update('goals', goal_id, current_user_id, fields)
+    if error:
+        return error
     
-    # Verify goal belongs to user (through track)
-    goal = execute_query('''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = %s AND t.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = ? AND t.user_id = ?
-    ''', (goal_id, current_user_id), fetch_one=True)
+    invalidate_cache(f"goals:{updated_goal['track_id']}", f'tree:{current_user_id}')
     
-    if not goal:
-        return jsonify({'error': 'Goal not found'}), 404
+    return item_response(updated_goal)
+
+@app.route('/api/goals/<int:goal_id>', methods=['PATCH'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
+@token_required
+def patch_goal(current_user_id, goal_id):
+    """Update only the goal fields present in the body"""
+    fields, error = parse_patch_data('goals', request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Update goal
-    updated_goal = execute_query(
-        'UPDATE goals SET title = %s, description = %s, target_value = %s, current_value = %s, unit = %s WHERE id = %s RETURNING *' if IS_POSTGRESQL else 'UPDATE goals SET title = ?, description = ?, target_value = ?, current_value = ?, unit = ? WHERE id = ?',
-        (title, description, target_value, current_value, unit, goal_id), fetch_one=True
-    )
+    bump_data_version(current_user_id)
+    # Update goal (only if it belongs to the user through its track)
+    updated_goal, error = versioned_update('goals', goal_id, current_user_id, fields)
+    if error:
+        return error
     
-    if not updated_goal:
-        return jsonify({'error': 'Failed to update goal'}), 500
+    invalidate_cache(f"goals:{updated_goal['track_id']}", f'tree:{current_user_id}')
     
-    return jsonify(dict(updated_goal))
+    return item_response(updated_goal)
 
 @app.route('/api/goals/<int:goal_id>', methods=['DELETE'])
+@query_budget(2)
 @token_required
 def delete_goal(current_user_id, goal_id):
     """Delete a goal and all associated tasks"""
-    # Verify goal belongs to user (through track)
-    goal = execute_query('''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = %s AND t.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = ? AND t.user_id = ?
-    ''', (goal_id, current_user_id), fetch_one=True)
-    
+    bump_data_version(current_user_id)
+    # Delete goal if it belongs to the user (cascade will handle tasks)
+    goal = delete_goal_record(goal_id, current_user_id)
     if not goal:
         return jsonify({'error': 'Goal not found'}), 404
     
-    # Delete goal (cascade will handle tasks)
-    execute_query(
-        'DELETE FROM goals WHERE id = %s' if IS_POSTGRESQL else 'DELETE FROM goals WHERE id = ?',
-        (goal_id,)
-    )
+    invalidate_cache(f"goals:{goal['track_id']}", f'goal:{goal_id}', f'tree:{current_user_id}')
     
     return jsonify({'message': 'Goal deleted successfully'})
 
 # CRUD Operations for Tasks
 @app.route('/api/tasks', methods=['POST'])
+@query_budget(2)
 @token_required
 def create_task(current_user_id):
     """Create a new task"""
     data = request.get_json()
     goal_id = data.get('goal_id')
-    title = data.get('title')
-    description = data.get('description', '')
     
-    if not goal_id or not title:
+    if not goal_id or not data.get('title'):
         return jsonify({'error': 'Goal ID and title are required'}), 400
     
-    # Verify goal belongs to user (through track)
-    goal = execute_query('''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = %s AND t.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT g.* FROM goals g
-        JOIN tracks t ON g.track_id = t.id
-        WHERE g.id = ? AND t.user_id = ?
-    ''', (goal_id, current_user_id), fetch_one=True)
+    fields, error = parse_task_data(data)
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not goal:
+    bump_data_version(current_user_id)
+    # Create task (only in a goal that belongs to the user)
+    task = insert_task(goal_id, current_user_id, fields)
+    if not task:
         return jsonify({'error': 'Goal not found'}), 404
     
-    # Create task
-    if IS_POSTGRESQL:
-        task = execute_query(
-            'INSERT INTO tasks (goal_id, title, description) VALUES (%s, %s, %s) RETURNING *',
-            (goal_id, title, description), fetch_one=True
-        )
-    else:
-        execute_query(
-            'INSERT INTO tasks (goal_id, title, description) VALUES (?, ?, ?)',
-            (goal_id, title, description)
-        )
-        task_id = execute_query('SELECT last_insert_rowid()', fetch_one=True)[0]
-        task = execute_query('SELECT * FROM tasks WHERE id = ?', (task_id,), fetch_one=True)
+    invalidate_cache(f"tasks:{task['goal_id']}", f'tree:{current_user_id}')
     
-    return jsonify(dict(task)), 201
+    return item_response(task, 201)
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
 @token_required
 def update_task(current_user_id, task_id):
     """Update a task"""
-    data = request.get_json()
-    title = data.get('title')
-    description = data.get('description', '')
-    completed = data.get('completed', False)
+    fields, error = parse_task_data(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not title:
-        return jsonify({'error': 'Task title is required'}), 400
-    
-    # Verify task belongs to user (through goal and track)
-    task = execute_query('''
-        SELECT t.* FROM tasks t
-        JOIN goals g ON t.goal_id = g.id
-        JOIN tracks tr ON g.track_id = tr.id
-        WHERE t.id = %s AND tr.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT t.* FROM tasks t
-        JOIN goals g ON t.goal_id = g.id
-        JOIN tracks tr ON g.track_id = tr.id
-        WHERE t.id = ? AND tr.user_id = ?
-    ''', (task_id, current_user_id), fetch_one=True)
+    bump_data_version(current_user_id)
+    # Update task (only if it belongs to the user through its goal and track)
+    updated_task, error = versioned_update('tasks', task_id, current_user_id, fields)
+    if error:
+        return error
     
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
+    invalidate_cache(f"tasks:{updated_task['goal_id']}", f'tree:{current_user_id}')
     
-    # Update task
-    updated_task = execute_query(
-        'UPDATE tasks SET title = %s, description = %s, completed = %s WHERE id = %s RETURNING *' if IS_POSTGRESQL else 'UPDATE tasks SET title = ?, description = ?, completed = ? WHERE id = ?',
-        (title, description, completed, task_id), fetch_one=True
-    )
+    return item_response(updated_task)
+
+@app.route('/api/tasks/<int:task_id>', methods=['PATCH'])
+@query_budget(3)  # The third query only runs when an If-Match update misses
+@token_required
+def patch_task(current_user_id, task_id):
+    """Update only the task fields present in the body"""
+    fields, error = parse_patch_data('tasks', request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    bump_data_version(current_user_id)
+    # Update task (only if it belongs to the user through its goal and track)
+    updated_task, error = versioned_update('tasks', task_id, current_user_id, fields)
+    if error:
+        return error
     
-    if not updated_task:
-        return jsonify({'error': 'Failed to update task'}), 500
+    invalidate_cache(f"tasks:{updated_task['goal_id']}", f'tree:{current_user_id}')
     
-    return jsonify(dict(updated_task))
+    return item_response(updated_task)
 
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@query_budget(2)
 @token_required
 def delete_task(current_user_id, task_id):
     """Delete a task"""
-    # Verify task belongs to user (through goal and track)
-    task = execute_query('''
-        SELECT t.* FROM tasks t
-        JOIN goals g ON t.goal_id = g.id
-        JOIN tracks tr ON g.track_id = tr.id
-        WHERE t.id = %s AND tr.user_id = %s
-    ''' if IS_POSTGRESQL else '''
-        SELECT t.* FROM tasks t
-        JOIN goals g ON t.goal_id = g.id
-        JOIN tracks tr ON g.track_id = tr.id
-        WHERE t.id = ? AND tr.user_id = ?
-    ''', (task_id, current_user_id), fetch_one=True)
-    
+    bump_data_version(current_user_id)
+    # Delete task if it belongs to the user
+    task = delete_task_record(task_id, current_user_id)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
-    # Delete task
-    execute_query(
-        'DELETE FROM tasks WHERE id = %s' if IS_POSTGRESQL else 'DELETE FROM tasks WHERE id = ?',
-        (task_id,)
-    )
+    invalidate_cache(f"tasks:{task['goal_id']}", f'tree:{current_user_id}')
     
     return jsonify({'message': 'Task deleted successfully'})
 
+# Batch Operations
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '500'))
+BATCH_PARENTS = {'goal': ('track', 'track_id'), 'task': ('goal', 'goal_id')}
+
+class BatchError(Exception):
+    """A batch operation that cannot be applied; the whole batch is rolled back"""
+
+    def __init__(self, index, message, status=400):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+        self.status = status
+
+def resolve_batch_ref(value, index, kind, operations):
+    """Return ('ref', n) for a "$n" reference to an earlier create, else ('id', value)"""
+    if isinstance(value, str) and value.startswith('$') and value[1:].isdigit():
+        target = int(value[1:])
+        if target >= index or operations[target].get('action') != 'create' or operations[target].get('type') != kind:
+            raise BatchError(index, f'{value} does not refer to an earlier {kind} create')
+        return 'ref', target
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise BatchError(index, f'{kind} id must be an integer or a "$n" reference')
+    return 'id', value
+
+def plan_batch(operations):
+    """Validate every operation and resolve "$n" references before anything is written"""
+    planned = []
+    
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise BatchError(index, 'Operation must be an object')
+        action = op.get('action')
+        kind = op.get('type')
+        data = op.get('data') or {}
+        if action not in ('create', 'update', 'delete'):
+            raise BatchError(index, 'action must be create, update or delete')
+        if kind not in ('track', 'goal', 'task'):
+            raise BatchError(index, 'type must be track, goal or task')
+        if not isinstance(data, dict):
+            raise BatchError(index, 'data must be an object')
+        
+        fields = None
+        if action != 'delete':
+            parse = {'track': parse_track_data, 'goal': parse_goal_data, 'task': parse_task_data}[kind]
+            fields, error = parse(data)
+            if error:
+                raise BatchError(index, error)
+        
+        if action == 'create':
+            target = None
+            if kind in BATCH_PARENTS:
+                parent_kind, parent_field = BATCH_PARENTS[kind]
+                if data.get(parent_field) is None:
+                    raise BatchError(index, f'{parent_field} is required')
+                target = (parent_kind,) + resolve_batch_ref(data[parent_field], index, parent_kind, operations)
+        else:
+            if op.get('id') is None:
+                raise BatchError(index, 'id is required')
+            target = (kind,) + resolve_batch_ref(op['id'], index, kind, operations)
+        
+        planned.append((action, kind, fields, target))
+    
+    return planned
+
+def apply_batch_operation(user_id, index, operation, created):
+    """Apply one planned operation, returning its per-operation result"""
+    action, kind, fields, target = operation
+    target_id = None
+    if target:
+        target_id = created[target[2]]['id'] if target[1] == 'ref' else target[2]
+    
+    # Ownership is checked by each write's WHERE clause; a miss rolls back the batch
+    if action == 'create':
+        if kind == 'track':
+            row = insert_track(user_id, fields)
+        elif kind == 'goal':
+            row = insert_goal(target_id, user_id, fields)
+        else:
+            row = insert_task(target_id, user_id, fields)
+        if not row:
+            raise BatchError(index, f'{target[0].capitalize()} not found', 404)
+        created[index] = dict(row)
+        return {'status': 201, 'data': created[index]}
+    
+    if action == 'update':
+        if kind == 'track':
+            row = update_track_record(target_id, user_id, fields)
+        elif kind == 'goal':
+            row = update_goal_record(target_id, user_id, fields)
+        else:
+            row = update_task_record(target_id, user_id, fields)
+        if not row:
+            raise BatchError(index, f'{kind.capitalize()} not found', 404)
+        return {'status': 200, 'data': dict(row)}
+    
+    if kind == 'track':
+        row = delete_track_record(target_id, user_id)
+        invalidate_cache(f'track:{target_id}')
+    elif kind == 'goal':
+        row = delete_goal_record(target_id, user_id)
+        invalidate_cache(f'goal:{target_id}')
+    else:
+        row = delete_task_record(target_id, user_id)
+    if not row:
+        raise BatchError(index, f'{kind.capitalize()} not found', 404)
+    return {'status': 200, 'data': {'id': target_id}}
+
+@app.route('/api/batch', methods=['POST'])
+@query_budget(4)  # The three-operation batch in bench/query_budget.py; grows with batch size
+@token_required
+def batch(current_user_id):
+    """Apply several track/goal/task operations in a single transaction
+
+    Body: ``{"operations": [{"action": "create|update|delete", "type":
+    "track|goal|task", "id": ..., "data": {...}}, ...]}``. A parent id such as
+    ``"track_id": "$0"`` refers to the row created by operation 0. Either every
+    operation is applied or, on the first failure, none are.
+    """
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations list is required'}), 400
+    
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+    
+    created = {}
+    results = []
+    try:
+        planned = plan_batch(operations)
+        bump_data_version(current_user_id)
+        for index, operation in enumerate(planned):
+            results.append(apply_batch_operation(current_user_id, index, operation, created))
+        invalidate_cache(f'user:{current_user_id}')
+    except BatchError as e:
+        return jsonify({'error': e.message, 'index': e.index}), e.status
+    except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+        return jsonify({'error': 'Batch violates a data constraint', 'index': len(results)}), 409
+    
+    return jsonify({'results': results})
+
+# Change feed
+# /api/changes returns what changed after a cursor as a keyset range scan over
+# change_log (see migration 8). With ?wait= an empty page is held open until
+# the user writes something: commits in this process wake waiters directly and
+# on PostgreSQL a LISTEN thread relays the trigger's pg_notify from other
+# workers, so an idle long-poll issues no queries. SQLite has no cross-process
+# signal, so there waiters re-check every CHANGES_POLL_INTERVAL seconds.
+CHANGES_MAX_WAIT = float(os.getenv('CHANGES_MAX_WAIT', '0'))
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', '2'))
+CHANGES_RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', '30'))
+CHANGE_TABLES = {entity: table for table, entity in CHANGE_ENTITIES.items()}
+
+class ChangeNotifier:
+    """Per-user wake-ups for long-polling /api/changes requests"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._sequences = {}
+        self._listener = None
+        self.listening = False
+
+    def sequence(self, user_id):
+        """Notification count for the user; read it before checking for changes"""
+        with self._condition:
+            return self._sequences.get(user_id, 0)
+
+    def notify(self, user_id):
+        """Wake every request waiting on the user's changes"""
+        with self._condition:
+            self._sequences[user_id] = self._sequences.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def wait(self, user_id, sequence, timeout):
+        """Block until the user is notified after ``sequence`` or the timeout passes"""
+        if IS_POSTGRESQL:
+            self._start_listener()
+        with self._condition:
+            return self._condition.wait_for(lambda: self._sequences.get(user_id, 0) != sequence, timeout)
+
+    def _start_listener(self):
+        with self._condition:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='change-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """Relay data_changes notifications from PostgreSQL, reconnecting on failure"""
+        while True:
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.autocommit = True
+                conn.cursor().execute('LISTEN data_changes')
+                self.listening = True
+                while True:
+                    if select.select([conn], [], [], 60) != ([], [], []):
+                        conn.poll()
+                        while conn.notifies:
+                            self.notify(int(conn.notifies.pop(0).payload))
+            except Exception as e:
+                print(f"Change listener error: {e}")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+            time.sleep(1)
+
+change_notifier = ChangeNotifier()
+
+def encode_change_cursor(version, entity, entity_id):
+    """Encode a change_log position, stamped with the time it was handed out"""
+    raw = json.dumps([version, entity, entity_id, int(time.time())]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_change_cursor(cursor):
+    """Decode a change cursor into (position, issued_at), raising ValueError if malformed"""
+    try:
+        version, entity, entity_id, issued_at = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if entity not in CHANGE_TABLES and entity != '':
+        raise ValueError('Invalid cursor')
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in (version, entity_id, issued_at)):
+        raise ValueError('Invalid cursor')
+    return (version, entity, entity_id), issued_at
+
+def load_changes(user_id, after, limit):
+    """One page of the user's changes after a (version, entity, entity_id) position
+
+    Returns (changes, has_more). Live entries carry the current row as ``data``;
+    an entry whose row vanished since the log was read is reported as deleted.
+    """
+    query = f'''
+        SELECT entity, entity_id, version, deleted, updated_at FROM change_log
+        WHERE user_id = {PARAM} AND (version, entity, entity_id) > ({PARAM}, {PARAM}, {PARAM})
+        ORDER BY version, entity, entity_id LIMIT {PARAM}
+    '''
+    entries = execute_query(query, (user_id, *after, limit + 1), fetch_all=True)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    
+    rows = {}
+    for entity, table in CHANGE_TABLES.items():
+        ids = [entry['entity_id'] for entry in entries if entry['entity'] == entity and not entry['deleted']]
+        if ids:
+            query = f"SELECT * FROM {table} WHERE id IN ({', '.join([PARAM] * len(ids))})"
+            if table in SOFT_DELETE_TABLES:
+                query += ' AND deleted_at IS NULL'
+            for row in execute_query(query, ids, fetch_all=True):
+                rows[(entity, row['id'])] = dict(row)
+    
+    changes = []
+    for entry in entries:
+        data = rows.get((entry['entity'], entry['entity_id']))
+        changes.append({
+            'type': entry['entity'],
+            'id': entry['entity_id'],
+            'version': entry['version'],
+            'deleted': data is None,
+            'updated_at': entry['updated_at'],
+            'data': data
+        })
+    return changes, has_more
+
+@app.route('/api/changes', methods=['GET'])
+@query_budget(4)
+@token_required
+def get_changes(current_user_id):
+    """Tracks, goals and tasks changed since a cursor: ?since=<cursor>[&limit=n][&wait=seconds]
+
+    Without ``since`` the feed starts from scratch. Follow ``cursor`` while
+    ``has_more`` is true; a cursor older than the tombstone retention gets 410
+    and the client must resync from scratch.
+    """
+    after = (0, '', 0)
+    since = request.args.get('since')
+    if since:
+        try:
+            after, issued_at = decode_change_cursor(since)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if issued_at < time.time() - CHANGES_RETENTION_DAYS * 86400:
+            return jsonify({'error': 'Cursor has expired; resync without since'}), 410
+    
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_SIZE))
+        wait = min(float(request.args.get('wait', 0)), CHANGES_MAX_WAIT)
+    except ValueError:
+        return jsonify({'error': 'limit and wait must be numbers'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    deadline = time.monotonic() + max(wait, 0)
+    sequence = change_notifier.sequence(current_user_id)
+    changes, has_more = load_changes(current_user_id, after, limit)
+    while not changes and time.monotonic() < deadline:
+        # Hold no pooled connection while idle
+        release_request_connection(None)
+        remaining = deadline - time.monotonic()
+        change_notifier.wait(current_user_id, sequence, remaining if change_notifier.listening else min(remaining, CHANGES_POLL_INTERVAL))
+        sequence = change_notifier.sequence(current_user_id)
+        changes, has_more = load_changes(current_user_id, after, limit)
+    
+    if changes:
+        last = changes[-1]
+        after = (last['version'], last['type'], last['id'])
+    return jsonify({'changes': changes, 'cursor': encode_change_cursor(*after), 'has_more': has_more})
+
+def prune_changes():
+    """Delete tombstones older than the retention window and return how many went"""
+    if IS_POSTGRESQL:
+        query = "DELETE FROM change_log WHERE deleted AND updated_at < CURRENT_TIMESTAMP - INTERVAL '1 day' * %s"
+        params = (CHANGES_RETENTION_DAYS,)
+    else:
+        query = "DELETE FROM change_log WHERE deleted AND updated_at < datetime('now', ?)"
+        params = (f'-{CHANGES_RETENTION_DAYS} days',)
+    with db_session(write=True) as conn:
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        trace_query('prune_changes', query, time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor.rowcount
+
+# Recurring goals
+# A goal with a recurrence starts over when its period (a UTC day, week from
+# Monday, or month) ends: current_value goes back to 0 and its tasks are
+# unchecked. reset_due_goals does this for all users with a few set-based
+# statements per chunk of due goals, one short transaction per chunk so live
+# writes are never locked out for long. Chunks are serialized across processes
+# (an advisory lock on PostgreSQL, the write lock on SQLite) and only take goals
+# that are still due, so workers, cron and the CLI can all run it at once
+# without resetting anything twice.
+RECURRENCES = ('daily', 'weekly', 'monthly')
+RECURRENCE_ERROR = f"Recurrence must be null or one of {', '.join(RECURRENCES)}"
+RESET_INTERVAL = float(os.getenv('RESET_INTERVAL', '60'))
+RESET_CHUNK_SIZE = int(os.getenv('RESET_CHUNK_SIZE', '500'))
+# Advisory lock key that serializes reset chunks across processes (PostgreSQL)
+RESET_LOCK_ID = 20251017
+
+def next_reset_boundary(recurrence, now):
+    """Return the start of the period after the one containing now"""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if recurrence == 'daily':
+        return midnight + datetime.timedelta(days=1)
+    if recurrence == 'weekly':
+        return midnight + datetime.timedelta(days=7 - midnight.weekday())
+    return (midnight.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+def db_timestamp(value):
+    """Format a naive UTC datetime as a TIMESTAMP parameter"""
+    return value if IS_POSTGRESQL else value.isoformat(sep=' ')
+
+def next_reset_time(recurrence, now=None):
+    """Return when a goal with this recurrence next resets, as a query parameter, or None"""
+    if recurrence is None:
+        return None
+    return db_timestamp(next_reset_boundary(recurrence, now or datetime.datetime.utcnow()))
+
+def reset_goal_chunk(now, limit):
+    """Reset up to limit goals due at now in one transaction
+
+    Returns how many were reset, or None when another process is resetting.
+    """
+    with db_session(write=True):
+        if IS_POSTGRESQL:
+            if not execute_query('SELECT pg_try_advisory_xact_lock(%s) AS locked', (RESET_LOCK_ID,), fetch_one=True)['locked']:
+                return None
+        else:
+            execute_query('BEGIN IMMEDIATE')
+        due = execute_query(
+            f'''SELECT g.id, t.user_id FROM goals g JOIN tracks t ON g.track_id = t.id
+                WHERE g.next_reset_at <= {PARAM} AND t.deleted_at IS NULL ORDER BY g.next_reset_at LIMIT {PARAM}''',
+            (db_timestamp(now), limit), fetch_all=True
+        )
+        if not due:
+            return 0
+        goal_ids = [row['id'] for row in due]
+        user_ids = sorted({row['user_id'] for row in due})
+        goals = ', '.join([PARAM] * len(goal_ids))
+
+        # Owners first, as bump_data_version does for a single user
+        execute_query(
+            f"UPDATE users SET data_version = data_version + 1, written_at = CURRENT_TIMESTAMP WHERE id IN ({', '.join([PARAM] * len(user_ids))})",
+            user_ids
+        )
+        execute_query(f'UPDATE tasks SET completed = FALSE, version = version + 1 WHERE completed AND goal_id IN ({goals})', goal_ids)
+        periods = ' '.join(f"WHEN '{recurrence}' THEN {PARAM}" for recurrence in RECURRENCES)
+        execute_query(
+            f'''UPDATE goals SET current_value = 0, version = version + 1, next_reset_at = CASE recurrence {periods} END
+                WHERE id IN ({goals}) AND next_reset_at <= {PARAM}''',
+            [*(db_timestamp(next_reset_boundary(recurrence, now)) for recurrence in RECURRENCES), *goal_ids, db_timestamp(now)]
+        )
+
+        def notify():
+            for user_id in user_ids:
+                change_notifier.notify(user_id)
+        on_commit(notify)
+        invalidate_cache(*(f'user:{user_id}' for user_id in user_ids))
+        return len(goal_ids)
+
+def reset_due_goals(now=None, chunk_size=None):
+    """Reset every recurring goal whose period ended by now and return how many were reset
+
+    A goal that missed several periods is reset once and moves on to the
+    period after now.
+    """
+    now = (now or datetime.datetime.utcnow()).replace(microsecond=0)
+    chunk_size = chunk_size or RESET_CHUNK_SIZE
+    total = 0
+    while True:
+        reset = reset_goal_chunk(now, chunk_size)
+        if reset is None:
+            break  # The process holding the lock resets the rest
+        total += reset
+        if reset < chunk_size:
+            break
+    return total
+
+class ResetScheduler:
+    """Runs reset_due_goals every RESET_INTERVAL seconds on a thread in each worker"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.runs = 0
+        self.goals_reset = 0
+        self.failures = 0
+
+    def ensure_running(self):
+        """Start the thread on the first request of each process (threads do not survive a fork)"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='goal-reset-scheduler', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.goals_reset += reset_due_goals()
+                self.runs += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"Recurring goal reset failed: {e}")
+            time.sleep(self.interval)
+
+    def stats(self):
+        """Return run, reset and failure counts for this process"""
+        return {'interval': self.interval, 'runs': self.runs, 'goals_reset': self.goals_reset, 'failures': self.failures}
+
+reset_scheduler = ResetScheduler(RESET_INTERVAL)
+
+@app.before_request
+def start_reset_scheduler():
+    reset_scheduler.ensure_running()
+
+# Purge
+# Tracks and goals marked deleted (see migration 14) are removed in the
+# background, children first, one short transaction per chunk: a chunk marks
+# the goals of deleted tracks, then deletes up to PURGE_CHUNK_SIZE tasks of
+# deleted goals, goals left without tasks and tracks left without goals (with
+# their completion history), so no delete ever cascades. Chunks are serialized across processes like recurring
+# goal resets. On SQLite each run also sweeps the next PURGE_SCAN_SIZE ids of
+# every table for rows whose parent is gone, left behind by deletes made
+# without foreign key enforcement. After a run that removed rows, SQLite hands
+# up to PURGE_VACUUM_PAGES free pages back to the file system (incremental
+# auto-vacuum) and refreshes planner statistics. PostgreSQL, which enforces
+# its foreign keys, leaves dead rows and statistics to autovacuum; only
+# `db purge --full` vacuums there.
+PURGE_INTERVAL = float(os.getenv('PURGE_INTERVAL', '60'))
+PURGE_CHUNK_SIZE = int(os.getenv('PURGE_CHUNK_SIZE', '500'))
+PURGE_SCAN_SIZE = int(os.getenv('PURGE_SCAN_SIZE', '10000'))
+PURGE_VACUUM_PAGES = int(os.getenv('PURGE_VACUUM_PAGES', '2000'))
+# Advisory lock key that serializes purge chunks across processes (PostgreSQL)
+PURGE_LOCK_ID = 20251018
+
+# Ids to delete per table, in order; each query takes the chunk size
+PURGE_QUERIES = {
+    'tasks': f'SELECT tk.id FROM goals g JOIN tasks tk ON tk.goal_id = g.id WHERE g.deleted_at IS NOT NULL LIMIT {PARAM}',
+    'goals': f"""SELECT g.id, t.user_id FROM goals g JOIN tracks t ON t.id = g.track_id WHERE g.deleted_at IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM tasks WHERE tasks.goal_id = g.id) LIMIT {PARAM}""",
+    'tracks': f"""SELECT id, user_id FROM tracks WHERE deleted_at IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM goals WHERE goals.track_id = tracks.id) LIMIT {PARAM}"""
+}
+# Per-track completion history (see Stats), deleted with each purged track
+PURGE_HISTORY_TABLES = ('completion_events', 'completion_days')
+# Completion history purged with each table, by the column naming its rows. A
+# goal's daily counts already left completion_days when it was marked deleted.
+PURGE_HISTORY = {'goals': ('goal_id', ('completion_events',)), 'tracks': ('track_id', PURGE_HISTORY_TABLES)}
+# Parent of each table, in the order orphans are swept
+ORPHAN_PARENTS = {'tracks': ('user_id', 'users'), 'goals': ('track_id', 'tracks'), 'tasks': ('goal_id', 'goals')}
+
+def purge_chunk(limit):
+    """Purge up to limit rows per table in one transaction
+
+    Returns the goals marked and rows deleted per table, or None when another
+    process is purging.
+    """
+    with db_session(write=True):
+        if IS_POSTGRESQL:
+            if not execute_query('SELECT pg_try_advisory_xact_lock(%s) AS locked', (PURGE_LOCK_ID,), fetch_one=True)['locked']:
+                return None
+        else:
+            execute_query('BEGIN IMMEDIATE')
+        counts = {}
+        goal_ids = [row['id'] for row in execute_query(
+            f'''SELECT g.id FROM tracks t JOIN goals g ON g.track_id = t.id
+                WHERE t.deleted_at IS NOT NULL AND g.deleted_at IS NULL LIMIT {PARAM}''',
+            (limit,), fetch_all=True
+        )]
+        if goal_ids:
+            execute_query(
+                f"UPDATE goals SET deleted_at = CURRENT_TIMESTAMP, next_reset_at = NULL WHERE id IN ({', '.join([PARAM] * len(goal_ids))})",
+                goal_ids
+            )
+        counts['marked'] = len(goal_ids)
+        for table, query in PURGE_QUERIES.items():
+            rows = execute_query(query, (limit,), fetch_all=True)
+            ids = [row['id'] for row in rows]
+            if ids and table in PURGE_HISTORY:
+                # Completion history has no foreign keys; it goes with its goal or track
+                column, histories = PURGE_HISTORY[table]
+                users = sorted({row['user_id'] for row in rows})
+                for history in histories:
+                    execute_query(
+                        f"DELETE FROM {history} WHERE user_id IN ({', '.join([PARAM] * len(users))}) AND {column} IN ({', '.join([PARAM] * len(ids))})",
+                        users + ids
+                    )
+            if ids:
+                execute_query(f"DELETE FROM {table} WHERE id IN ({', '.join([PARAM] * len(ids))})", ids)
+            counts[table] = len(ids)
+        return counts
+
+def purge_deleted(chunk_size=None):
+    """Remove every track and goal marked deleted with everything below them
+
+    Returns the rows deleted per table.
+    """
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    totals = dict.fromkeys(PURGE_QUERIES, 0)
+    while True:
+        counts = purge_chunk(chunk_size)
+        if counts is None:
+            break  # The process holding the lock purges the rest
+        for table in totals:
+            totals[table] += counts[table]
+        # A step that stopped short of the limit found everything it could
+        if all(count < chunk_size for count in counts.values()):
+            break
+    return totals
+
+def purge_orphans(table, after, scan_size):
+    """Delete the SQLite rows of table whose parent is gone among ids after..after + scan_size
+
+    Returns (rows deleted, id the next sweep starts after: 0 past the end of the table).
+    """
+    column, parent = ORPHAN_PARENTS[table]
+    with db_session(write=True):
+        execute_query('BEGIN IMMEDIATE')
+        ids = [row['id'] for row in execute_query(
+            f'''SELECT id FROM {table} WHERE id > ? AND id <= ?
+                AND NOT EXISTS (SELECT 1 FROM {parent} WHERE {parent}.id = {table}.{column})''',
+            (after, after + scan_size), fetch_all=True
+        )]
+        if ids:
+            execute_query(f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        more = execute_query(f'SELECT 1 AS more FROM {table} WHERE id > ? LIMIT 1', (after + scan_size,), fetch_one=True)
+    return len(ids), after + scan_size if more else 0
+
+def compact_database(full=False):
+    """Return freed space and refresh planner statistics after a purge
+
+    full rewrites the whole database instead (SQLite VACUUM, which also turns
+    on incremental auto-vacuum for files created without it, or PostgreSQL
+    VACUUM FULL); both lock it for the duration. Without full this does
+    nothing on PostgreSQL, where autovacuum already covers the purged tables
+    and a manual VACUUM from every worker would only duplicate it.
+    """
+    if IS_POSTGRESQL and not full:
+        return
+    conn = get_db_connection()
+    try:
+        if IS_POSTGRESQL:
+            # VACUUM cannot run inside a transaction block
+            conn.autocommit = True
+            conn.cursor().execute('VACUUM (FULL, ANALYZE) tasks, goals, tracks')
+        else:
+            conn.isolation_level = None
+            if full:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                # Each step frees one page; executescript steps it to the end
+                conn.executescript(f'PRAGMA incremental_vacuum({PURGE_VACUUM_PAGES})')
+            conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+class Purger:
+    """Purges deleted rows, sweeps orphans and compacts every PURGE_INTERVAL seconds on a thread in each worker"""
+
+    def __init__(self, interval, scan_size):
+        self.interval = interval
+        self.scan_size = scan_size
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sweep_after = dict.fromkeys(ORPHAN_PARENTS, 0)
+        self.runs = 0
+        self.rows_purged = 0
+        self.orphans_purged = 0
+        self.failures = 0
+
+    def ensure_running(self):
+        """Start the thread on the first request of each process (threads do not survive a fork)"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='purger', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                self.failures += 1
+                print(f"Purge failed: {e}")
+            time.sleep(self.interval)
+
+    def run(self):
+        """One purge, one window of the orphan sweep and, if anything went, compaction"""
+        purged = sum(purge_deleted().values())
+        orphans = 0
+        if not IS_POSTGRESQL:
+            for table in ORPHAN_PARENTS:
+                deleted, self._sweep_after[table] = purge_orphans(table, self._sweep_after[table], self.scan_size)
+                orphans += deleted
+        if purged or orphans:
+            compact_database()
+        self.rows_purged += purged
+        self.orphans_purged += orphans
+        self.runs += 1
+
+    def stats(self):
+        """Return run, purge and failure counts for this process"""
+        return {'interval': self.interval, 'runs': self.runs, 'rows_purged': self.rows_purged,
+                'orphans_purged': self.orphans_purged, 'failures': self.failures}
+
+purger = Purger(PURGE_INTERVAL, PURGE_SCAN_SIZE)
+
+@app.before_request
+def start_purger():
+    purger.ensure_running()
+
+# Search
+# Ranked, prefix-matching full-text search over the indexes of migration 7.
+# Every word of the query must match (as a word prefix) in the title or the
+# description; titles weigh more than descriptions. One UNION ALL query covers
+# all requested types and only ever reads the caller's rows; every hit is
+# joined back through goals and tracks so rows without a live parent drop out.
+SEARCH_MAX_TERMS = 8
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_TYPES = {'track': 'tracks', 'goal': 'goals', 'task': 'tasks'}
+
+SQLITE_SEARCH_QUERIES = {
+    'track': '''
+        SELECT 'track' AS type, tracks.id AS id, tracks.name AS title, tracks.id AS track_id, NULL AS goal_id,
+               -bm25(tracks_fts, 0.0, 10.0, 1.0) AS rank
+        FROM tracks_fts JOIN tracks ON tracks.id = tracks_fts.rowid
+        WHERE tracks_fts MATCH ? AND tracks.deleted_at IS NULL''',
+    'goal': '''
+        SELECT 'goal' AS type, goals.id AS id, goals.title, goals.track_id, NULL AS goal_id,
+               -bm25(goals_fts, 0.0, 10.0, 1.0) AS rank
+        FROM goals_fts JOIN goals ON goals.id = goals_fts.rowid JOIN tracks ON tracks.id = goals.track_id
+        WHERE goals_fts MATCH ? AND goals.deleted_at IS NULL AND tracks.deleted_at IS NULL''',
+    'task': '''
+        SELECT 'task' AS type, tasks.id AS id, tasks.title, goals.track_id, tasks.goal_id,
+               -bm25(tasks_fts, 0.0, 10.0, 1.0) AS rank
+        FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid JOIN goals ON goals.id = tasks.goal_id
+        JOIN tracks ON tracks.id = goals.track_id
+        WHERE tasks_fts MATCH ? AND goals.deleted_at IS NULL AND tracks.deleted_at IS NULL'''
+}
+
+POSTGRES_SEARCH_QUERIES = {
+    # The tsquery is inlined (not a FROM item) so the planner can weigh its
+    # selectivity and pick between the GIN index and the user's own rows
+    'track': f'''
+        SELECT 'track' AS type, k.id AS id, k.name AS title, k.id AS track_id, NULL::integer AS goal_id,
+               ts_rank({search_document('tracks', 'k')}, to_tsquery('simple', %s)) AS rank
+        FROM tracks k
+        WHERE {search_document('tracks', 'k')} @@ to_tsquery('simple', %s) AND k.user_id = %s AND k.deleted_at IS NULL''',
+    'goal': f'''
+        SELECT 'goal' AS type, g.id AS id, g.title, g.track_id, NULL::integer AS goal_id,
+               ts_rank({search_document('goals', 'g')}, to_tsquery('simple', %s)) AS rank
+        FROM goals g JOIN tracks k ON k.id = g.track_id
+        WHERE {search_document('goals', 'g')} @@ to_tsquery('simple', %s) AND k.user_id = %s AND g.deleted_at IS NULL AND k.deleted_at IS NULL''',
+    'task': f'''
+        SELECT 'task' AS type, x.id AS id, x.title, g.track_id, x.goal_id,
+               ts_rank({search_document('tasks', 'x')}, to_tsquery('simple', %s)) AS rank
+        FROM tasks x JOIN goals g ON g.id = x.goal_id JOIN tracks k ON k.id = g.track_id
+        WHERE {search_document('tasks', 'x')} @@ to_tsquery('simple', %s) AND k.user_id = %s AND g.deleted_at IS NULL AND k.deleted_at IS NULL'''
+}
+
+def search_terms(text):
+    """Lower-cased words of a search string; punctuation and operators are dropped"""
+    return re.findall(r'\w+', text.lower())[:SEARCH_MAX_TERMS]
+
+def search_records(user_id, terms, types, limit):
+    """Best-ranked matches of every term (as a prefix) among the user's records of the given types"""
+    if IS_POSTGRESQL:
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        branches = [POSTGRES_SEARCH_QUERIES[kind] for kind in types]
+        params = [value for _ in types for value in (tsquery, tsquery, user_id)]
+    else:
+        match = f'owner:u{user_id} AND {{title body}} : (' + ' AND '.join(f'"{term}"*' for term in terms) + ')'
+        branches = [SQLITE_SEARCH_QUERIES[kind] for kind in types]
+        params = [match] * len(types)
+    
+    query = ' UNION ALL '.join(branches) + f' ORDER BY rank DESC, type, id LIMIT {PARAM}'
+    rows = execute_query(query, params + [limit], fetch_all=True)
+    return [{key: row[key] for key in ('type', 'id', 'title', 'track_id', 'goal_id')} for row in rows]
+
+@app.route('/api/search', methods=['GET'])
+@query_budget(3, connections=3)  # Version lookups on the primary and on a read replica if any, the rest on the replica (the primary again if it is behind)
+@token_required
+@conditional_get
+@read_only
+def search(current_user_id):
+    """Search the user's tracks, goals and tasks: ?q=words[&type=track,goal,task][&limit=n]"""
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    
+    types = request.args.get('type')
+    types = [kind.strip() for kind in types.split(',')] if types else list(SEARCH_TYPES)
+    if any(kind not in SEARCH_TYPES for kind in types):
+        return jsonify({'error': 'type must be a comma-separated list of track, goal and task'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {SEARCH_MAX_LIMIT}'}), 400
+    
+    return jsonify({'items': search_records(current_user_id, terms, list(dict.fromkeys(types)), limit)})
+
+# Stats
+# Streaks, weekly counts and heatmaps from the completion history of migration
+# 12. Every route is one range scan over a primary key: completion_events for a
+# goal, otherwise the completion_days rollup, which holds at most one row per
+# track per day, so years of history stay a few thousand index entries. Only
+# tracks and goals that are not marked deleted count: a deleted goal's
+# completions leave the rollup when it is marked (migration 16), and the purger
+# drops the history of both along with them. Days are UTC. Results are cached per day because streaks and windows move with
+# the date even when nothing is written.
+STATS_DEFAULT_WEEKS = 12
+STATS_MAX_WEEKS = 520
+STATS_DEFAULT_DAYS = 365
+STATS_MAX_DAYS = 3660
+SQL_WEEK_START = "date_trunc('week', day::timestamp)::date" if IS_POSTGRESQL else "date(day, 'weekday 0', '-6 days')"
+# The user's live tracks, checked against the history's track_id
+STATS_LIVE_TRACKS = f'track_id IN (SELECT id FROM tracks WHERE user_id = {PARAM} AND deleted_at IS NULL)'
+# The live goal, checked against completion_events (completion_days has no goal)
+STATS_LIVE_GOAL = f'goal_id IN (SELECT id FROM goals WHERE id = {PARAM} AND deleted_at IS NULL)'
+
+def as_date(value):
+    """Return a DATE column value as a date (SQLite stores ISO strings)"""
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+def db_date(value):
+    """Format a date as a DATE parameter"""
+    return value if IS_POSTGRESQL else value.isoformat()
+
+def stats_scope(user_id):
+    """Pick the history a stats route reads from ?goal_id= or ?track_id=, returning (scope, error response)
+
+    A goal or track that is deleted or not the user's is a 404, as on every
+    other route that takes one.
+    """
+    goal_id = request.args.get('goal_id')
+    track_id = request.args.get('track_id')
+    if goal_id and track_id:
+        return None, (jsonify({'error': 'Pass goal_id or track_id, not both'}), 400)
+    try:
+        goal_id = int(goal_id) if goal_id else None
+        track_id = int(track_id) if track_id else None
+    except ValueError:
+        return None, (jsonify({'error': 'goal_id and track_id must be integers'}), 400)
+    if goal_id is not None:
+        if goal_owner(goal_id)[0] != user_id:
+            return None, (jsonify({'error': 'Goal not found'}), 404)
+        return {'key': f'goal:{goal_id}', 'table': 'completion_events', 'count': 'COUNT(*)',
+                'condition': f'user_id = {PARAM} AND goal_id = {PARAM} AND {STATS_LIVE_GOAL} AND {STATS_LIVE_TRACKS}',
+                'params': (user_id, goal_id, goal_id, user_id)}, None
+    if track_id is not None:
+        if track_owner(track_id) != user_id:
+            return None, (jsonify({'error': 'Track not found'}), 404)
+        return {'key': f'track:{track_id}', 'table': 'completion_days', 'count': 'SUM(completions)',
+                'condition': f'user_id = {PARAM} AND track_id = {PARAM} AND {STATS_LIVE_TRACKS}',
+                'params': (user_id, track_id, user_id)}, None
+    return {'key': 'all', 'table': 'completion_days', 'count': 'SUM(completions)',
+            'condition': f'user_id = {PARAM} AND {STATS_LIVE_TRACKS}', 'params': (user_id, user_id)}, None
+
+def stats_window(name, default, maximum):
+    """Parse a window length argument, returning (value, error)"""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        return None, f'{name} must be an integer'
+    if not 1 <= value <= maximum:
+        return None, f'{name} must be between 1 and {maximum}'
+    return value, None
+
+def cached_stats(kind, user_id, scope, window, loader):
+    """Cache a stats result until the user's next task write or the end of the UTC day"""
+    today = datetime.datetime.utcnow().date()
+    key = f"stats:{kind}:{user_id}:{scope['key']}:{window}:{today}"
+    return cached(key, [f'user:{user_id}', f'tree:{user_id}'], lambda: loader(today))
+
+def completion_streaks(days, today):
+    """Current and longest runs of consecutive days in an ascending list of dates
+
+    The current streak is still alive when its last day is today or yesterday.
+    """
+    longest, longest_end, run, previous = 0, None, 0, None
+    for day in days:
+        run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+        if run > longest:
+            longest, longest_end = run, day
+        previous = day
+    return {
+        'current': run if previous is not None and (today - previous).days <= 1 else 0,
+        'longest': longest,
+        'longest_end': longest_end.isoformat() if longest_end else None,
+        'last_day': previous.isoformat() if previous else None,
+        'active_days': len(days)
+    }
+
+@app.route('/api/stats/streaks', methods=['GET'])
+@query_budget(3)  # Ownership of a ?goal_id= (goal, then its track) or ?track_id=, then the history
+@token_required
+def get_streak_stats(current_user_id):
+    """Current and longest streak of days with a completed task: ?goal_id= or ?track_id= narrows it"""
+    scope, error = stats_scope(current_user_id)
+    if error:
+        return error
+
+    def load(today):
+        rows = execute_query(
+            f"SELECT day FROM {scope['table']} WHERE {scope['condition']} GROUP BY day ORDER BY day",
+            scope['params'], fetch_all=True
+        )
+        return completion_streaks([as_date(row['day']) for row in rows], today)
+
+    return jsonify(cached_stats('streaks', current_user_id, scope, None, load))
+
+@app.route('/api/stats/weekly', methods=['GET'])
+@query_budget(3)  # Ownership of a ?goal_id= (goal, then its track) or ?track_id=, then the history
+@token_required
+def get_weekly_stats(current_user_id):
+    """Completions per week (from Monday), oldest first: ?weeks=n[&goal_id= or &track_id=]"""
+    scope, error = stats_scope(current_user_id)
+    if error:
+        return error
+    weeks, error = stats_window('weeks', STATS_DEFAULT_WEEKS, STATS_MAX_WEEKS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    def load(today):
+        first = today - datetime.timedelta(days=today.weekday(), weeks=weeks - 1)
+        rows = execute_query(
+            f'''SELECT {SQL_WEEK_START} AS week, {scope['count']} AS completions FROM {scope['table']}
+                WHERE {scope['condition']} AND day >= {PARAM} GROUP BY week''',
+            (*scope['params'], db_date(first)), fetch_all=True
+        )
+        counts = {as_date(row['week']): row['completions'] for row in rows}
+        starts = [first + datetime.timedelta(weeks=week) for week in range(weeks)]
+        return {'weeks': [{'week': start.isoformat(), 'completions': counts.get(start, 0)} for start in starts]}
+
+    return jsonify(cached_stats('weekly', current_user_id, scope, weeks, load))
+
+@app.route('/api/stats/heatmap', methods=['GET'])
+@query_budget(3)  # Ownership of a ?goal_id= (goal, then its track) or ?track_id=, then the history
+@token_required
+def get_heatmap_stats(current_user_id):
+    """Completions per track per day over the last ?days=n days: ?goal_id= or ?track_id= narrows it"""
+    scope, error = stats_scope(current_user_id)
+    if error:
+        return error
+    days, error = stats_window('days', STATS_DEFAULT_DAYS, STATS_MAX_DAYS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    def load(today):
+        first = today - datetime.timedelta(days=days - 1)
+        rows = execute_query(
+            f'''SELECT track_id, day, {scope['count']} AS completions FROM {scope['table']}
+                WHERE {scope['condition']} AND day >= {PARAM} GROUP BY track_id, day ORDER BY track_id, day''',
+            (*scope['params'], db_date(first)), fetch_all=True
+        )
+        tracks = {}
+        for row in rows:
+            track = tracks.setdefault(row['track_id'], {'track_id': row['track_id'], 'total': 0, 'days': {}})
+            track['days'][as_date(row['day']).isoformat()] = row['completions']
+            track['total'] += row['completions']
+        return {'from': first.isoformat(), 'to': today.isoformat(), 'tracks': list(tracks.values())}
+
+    return jsonify(cached_stats('heatmap', current_user_id, scope, days, load))
+
+# Import / Export
+# A user's data as NDJSON: a header line, then tracks, goals and tasks, parents
+# before children. Export streams from server-side cursors; import bulk-loads
+# with COPY (PostgreSQL) or chunked executemany (SQLite) in one transaction and
+# remaps every id, so a file can be imported into any account.
+EXPORT_FORMAT = 'task-manager-ndjson'
+EXPORT_VERSION = 1
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '2000'))
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+# Uploads are read into memory up to this many bytes, then into a temporary file
+IMPORT_SPOOL_SIZE = int(os.getenv('IMPORT_SPOOL_SIZE', str(8 * 1024 * 1024)))
+EXPORT_QUERIES = (
+    ('track', 'SELECT id, name, description, color, created_at FROM tracks WHERE user_id = {p} AND deleted_at IS NULL ORDER BY id'),
+    ('goal', '''
+        SELECT g.id, g.track_id, g.title, g.description, g.target_value, g.current_value, g.unit, g.recurrence, g.created_at
+        FROM goals g JOIN tracks t ON g.track_id = t.id
+        WHERE t.user_id = {p} AND t.deleted_at IS NULL AND g.deleted_at IS NULL ORDER BY g.id
+    '''),
+    ('task', '''
+        SELECT tk.id, tk.goal_id, tk.title, tk.description, tk.completed, tk.created_at
+        FROM tasks tk JOIN goals g ON tk.goal_id = g.id JOIN tracks t ON g.track_id = t.id
+        WHERE t.user_id = {p} AND t.deleted_at IS NULL AND g.deleted_at IS NULL ORDER BY tk.id
+    '''),
+)
+IMPORT_COLUMNS = {
+    'tracks': ('id', 'user_id', 'name', 'description', 'color', 'created_at'),
+    'goals': ('id', 'track_id', 'title', 'description', 'target_value', 'current_value', 'unit', 'recurrence', 'next_reset_at', 'created_at'),
+    'tasks': ('id', 'goal_id', 'title', 'description', 'completed', 'created_at'),
+}
+# Child tables are only flushed after their parents, so foreign keys resolve
+IMPORT_PARENTS = {'tracks': (), 'goals': ('tracks',), 'tasks': ('tracks', 'goals')}
+
+class DataImportError(Exception):
+    """An import line that cannot be loaded; the whole import is rolled back"""
+
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+        self.message = message
+
+def ndjson_line(record):
+    return json.dumps(record, default=str) + '\n'
+
+def export_user_data(user_id):
+    """Yield a user's data as NDJSON chunks without loading it all into memory
+
+    Uses its own pooled connection and a single snapshot, so it can keep
+    streaming after the request's own transaction has finished.
+    """
+    conn = db_pool.getconn()
+    try:
+        if IS_POSTGRESQL:
+            conn.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        elif not conn.in_transaction:
+            conn.execute('BEGIN')
+        yield ndjson_line({'type': 'header', 'format': EXPORT_FORMAT, 'version': EXPORT_VERSION,
+                           'exported_at': datetime.datetime.utcnow().isoformat() + 'Z'})
+        
+        for kind, query in EXPORT_QUERIES:
+            query = query.format(p=PARAM)
+            if IS_POSTGRESQL:
+                cursor = conn.cursor(name=f'export_{kind}', cursor_factory=RealDictCursor)
+            else:
+                cursor = conn.cursor()
+            started = time.perf_counter()
+            cursor.execute(query, (user_id,))
+            elapsed = time.perf_counter() - started
+            rows = 0
+            while True:
+                started = time.perf_counter()
+                batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                elapsed += time.perf_counter() - started
+                if not batch:
+                    break
+                rows += len(batch)
+                records = [{'type': kind, **row} for row in batch]
+                if kind == 'task':
+                    for record in records:
+                        record['completed'] = bool(record['completed'])
+                yield ''.join(ndjson_line(record) for record in records)
+            cursor.close()
+            trace_query(f'export_user_data:{kind}', query, elapsed, rows)
+    finally:
+        conn.rollback()
+        db_pool.putconn(conn)
+
+def parse_import_timestamp(value, line):
+    if value is None:
+        return datetime.datetime.utcnow().replace(microsecond=0)
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise DataImportError(line, f'Invalid created_at: {value!r}')
+
+def copy_text_value(value):
+    """Format one value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+class BulkLoader:
+    """Buffers imported rows per table and inserts them in chunks with pre-allocated ids"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.buffers = {table: [] for table in IMPORT_COLUMNS}
+        self.free_ids = {table: [] for table in IMPORT_COLUMNS}
+        self.next_ids = {}
+        self.counts = {table: 0 for table in IMPORT_COLUMNS}
+
+    def allocate_id(self, table):
+        """New ids come from the table's sequence, so they are never reused"""
+        if IS_POSTGRESQL:
+            if not self.free_ids[table]:
+                query = 'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)'
+                started = time.perf_counter()
+                self.cursor.execute(query, (table, 'id', IMPORT_CHUNK_SIZE))
+                self.free_ids[table] = [row[0] for row in reversed(self.cursor.fetchall())]
+                trace_query(f'allocate_id:{table}', query, time.perf_counter() - started, IMPORT_CHUNK_SIZE)
+            return self.free_ids[table].pop()
+        if table not in self.next_ids:
+            # The caller already holds SQLite's write lock, so no other writer can take these ids
+            query = f'SELECT MAX(COALESCE((SELECT MAX(id) FROM {table}), 0), COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0))'
+            started = time.perf_counter()
+            self.cursor.execute(query, (table,))
+            self.next_ids[table] = self.cursor.fetchone()[0] + 1
+            trace_query(f'allocate_id:{table}', query, time.perf_counter() - started, 1)
+        self.next_ids[table] += 1
+        return self.next_ids[table] - 1
+
+    def add(self, table, values):
+        """Queue a row (without its id) and return the id it will be inserted with"""
+        row_id = self.allocate_id(table)
+        self.buffers[table].append((row_id,) + values)
+        if len(self.buffers[table]) >= IMPORT_CHUNK_SIZE:
+            self.flush(table)
+        return row_id
+
+    def flush(self, table):
+        for parent in IMPORT_PARENTS[table]:
+            self.flush(parent)
+        rows = self.buffers[table]
+        if not rows:
+            return
+        columns = ', '.join(IMPORT_COLUMNS[table])
+        started = time.perf_counter()
+        if IS_POSTGRESQL:
+            query = f'COPY {table} ({columns}) FROM STDIN'
+            data = io.StringIO(''.join('\t'.join(copy_text_value(value) for value in row) + '\n' for row in rows))
+            self.cursor.copy_expert(query, data)
+        else:
+            query = f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' for _ in IMPORT_COLUMNS[table])})"
+            self.cursor.executemany(query, rows)
+        trace_query(f'bulk_load:{table}', query, time.perf_counter() - started, len(rows))
+        self.counts[table] += len(rows)
+        self.buffers[table] = []
+
+    def flush_all(self):
+        self.flush('tasks')
+
+def import_id(record, key, line_number):
+    """Return an id a record refers to by, None when absent, raising DataImportError unless it is an integer"""
+    value = record.get(key)
+    # bool is an int subclass, but true is not an id
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+        raise DataImportError(line_number, f'{key} must be an integer')
+    return value
+
+def import_records(lines):
+    """Parse and validate NDJSON lines (or parsed records), yielding (kind, record, fields, created_at)
+
+    Checks everything an import can check without the database, including
+    that every parent comes earlier in the file, and raises DataImportError
+    for the first bad line.
+    """
+    track_ids = set()
+    goal_ids = set()
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, dict):
+            record = line  # Already parsed, e.g. SAMPLE_DATA
+        else:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise DataImportError(line_number, 'Line is not valid JSON')
+        if not isinstance(record, dict):
+            raise DataImportError(line_number, 'Line must be a JSON object')
+        
+        kind = record.get('type')
+        if kind == 'header':
+            if record.get('format') != EXPORT_FORMAT or record.get('version') != EXPORT_VERSION:
+                raise DataImportError(line_number, f'Unsupported format; expected {EXPORT_FORMAT} version {EXPORT_VERSION}')
+            continue
+        if kind not in ('track', 'goal', 'task'):
+            raise DataImportError(line_number, 'type must be header, track, goal or task')
+        
+        parse = {'track': parse_track_data, 'goal': parse_goal_data, 'task': parse_task_data}[kind]
+        fields, error = parse(record)
+        if error:
+            raise DataImportError(line_number, error)
+        created_at = parse_import_timestamp(record.get('created_at'), line_number)
+        if not IS_POSTGRESQL:
+            created_at = created_at.isoformat(sep=' ')
+        
+        if kind == 'track':
+            if import_id(record, 'id', line_number) is not None:
+                track_ids.add(record['id'])
+        elif kind == 'goal':
+            if import_id(record, 'track_id', line_number) not in track_ids:
+                raise DataImportError(line_number, 'track_id must refer to a track earlier in the file')
+            if import_id(record, 'id', line_number) is not None:
+                goal_ids.add(record['id'])
+        elif import_id(record, 'goal_id', line_number) not in goal_ids:
+            raise DataImportError(line_number, 'goal_id must refer to a goal earlier in the file')
+        yield kind, record, fields, created_at
+
+def spool_import(stream):
+    """Read and validate a whole upload into a spool before anything is written
+
+    An import holds the write lock (on SQLite, the process's shared write
+    connection) for its whole transaction, so that must never wait on a slow
+    client. Up to IMPORT_SPOOL_SIZE bytes stay in memory, the rest goes to a
+    temporary file; the caller closes the spool.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    
+    def copy():
+        for line in stream:
+            spool.write(line)
+            yield line
+    
+    try:
+        for _ in import_records(copy()):
+            pass
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+def import_user_data(user_id, lines):
+    """Bulk-load NDJSON lines (or parsed records) into user_id's account, returning counts per table
+
+    Runs in the current transaction (the request's, or its own db_session
+    outside a request); on DataImportError nothing is written.
+    """
+    track_ids = {}
+    goal_ids = {}
+    with db_session(write=True) as conn:
+        # Taking the write lock first keeps the SQLite id allocation race free
+        bump_data_version(user_id)
+        loader = BulkLoader(conn.cursor())
+        for kind, record, fields, created_at in import_records(lines):
+            if kind == 'track':
+                new_id = loader.add('tracks', (user_id, fields['name'], fields['description'], fields['color'], created_at))
+                if record.get('id') is not None:
+                    track_ids[record['id']] = new_id
+            elif kind == 'goal':
+                new_id = loader.add('goals', (track_ids[record['track_id']], fields['title'], fields['description'],
+                                              fields['target_value'], fields['current_value'], fields['unit'],
+                                              fields.get('recurrence'), fields.get('next_reset_at'), created_at))
+                if record.get('id') is not None:
+                    goal_ids[record['id']] = new_id
+            else:
+                loader.add('tasks', (goal_ids[record['goal_id']], fields['title'], fields['description'],
+                                     fields['completed'], created_at))
+        loader.flush_all()
+    
+    invalidate_cache(f'user:{user_id}')
+    return {table: count for table, count in loader.counts.items()}
+
+@app.route('/api/export', methods=['GET'])
+@query_budget(3, connections=2)  # Export queries run on their own connection while streaming
+@token_required
+def export_data(current_user_id):
+    """Stream the current user's tracks, goals and tasks as NDJSON"""
+    return Response(
+        stream_with_context(export_user_data(current_user_id)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=task-manager-export.ndjson', 'Cache-Control': 'no-store'}
+    )
+
+@app.route('/api/import', methods=['POST'])
+@query_budget(8)  # The three-line import in bench/query_budget.py; grows with file size
+@token_required
+def import_data(current_user_id):
+    """Add the tracks, goals and tasks from an NDJSON export to the current user"""
+    try:
+        with spool_import(request.stream) as spool:
+            counts = import_user_data(current_user_id, spool)
+    except DataImportError as e:
+        return jsonify({'error': e.message, 'line': e.line}), 400
+    except (psycopg2.DataError, psycopg2.IntegrityError, sqlite3.IntegrityError):
+        return jsonify({'error': 'Import violates a data constraint'}), 400
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Import must be UTF-8 encoded'}), 400
+    
+    return jsonify({'imported': counts}), 201
+
+@app.route('/api/health', methods=['GET'])
+@query_budget(0, connections=0)
+def health():
+    """Health check with connection pool, cache and auth pool statistics"""
+    return jsonify({
+        'status': 'ok',
+        'db_pool': db_pool.stats(),
+        'db_writer': db_writer.stats() if db_writer is not None else None,
+        'cache': read_cache.stats(),
+        'password_pool': password_hasher.stats(),
+        'token_cache': token_cache.stats(),
+        'reset_scheduler': reset_scheduler.stats(),
+        'purger': purger.stats(),
+        'read_replicas': read_replicas.health()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+@query_budget(0, connections=0)
+def metrics_endpoint():
+    """Prometheus metrics merged across all workers"""
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Metrics token is missing or invalid'}), 401
+    response = make_response(metrics.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
 # Frontend Routes
+# Static assets are loaded once at startup into an in-memory manifest with
+# precompressed gzip/brotli variants, so requests never stat or read files.
+STATIC_FOLDER = os.path.join(app.root_path, 'static')
+HASHED_ASSET_PATTERN = re.compile(r'-[0-9A-Za-z_]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon')
+
+def build_static_manifest(folder):
+    """Read every file under folder into {relative path: asset} with compressed variants"""
+    manifest = {}
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            full_path = os.path.join(root, filename)
+            path = os.path.relpath(full_path, folder).replace(os.sep, '/')
+            with open(full_path, 'rb') as f:
+                body = f.read()
+            
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            if HASHED_ASSET_PATTERN.search(filename):
+                cache_control = 'public, max-age=31536000, immutable'
+            elif path == 'index.html':
+                cache_control = 'no-cache'
+            else:
+                cache_control = 'public, max-age=3600'
+            
+            variants = {'identity': body}
+            if mimetype.startswith(COMPRESSIBLE_TYPES) and len(body) > 256:
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(compressed) < len(body) * 0.9:
+                    variants['gzip'] = compressed
+                if brotli is not None:
+                    compressed = brotli.compress(body, quality=11)
+                    if len(compressed) < len(body) * 0.9:
+                        variants['br'] = compressed
+            
+            manifest[path] = {
+                'variants': variants,
+                'etag': hashlib.sha256(body).hexdigest()[:32],
+                'mimetype': mimetype,
+                'cache_control': cache_control
+            }
+    return manifest
+
+static_manifest = build_static_manifest(STATIC_FOLDER)
+
+def serve_asset(path):
+    """Serve an asset from the manifest, negotiating Content-Encoding"""
+    asset = static_manifest.get(path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['variants'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    # Each encoding is a different representation, so it needs its own strong ETag
+    etag = asset['etag'] if encoding == 'identity' else f"{asset['etag']}-{encoding}"
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(asset['variants'][encoding])
+        response.mimetype = asset['mimetype']
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset['cache_control']
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def serve_frontend():
     """Serve the main React app"""
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_asset('index.html')
 
 @app.route('/<path:path>')
 def serve_static_files(path):
     """Serve static files or fallback to React app for client-side routing"""
-    if os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
+    if path in static_manifest:
+        return serve_asset(path)
     else:
         # Fallback to React app for client-side routing
-        return send_from_directory(app.static_folder, 'index.html')
+        return serve_asset('index.html')
+
+# Command line interface: flask --app app db upgrade|status|seed
+@app.cli.group()
+def db():
+    """Database schema and data management"""
+
+@db.command('upgrade')
+@click.option('--to', 'target_version', type=int, default=None, help='Stop after this migration version')
+def db_upgrade(target_version):
+    """Apply pending schema migrations"""
+    applied = migrate_db(target_version)
+    click.echo(f"Applied migrations: {', '.join(map(str, applied))}" if applied else 'Schema is up to date')
+
+@db.command('status')
+def db_status():
+    """Show the current schema version and pending migrations"""
+    version = get_schema_version()
+    click.echo(f'Schema version: {version} (latest: {LATEST_SCHEMA_VERSION})')
+    for migration_version, description, _, _ in MIGRATIONS:
+        if migration_version > version:
+            click.echo(f'  pending {migration_version}: {description}')
+
+@db.command('seed')
+def db_seed():
+    """Apply migrations and create the sample user and data"""
+    init_db()
+
+@db.command('rollups')
+@click.option('--fix', is_flag=True, help='Recompute the counters that drifted')
+def db_rollups(fix):
+    """Check goal and track progress counters against the tasks table"""
+    drift = rebuild_rollups() if fix else find_rollup_drift()
+    for table, rows in drift.items():
+        if rows:
+            shown = ', '.join(str(row_id) for row_id, _ in rows[:20]) + (' ...' if len(rows) > 20 else '')
+            click.echo(f"{len(rows)} {table} {'repaired' if fix else 'drifted'}: {shown}")
+    if not any(drift.values()):
+        click.echo('Rollups are consistent')
+    elif not fix:
+        raise click.ClickException("Rollup counters drifted; run 'flask --app app db rollups --fix'")
+
+def cli_user_id(email):
+    user = execute_query(f'SELECT id FROM users WHERE email = {PARAM}', (email,), fetch_one=True)
+    if not user:
+        raise click.ClickException(f'No user with email {email}')
+    return user['id']
+
+@db.command('prune-changes')
+def db_prune_changes():
+    """Delete change feed tombstones older than CHANGES_RETENTION_DAYS"""
+    click.echo(f'Pruned {prune_changes()} tombstones older than {CHANGES_RETENTION_DAYS} days')
+
+@db.command('reset-goals')
+def db_reset_goals():
+    """Reset recurring goals whose period has ended"""
+    click.echo(f'Reset {reset_due_goals()} recurring goals')
+
+@db.command('purge')
+@click.option('--full', is_flag=True, help='Rewrite the whole database afterwards (SQLite VACUUM, PostgreSQL VACUUM FULL); locks it while running')
+def db_purge(full):
+    """Remove deleted tracks and goals, sweep out orphans and compact the database"""
+    counts = purge_deleted()
+    orphans = 0
+    if not IS_POSTGRESQL:
+        for table in ORPHAN_PARENTS:
+            after = 0
+            while True:
+                deleted, after = purge_orphans(table, after, PURGE_SCAN_SIZE)
+                orphans += deleted
+                if not after:
+                    break
+    compact_database(full)
+    click.echo(', '.join(f'{count} {table}' for table, count in counts.items()) + f' purged, {orphans} orphans removed')
+
+@db.command('export')
+@click.argument('email')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def db_export(email, output):
+    """Write a user's tracks, goals and tasks as NDJSON"""
+    for chunk in export_user_data(cli_user_id(email)):
+        output.write(chunk)
+
+@db.command('import')
+@click.argument('email')
+@click.argument('source', type=click.File('r'))
+def db_import(email, source):
+    """Add the tracks, goals and tasks from an NDJSON file to a user"""
+    try:
+        counts = import_user_data(cli_user_id(email), source)
+    except DataImportError as e:
+        raise click.ClickException(f'Line {e.line}: {e.message}')
+    click.echo(', '.join(f'{count} {table}' for table, count in counts.items()) + ' imported')
 
 if __name__ == '__main__':
     # Initialize database on startup
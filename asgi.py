@@ -0,0 +1,237 @@
+"""ASGI entry point: the Flask app behind an asyncio event loop
+
+The event loop accepts connections and reads request bodies; the existing
+(synchronous) Flask routes, with their database and bcrypt calls, run on a
+bounded thread pool. A slow query then holds one pool thread instead of a
+whole worker process, and in-flight requests are capped per process rather
+than by the worker count. Serve it with
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+so gunicorn.conf.py still applies migrations and shares metrics. Size
+DB_POOL_SIZE to ASGI_THREADS on PostgreSQL, or threads queue for connections.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import app as task_manager
+
+# Threads running Flask handlers, and requests admitted per process (running
+# or waiting for a thread); beyond that new requests get 503 immediately
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '16'))
+ASGI_MAX_REQUESTS = int(os.getenv('ASGI_MAX_REQUESTS', '256'))
+# Request bodies above this size are spooled to a temporary file
+ASGI_BODY_MEMORY = 1024 * 1024
+# Response chunks buffered ahead of a slow client before the handler blocks
+ASGI_STREAM_BUFFER = 8
+
+class ClientDisconnected(Exception):
+    """The client went away while its response was still being produced"""
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, with the request body already buffered"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class AsgiAdapter:
+    """Serve a WSGI application over ASGI with a bounded handler thread pool"""
+
+    def __init__(self, wsgi_app, threads, max_requests):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.max_requests = max_requests
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close'})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        # The counter is only touched from the event loop, so it needs no lock
+        if self.in_flight >= self.max_requests:
+            task_manager.metrics.inc('asgi_requests_shed_total')
+            await send_response(send, 503, b'{"error": "Server is busy, retry shortly"}', [(b'retry-after', b'1')])
+            return
+
+        self.in_flight += 1
+        try:
+            body = await read_body(receive)
+            if body is None:
+                return
+            await self.respond(build_environ(scope, body), receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def respond(self, environ, receive, send):
+        """Run the WSGI app on the pool and relay its response as it is produced"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(ASGI_STREAM_BUFFER)
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = loop.create_task(watch_disconnect())
+        worker = loop.run_in_executor(self.executor, self.run_wsgi, environ, loop, queue, disconnected)
+        started = False
+        try:
+            while True:
+                message = await next_message(queue, worker)
+                if message is None:
+                    if started:
+                        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    return
+                kind, payload = message
+                if kind == 'start':
+                    status, headers = payload
+                    await send({
+                        'type': 'http.response.start',
+                        'status': status,
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+                    })
+                    started = True
+                elif kind == 'body':
+                    await send({'type': 'http.response.body', 'body': payload, 'more_body': True})
+                elif not started:
+                    await send_response(send, 500, b'{"error": "Internal server error"}')
+                    return
+                else:
+                    # Headers are out: abort the connection rather than end a truncated body cleanly
+                    raise RuntimeError('Response stream failed') from payload
+        finally:
+            watcher.cancel()
+            disconnected.set()
+            # Unblock a handler thread still waiting to hand over a chunk
+            while not worker.done():
+                getter = loop.create_task(queue.get())
+                await asyncio.wait({getter, worker}, return_when=asyncio.FIRST_COMPLETED)
+                getter.cancel()
+
+    def run_wsgi(self, environ, loop, queue, disconnected):
+        """Pool thread: call the app and queue ('start' | 'body' | 'error', payload) messages, then None"""
+        response = {'sent': False}
+
+        def put(message):
+            if disconnected.is_set():
+                raise ClientDisconnected()
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        def write(data):
+            if not response['sent']:
+                put(('start', (response['status'], response['headers'])))
+                response['sent'] = True
+            if data:
+                put(('body', bytes(data)))
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response['sent']:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+            return write
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    write(chunk)
+                write(b'')
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            put(None)
+        except ClientDisconnected:
+            pass
+        except Exception as e:
+            print(f"ASGI handler error: {e}")
+            try:
+                put(('error', e))
+            except ClientDisconnected:
+                pass
+
+async def next_message(queue, worker):
+    """Next queued message, or None once the handler thread has finished without one"""
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.wait({getter, worker}, return_when=asyncio.FIRST_COMPLETED)
+    if getter.done():
+        return getter.result()
+    getter.cancel()
+    return queue.get_nowait() if not queue.empty() else None
+
+async def read_body(receive):
+    """Buffer the request body, or return None if the client disconnected first"""
+    body = tempfile.SpooledTemporaryFile(max_size=ASGI_BODY_MEMORY)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    body.seek(0)
+    return body
+
+async def send_response(send, status, body, headers=()):
+    """Send a complete JSON response"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii')), *headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+app = AsgiAdapter(task_manager.app, ASGI_THREADS, ASGI_MAX_REQUESTS)
@@ -0,0 +1,75 @@
+"""Compare two loadtest.py reports and flag regressions
+
+    python bench/compare.py bench/results/before.json bench/results/after.json --threshold 10
+
+Exits with status 1 when any endpoint's p95/p99 latency rose or its
+throughput fell by more than the threshold percentage.
+"""
+import argparse
+import json
+
+LATENCY_FIELDS = ('p50_ms', 'p95_ms', 'p99_ms')
+# p50 is reported but too sensitive to noise to fail a run on its own
+GATING_FIELDS = ('p95_ms', 'p99_ms')
+MIN_LATENCY_DELTA_MS = 1.0  # Ignore changes smaller than this, however large in percent
+
+def change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) * 100.0 / before
+
+def compare(base, head, threshold):
+    """Return (rows, regressions) for every endpoint in either report"""
+    rows = []
+    regressions = []
+    labels = sorted(set(base['endpoints']) | set(head['endpoints']))
+    for label in labels + ['TOTAL']:
+        old = base['summary'] if label == 'TOTAL' else base['endpoints'].get(label)
+        new = head['summary'] if label == 'TOTAL' else head['endpoints'].get(label)
+        if old is None or new is None:
+            rows.append((label, 'only in ' + ('head' if old is None else 'base')))
+            continue
+        cells = []
+        for field in ('throughput_rps',) + LATENCY_FIELDS:
+            delta = change(old[field], new[field])
+            cells.append(f'{old[field]:>9.2f} -> {new[field]:>9.2f} ({delta:+6.1f}%)')
+            if field == 'throughput_rps' and delta < -threshold:
+                regressions.append(f'{label}: throughput {delta:+.1f}%')
+            elif field in GATING_FIELDS and delta > threshold and new[field] - old[field] >= MIN_LATENCY_DELTA_MS:
+                regressions.append(f'{label}: {field} {delta:+.1f}%')
+        if new['errors'] > old['errors']:
+            cells.append(f"errors {old['errors']} -> {new['errors']}")
+        rows.append((label, '  '.join(cells)))
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed change in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    for name, report in (('base', base), ('head', head)):
+        meta = report['meta']
+        print(f"{name}: {meta['target']} mix={meta['mix']} concurrency={meta['concurrency']} commit={meta['git_commit']}")
+    if (base['meta']['mix'], base['meta']['concurrency']) != (head['meta']['mix'], head['meta']['concurrency']):
+        print('Warning: the reports used different workloads')
+
+    rows, regressions = compare(base, head, args.threshold)
+    print(f"{'endpoint':<28} {'throughput rps':^34}  {'p50 ms':^34}  {'p95 ms':^34}  {'p99 ms':^34}")
+    for label, text in rows:
+        print(f'{label:<28} {text}')
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+    print('\nNo regressions above the threshold')
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
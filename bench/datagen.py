@@ -0,0 +1,142 @@
+"""Synthetic data generator for benchmarks
+
+Creates bench users with a skewed number of tracks, goals and tasks: most
+users have a handful of rows, a few have hundreds, like real usage. Rows are
+bulk inserted with explicit ids, so generating 100k tasks takes seconds.
+
+    python bench/datagen.py --database-url sqlite:///bench.db --users 200
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+BENCH_EMAIL = 'bench{}@example.com'
+BENCH_PASSWORD = 'benchpass123'
+TABLE_COLUMNS = {
+    'users': ('id', 'email', 'password_hash', 'name', 'created_at'),
+    'tracks': ('id', 'user_id', 'name', 'description', 'color', 'created_at'),
+    'goals': ('id', 'track_id', 'title', 'description', 'target_value', 'current_value', 'unit', 'created_at'),
+    'tasks': ('id', 'goal_id', 'title', 'description', 'completed', 'created_at'),
+}
+COLORS = ('#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6', '#EC4899')
+UNITS = ('times', 'minutes', 'pages', 'km', 'sessions')
+WORDS = ('read', 'write', 'run', 'plan', 'review', 'practice', 'call', 'study', 'build', 'clean', 'stretch', 'cook')
+PARETO_ALPHA = 1.5
+
+def load_app(database_url):
+    """Import app.py configured for database_url"""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+    return app
+
+def skewed_count(rng, mean, minimum=1):
+    """Pareto distributed count with the given mean, capped at 25x the mean"""
+    scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    return max(minimum, min(int(round(scale * rng.paretovariate(PARETO_ALPHA))), int(mean * 25)))
+
+def phrase(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def next_id(app, cursor, table):
+    """First id that was never handed out, so cached ownership lookups stay valid"""
+    cursor.execute(f'SELECT MAX(id) FROM {table}')
+    row = cursor.fetchone()
+    highest = row[0] or 0
+    if app.IS_POSTGRESQL:
+        cursor.execute(f"SELECT last_value FROM {table}_id_seq")
+        highest = max(highest, cursor.fetchone()[0])
+    else:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+        row = cursor.fetchone()
+        highest = max(highest, row[0] if row else 0)
+    return highest + 1
+
+def insert_rows(app, cursor, table, rows):
+    if not rows:
+        return
+    columns = ', '.join(TABLE_COLUMNS[table])
+    if app.IS_POSTGRESQL:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, f'INSERT INTO {table} ({columns}) VALUES %s', rows, page_size=1000)
+    else:
+        placeholders = ', '.join('?' for _ in TABLE_COLUMNS[table])
+        cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+def delete_bench_users(app, cursor):
+    """Remove bench users from an earlier run together with their data"""
+    users = "SELECT id FROM users WHERE email LIKE 'bench%@example.com'"
+    tracks = f'SELECT id FROM tracks WHERE user_id IN ({users})'
+    goals = f'SELECT id FROM goals WHERE track_id IN ({tracks})'
+    cursor.execute(f'DELETE FROM tasks WHERE goal_id IN ({goals})')
+    cursor.execute(f'DELETE FROM goals WHERE track_id IN ({tracks})')
+    cursor.execute(f'DELETE FROM tracks WHERE user_id IN ({users})')
+    cursor.execute(f'DELETE FROM users WHERE id IN ({users})')
+
+def generate(app, users, tracks_per_user, goals_per_track, tasks_per_goal, seed, days=180):
+    """Insert the synthetic data set and return row counts per table"""
+    rng = random.Random(seed)
+    now = datetime.datetime(2025, 1, 1) if seed is not None else datetime.datetime.utcnow()
+    password_hash = app.hash_password(BENCH_PASSWORD)
+    counts = dict.fromkeys(TABLE_COLUMNS, 0)
+
+    app.migrate_db()
+    with app.db_session() as conn:
+        cursor = conn.cursor()
+        delete_bench_users(app, cursor)
+        ids = {table: next_id(app, cursor, table) for table in TABLE_COLUMNS}
+        rows = {table: [] for table in TABLE_COLUMNS}
+
+        def add(table, values):
+            rows[table].append((ids[table],) + values)
+            ids[table] += 1
+            counts[table] += 1
+            if len(rows[table]) >= 5000:
+                insert_rows(app, cursor, table, rows[table])
+                rows[table] = []
+            return ids[table] - 1
+
+        for i in range(1, users + 1):
+            # Parents are flushed before children so foreign keys always resolve
+            joined = now - datetime.timedelta(days=rng.uniform(0, days))
+            user_id = add('users', (BENCH_EMAIL.format(i), password_hash, f'Bench User {i}', joined))
+            for _ in range(skewed_count(rng, tracks_per_user)):
+                track_created = joined + (now - joined) * rng.random()
+                track_id = add('tracks', (user_id, phrase(rng, 2), phrase(rng, 6), rng.choice(COLORS), track_created))
+                for _ in range(skewed_count(rng, goals_per_track, minimum=0)):
+                    goal_created = track_created + (now - track_created) * rng.random()
+                    target = rng.choice((1, 3, 5, 10, 30, 100))
+                    goal_id = add('goals', (track_id, phrase(rng), phrase(rng, 8), target, rng.randint(0, target), rng.choice(UNITS), goal_created))
+                    for _ in range(skewed_count(rng, tasks_per_goal, minimum=0)):
+                        task_created = goal_created + (now - goal_created) * rng.random()
+                        # Older tasks are more likely to be done
+                        completed = rng.random() < 0.2 + 0.6 * (now - task_created) / (now - joined + datetime.timedelta(seconds=1))
+                        add('tasks', (goal_id, phrase(rng, 4), phrase(rng, 10), completed, task_created))
+            for table in TABLE_COLUMNS:
+                insert_rows(app, cursor, table, rows[table])
+                rows[table] = []
+
+        if app.IS_POSTGRESQL:
+            for table in TABLE_COLUMNS:
+                cursor.execute(f"SELECT setval('{table}_id_seq', %s)", (ids[table] - 1,))
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tracks-per-user', type=float, default=4, help='mean tracks per user')
+    parser.add_argument('--goals-per-track', type=float, default=5, help='mean goals per track')
+    parser.add_argument('--tasks-per-goal', type=float, default=8, help='mean tasks per goal')
+    parser.add_argument('--seed', type=int, default=42, help='random seed; the same seed gives the same data set')
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    counts = generate(app, args.users, args.tracks_per_user, args.goals_per_track, args.tasks_per_goal, args.seed)
+    print(', '.join(f'{count} {table}' for table, count in counts.items()))
+    print(f'Log in as {BENCH_EMAIL.format(1)} ... {BENCH_EMAIL.format(args.users)} with password {BENCH_PASSWORD}')
+
+if __name__ == '__main__':
+    main()
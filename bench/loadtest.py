@@ -0,0 +1,394 @@
+"""Load driver for the /api routes
+
+Runs a weighted mix of reads and writes from concurrent clients, either
+in-process through Flask's test client or over HTTP against a running server,
+and reports throughput and p50/p95/p99 latency per endpoint. Generate data
+with datagen.py first.
+
+    python bench/loadtest.py --database-url sqlite:///bench.db --out bench/results/sqlite.json
+    python bench/loadtest.py --url http://127.0.0.1:8000 --out bench/results/gunicorn.json
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+from datagen import BENCH_EMAIL, BENCH_PASSWORD, load_app
+
+# Relative weight of each operation per workload mix
+MIXES = {
+    'read-heavy': {
+        'GET /api/tracks': 20, 'GET /api/tracks?expand': 8, 'GET /api/goals': 15, 'GET /api/tasks': 20,
+        'POST /api/tasks': 3, 'PUT /api/tasks/<id>': 4, 'DELETE /api/tasks/<id>': 1,
+        'POST /api/goals': 1, 'PUT /api/goals/<id>': 1, 'DELETE /api/goals/<id>': 0.3,
+        'POST /api/tracks': 0.3, 'PUT /api/tracks/<id>': 0.5, 'DELETE /api/tracks/<id>': 0.1,
+        'POST /api/batch': 0.5, 'GET /api/health': 0.5, 'GET /api/metrics': 0.2,
+        'POST /api/auth/login': 0.2, 'POST /api/auth/logout': 0.1,
+    },
+    'mixed': {
+        'GET /api/tracks': 12, 'GET /api/tracks?expand': 5, 'GET /api/goals': 10, 'GET /api/tasks': 12,
+        'POST /api/tasks': 8, 'PUT /api/tasks/<id>': 10, 'DELETE /api/tasks/<id>': 3,
+        'POST /api/goals': 2, 'PUT /api/goals/<id>': 3, 'DELETE /api/goals/<id>': 1,
+        'POST /api/tracks': 1, 'PUT /api/tracks/<id>': 2, 'DELETE /api/tracks/<id>': 0.5,
+        'POST /api/batch': 2, 'GET /api/health': 1, 'GET /api/metrics': 0.5,
+        'POST /api/auth/login': 0.5, 'POST /api/auth/logout': 0.2,
+    },
+    'write-heavy': {
+        'GET /api/tracks': 5, 'GET /api/tracks?expand': 2, 'GET /api/goals': 4, 'GET /api/tasks': 5,
+        'POST /api/tasks': 15, 'PUT /api/tasks/<id>': 20, 'DELETE /api/tasks/<id>': 8,
+        'POST /api/goals': 4, 'PUT /api/goals/<id>': 6, 'DELETE /api/goals/<id>': 2,
+        'POST /api/tracks': 2, 'PUT /api/tracks/<id>': 3, 'DELETE /api/tracks/<id>': 1,
+        'POST /api/batch': 5, 'GET /api/health': 0.5, 'GET /api/metrics': 0.2,
+        'POST /api/auth/login': 0.5, 'POST /api/auth/logout': 0.2,
+    },
+}
+
+class InProcessTransport:
+    """Requests through Flask's test client; one client per thread"""
+
+    def __init__(self, app_module):
+        self.flask_app = app_module.app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.flask_app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_data()
+
+class HttpTransport:
+    """Requests over keep-alive HTTP connections; one connection per thread"""
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+
+class Recorder:
+    """Latencies and status codes per endpoint label"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.recording = False
+
+    def record(self, label, elapsed, status):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies.setdefault(label, []).append(elapsed)
+            codes = self.statuses.setdefault(label, {})
+            codes[str(status)] = codes.get(str(status), 0) + 1
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, statuses, duration):
+    values = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if int(status) >= 400)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'status_codes': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(values) / duration, 2) if duration else 0.0,
+        'mean_ms': round(sum(values) * 1000 / len(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+class Client:
+    """One simulated user session: logs in, learns its tree, then runs the mix"""
+
+    def __init__(self, transport, recorder, rng, users, session_length):
+        self.transport = transport
+        self.recorder = recorder
+        self.rng = rng
+        self.users = users  # Bench user numbers this client may log in as
+        self.session_length = session_length
+        self.remaining = 0
+        self.email = None
+        self.headers = {}
+        self.goals = {}   # goal id -> track id
+        self.tasks = {}   # task id -> goal id
+        self.tracks = []
+
+    def call(self, label, method, path, body=None, record=True):
+        started = time.perf_counter()
+        status, data = self.transport.request(method, path, body, self.headers)
+        if record:
+            self.recorder.record(label, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def login(self, email, record=True):
+        self.headers = {}
+        status, body = self.call('POST /api/auth/login', 'POST', '/api/auth/login', {'email': email, 'password': BENCH_PASSWORD}, record)
+        while status == 503:
+            # The server is shedding load (password pool or ASGI_MAX_REQUESTS full); back off and retry
+            time.sleep(1)
+            status, body = self.call('POST /api/auth/login', 'POST', '/api/auth/login', {'email': email, 'password': BENCH_PASSWORD}, record)
+        if status != 200:
+            raise RuntimeError(f'Login as {email} failed with {status}; did you run datagen.py?')
+        self.headers = {'Authorization': f"Bearer {body['token']}"}
+
+    def start_session(self):
+        """Log in as a random bench user and load its tree (not recorded)"""
+        self.email = BENCH_EMAIL.format(self.rng.choice(self.users))
+        self.login(self.email, record=False)
+        _, tracks = self.call(None, 'GET', '/api/tracks?expand=goals,tasks', record=False)
+        self.tracks = [track['id'] for track in tracks]
+        self.goals = {goal['id']: track['id'] for track in tracks for goal in track['goals']}
+        self.tasks = {task['id']: goal['id'] for track in tracks for goal in track['goals'] for task in goal['tasks']}
+        self.remaining = self.session_length
+
+    def pick(self, ids):
+        return self.rng.choice(list(ids)) if ids else None
+
+    def run_operation(self, label):
+        """Run one operation; returns False when it could not apply (e.g. nothing to delete)"""
+        rng = self.rng
+        if label == 'GET /api/tracks':
+            self.call(label, 'GET', '/api/tracks')
+        elif label == 'GET /api/tracks?expand':
+            self.call(label, 'GET', '/api/tracks?expand=goals,tasks')
+        elif label == 'GET /api/goals':
+            track_id = self.pick(self.tracks)
+            if track_id is None:
+                return False
+            self.call(label, 'GET', f'/api/goals?track_id={track_id}')
+        elif label == 'GET /api/tasks':
+            goal_id = self.pick(self.goals)
+            if goal_id is None:
+                return False
+            query = f'/api/tasks?goal_id={goal_id}' + ('&limit=20' if rng.random() < 0.5 else '')
+            self.call(label, 'GET', query)
+        elif label == 'POST /api/tracks':
+            status, body = self.call(label, 'POST', '/api/tracks', {'name': f'Track {rng.randint(1, 10**6)}', 'color': '#10B981'})
+            if status == 201:
+                self.tracks.append(body['id'])
+        elif label == 'PUT /api/tracks/<id>':
+            track_id = self.pick(self.tracks)
+            if track_id is None:
+                return False
+            self.call(label, 'PUT', f'/api/tracks/{track_id}', {'name': f'Renamed {rng.randint(1, 10**6)}', 'color': '#3B82F6'})
+        elif label == 'DELETE /api/tracks/<id>':
+            # Only delete small tracks so sessions keep enough data to work with
+            small = [t for t in self.tracks if sum(1 for g in self.goals.values() if g == t) <= 1]
+            track_id = self.pick(small) if len(self.tracks) > 1 else None
+            if track_id is None:
+                return False
+            self.call(label, 'DELETE', f'/api/tracks/{track_id}')
+            self.tracks.remove(track_id)
+            for goal_id in [g for g, t in self.goals.items() if t == track_id]:
+                self.forget_goal(goal_id)
+        elif label == 'POST /api/goals':
+            track_id = self.pick(self.tracks)
+            if track_id is None:
+                return False
+            status, body = self.call(label, 'POST', '/api/goals', {'track_id': track_id, 'title': f'Goal {rng.randint(1, 10**6)}', 'target_value': 10})
+            if status == 201:
+                self.goals[body['id']] = track_id
+        elif label == 'PUT /api/goals/<id>':
+            goal_id = self.pick(self.goals)
+            if goal_id is None:
+                return False
+            self.call(label, 'PUT', f'/api/goals/{goal_id}', {'title': f'Goal {rng.randint(1, 10**6)}', 'target_value': 10, 'current_value': rng.randint(0, 10)})
+        elif label == 'DELETE /api/goals/<id>':
+            goal_id = self.pick(self.goals) if len(self.goals) > 1 else None
+            if goal_id is None:
+                return False
+            self.call(label, 'DELETE', f'/api/goals/{goal_id}')
+            self.forget_goal(goal_id)
+        elif label == 'POST /api/tasks':
+            goal_id = self.pick(self.goals)
+            if goal_id is None:
+                return False
+            status, body = self.call(label, 'POST', '/api/tasks', {'goal_id': goal_id, 'title': f'Task {rng.randint(1, 10**6)}'})
+            if status == 201:
+                self.tasks[body['id']] = goal_id
+        elif label == 'PUT /api/tasks/<id>':
+            task_id = self.pick(self.tasks)
+            if task_id is None:
+                return False
+            self.call(label, 'PUT', f'/api/tasks/{task_id}', {'title': f'Task {task_id}', 'completed': rng.random() < 0.5})
+        elif label == 'DELETE /api/tasks/<id>':
+            task_id = self.pick(self.tasks)
+            if task_id is None:
+                return False
+            self.call(label, 'DELETE', f'/api/tasks/{task_id}')
+            del self.tasks[task_id]
+        elif label == 'POST /api/batch':
+            goal_id = self.pick(self.goals)
+            if goal_id is None:
+                return False
+            operations = [{'action': 'create', 'type': 'task', 'data': {'goal_id': goal_id, 'title': f'Batch {i}'}} for i in range(5)]
+            operations += [{'action': 'update', 'type': 'task', 'id': task_id, 'data': {'title': f'Task {task_id}', 'completed': True}}
+                           for task_id in rng.sample(list(self.tasks), min(5, len(self.tasks)))]
+            status, body = self.call(label, 'POST', '/api/batch', {'operations': operations})
+            if status == 200:
+                for result in body['results'][:5]:
+                    self.tasks[result['data']['id']] = goal_id
+        elif label == 'GET /api/health':
+            self.call(label, 'GET', '/api/health')
+        elif label == 'GET /api/metrics':
+            self.call(label, 'GET', '/api/metrics')
+        elif label == 'POST /api/auth/login':
+            self.login(self.email)
+        elif label == 'POST /api/auth/logout':
+            self.call(label, 'POST', '/api/auth/logout')
+            self.remaining = 0
+        return True
+
+    def forget_goal(self, goal_id):
+        self.goals.pop(goal_id, None)
+        for task_id in [t for t, g in self.tasks.items() if g == goal_id]:
+            del self.tasks[task_id]
+
+    def run(self, mix, deadline):
+        labels = list(mix)
+        weights = [mix[label] for label in labels]
+        while time.monotonic() < deadline:
+            if self.remaining <= 0:
+                self.start_session()
+            label = self.rng.choices(labels, weights)[0]
+            if self.run_operation(label):
+                self.remaining -= 1
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args):
+    if args.url:
+        transport = HttpTransport(args.url)
+        target = args.url
+    else:
+        transport = InProcessTransport(load_app(args.database_url))
+        target = 'in-process ' + args.database_url.split('://', 1)[0]
+
+    recorder = Recorder()
+    mix = MIXES[args.mix]
+    started = time.monotonic()
+    warmup_end = started + args.warmup
+    deadline = warmup_end + args.duration
+    errors = []
+
+    def worker(index):
+        # Clients use disjoint sets of users so they never race on each other's rows
+        users = list(range(index + 1, args.users + 1, args.concurrency)) or [index % args.users + 1]
+        client = Client(transport, recorder, random.Random(args.seed * 1000 + index), users, args.session_length)
+        try:
+            client.run(mix, deadline)
+        except Exception as e:
+            errors.append(f'client {index}: {e}')
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(max(0.0, warmup_end - time.monotonic()))
+    recorder.recording = True
+    measure_start = time.monotonic()
+    for thread in threads:
+        thread.join()
+    measured = time.monotonic() - measure_start
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    all_statuses = {}
+    for statuses in recorder.statuses.values():
+        for status, count in statuses.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+
+    return {
+        'meta': {
+            'target': target,
+            'mix': args.mix,
+            'concurrency': args.concurrency,
+            'users': args.users,
+            'duration_s': round(measured, 3),
+            'warmup_s': args.warmup,
+            'seed': args.seed,
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'client_errors': errors,
+        },
+        'summary': summarize(all_latencies, all_statuses, measured),
+        'endpoints': {label: summarize(recorder.latencies[label], recorder.statuses[label], measured) for label in sorted(recorder.latencies)},
+    }
+
+def print_report(report):
+    meta = report['meta']
+    print(f"{meta['target']} | mix={meta['mix']} concurrency={meta['concurrency']} duration={meta['duration_s']}s commit={meta['git_commit']}")
+    print(f"{'endpoint':<28} {'reqs':>7} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, row in list(report['endpoints'].items()) + [('TOTAL', report['summary'])]:
+        print(f"{label:<28} {row['requests']:>7} {row['errors']:>5} {row['throughput_rps']:>9.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    for error in meta['client_errors']:
+        print(f'Client error: {error}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='benchmark a running server instead of the app in-process')
+    target.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'), help='database for in-process runs')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before measuring')
+    parser.add_argument('--users', type=int, default=100, help='number of bench users created by datagen.py')
+    parser.add_argument('--session-length', type=int, default=50, help='operations before a client logs in as another user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON report here')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.out}')
+    return 1 if report['meta']['client_errors'] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+"""Check every /api route against its @query_budget
+
+Runs each route once in-process against a fresh database with the read cache
+disabled (the cold path) and fails when a route makes more execute_query
+round trips or uses more connections than its budget allows, or when a route
+has no budget or no scenario here.
+
+    python bench/query_budget.py                        # temporary SQLite file
+    python bench/query_budget.py --database-url postgresql://localhost/task_manager_budget
+"""
+import argparse
+import os
+import tempfile
+
+def run_scenarios(client, login_body):
+    """Yield (label, response) for one request to every /api route"""
+    response = client.post('/api/auth/login', json=login_body)
+    yield 'login', response
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+    yield 'get_tracks', client.get('/api/tracks', headers=headers)
+    yield 'get_tracks_summary', client.get('/api/tracks/summary', headers=headers)
+    yield 'get_tracks?expand=goals,tasks', client.get('/api/tracks?expand=goals,tasks', headers=headers)
+    response = client.post('/api/tracks', json={'name': 'Budget', 'color': '#10B981'}, headers=headers)
+    yield 'create_track', response
+    track_id = response.get_json()['id']
+    yield 'update_track', client.put(f'/api/tracks/{track_id}', json={'name': 'Budget 2', 'color': '#3B82F6'}, headers=headers)
+    yield 'patch_track', client.patch(f'/api/tracks/{track_id}', json={'color': '#10B981'}, headers={**headers, 'If-Match': '"2"'})
+
+    response = client.post('/api/goals', json={'track_id': track_id, 'title': 'Goal'}, headers=headers)
+    yield 'create_goal', response
+    goal_id = response.get_json()['id']
+    yield 'get_goals', client.get(f'/api/goals?track_id={track_id}', headers=headers)
+    yield 'get_goals?limit', client.get(f'/api/goals?track_id={track_id}&limit=10', headers=headers)
+    yield 'update_goal', client.put(f'/api/goals/{goal_id}', json={'title': 'Goal 2', 'current_value': 1}, headers=headers)
+    yield 'patch_goal', client.patch(f'/api/goals/{goal_id}', json={'current_value': 2}, headers=headers)
+
+    response = client.post('/api/tasks', json={'goal_id': goal_id, 'title': 'Task'}, headers=headers)
+    yield 'create_task', response
+    task_id = response.get_json()['id']
+    yield 'get_tasks', client.get(f'/api/tasks?goal_id={goal_id}', headers=headers)
+    yield 'get_tasks?limit', client.get(f'/api/tasks?goal_id={goal_id}&limit=10', headers=headers)
+    yield 'search', client.get('/api/search?q=bud', headers=headers)
+    yield 'get_changes', client.get('/api/changes', headers=headers)
+    yield 'update_task', client.put(f'/api/tasks/{task_id}', json={'title': 'Task 2', 'completed': True}, headers=headers)
+    yield 'get_streak_stats', client.get('/api/stats/streaks', headers=headers)
+    yield 'get_weekly_stats', client.get(f'/api/stats/weekly?goal_id={goal_id}', headers=headers)
+    yield 'get_heatmap_stats', client.get(f'/api/stats/heatmap?track_id={track_id}', headers=headers)
+    yield 'patch_task', client.patch(f'/api/tasks/{task_id}', json={'completed': False}, headers={**headers, 'If-Match': '"2"'})
+
+    yield 'batch', client.post('/api/batch', json={'operations': [
+        {'action': 'create', 'type': 'task', 'data': {'goal_id': goal_id, 'title': 'Batch'}},
+        {'action': 'update', 'type': 'task', 'id': task_id, 'data': {'title': 'Task 3', 'completed': False}},
+        {'action': 'delete', 'type': 'task', 'id': '$0'},
+    ]}, headers=headers)
+
+    response = client.get('/api/export', headers=headers)
+    response.get_data()  # Drain the stream so its queries run
+    yield 'export_data', response
+    yield 'import_data', client.post('/api/import', headers=headers, data=(
+        '{"type": "track", "id": 1, "name": "Imported"}\n'
+        '{"type": "goal", "id": 1, "track_id": 1, "title": "Goal"}\n'
+        '{"type": "task", "goal_id": 1, "title": "Task"}\n'
+    ))
+
+    yield 'delete_task', client.delete(f'/api/tasks/{task_id}', headers=headers)
+    yield 'delete_goal', client.delete(f'/api/goals/{goal_id}', headers=headers)
+    yield 'delete_track', client.delete(f'/api/tracks/{track_id}', headers=headers)
+    yield 'health', client.get('/api/health')
+    yield 'metrics_endpoint', client.get('/api/metrics')
+    yield 'logout', client.post('/api/auth/logout', headers=headers)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='database to run against (default: a temporary SQLite file)')
+    parser.add_argument('--trace', action='store_true', help='list the call site of every query')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query_budget_')
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'budget.db')}"
+    os.environ['CACHE_BACKEND'] = 'none'
+    os.environ['QUERY_DEBUG_HEADERS'] = 'true'
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    # Background jobs query from their own threads, which the hook below would count against a route
+    os.environ['RESET_INTERVAL'] = '0'
+    os.environ['PURGE_INTERVAL'] = '0'
+    from datagen import load_app
+    app = load_app(os.environ['DATABASE_URL'])
+    app.init_db()
+
+    client = app.app.test_client()
+    login_body = {'email': 'rob.vandijk@example.com', 'password': 'password123'}
+    # One unmeasured request loads per-process state such as the revocation list
+    client.post('/api/auth/login', json=login_body)
+    client.get('/api/tracks', headers={'Authorization': f"Bearer {client.post('/api/auth/login', json=login_body).get_json()['token']}"})
+
+    sites = []
+    app.query_hooks.append(lambda site, query, elapsed, rows, failed: sites.append(site))
+
+    failures = []
+    seen = set()
+    print(f"{'route':<32} {'status':>6} {'queries':>8} {'budget':>7} {'conns':>6} {'db ms':>8}")
+    for label, response in run_scenarios(client, login_body):
+        endpoint = label.split('?')[0]
+        seen.add(endpoint)
+        budget = app.QUERY_BUDGETS.get(endpoint)
+        # Counted through the hook so queries run while streaming a body are included
+        queries = len(sites)
+        connections = int(response.headers.get('X-DB-Connections', 0))
+        print(f"{label:<32} {response.status_code:>6} {queries:>8} {budget['queries'] if budget else '-':>7} {connections:>6} {response.headers.get('X-Query-Time-Ms', '-'):>8}")
+        if args.trace:
+            for site in sites:
+                print(f'    {site}')
+        sites.clear()
+        if response.status_code >= 400:
+            failures.append(f'{label}: unexpected status {response.status_code}')
+        elif budget is None:
+            failures.append(f'{label}: no @query_budget declared')
+        elif queries > budget['queries'] or connections > budget['connections']:
+            failures.append(f"{label}: {queries} queries / {connections} connections exceeds budget of {budget['queries']} / {budget['connections']}")
+
+    for rule in app.app.url_map.iter_rules():
+        if rule.rule.startswith('/api/') and rule.endpoint not in seen:
+            failures.append(f'{rule.endpoint}: no scenario in bench/query_budget.py')
+
+    if failures:
+        print('\nFailures:')
+        for failure in failures:
+            print(f'  {failure}')
+        return 1
+    print('\nAll routes within budget')
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""Compare sync (gunicorn) and async (ASGI) serving under concurrent load
+
+Starts the app once per serving mode with the same worker count, drives it
+with loadtest.py's client mix at each concurrency level and prints throughput
+and latency side by side. Generate data with datagen.py first.
+
+    python bench/serving.py --database-url postgresql://localhost/bench --concurrency 8,32,128 --out bench/results/serving.json
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from loadtest import MIXES, git_commit, run_benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Both modes use the deployment's command line (see Procfile) apart from the entry point
+MODES = {
+    'sync': ['gunicorn', 'app:app'],
+    'asgi': ['gunicorn', 'asgi:app', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+def start_server(mode, port, workers, env):
+    command = MODES[mode] + ['--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '120']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_healthy(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'server on port {port} did not become healthy')
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def run_mode(mode, args, levels):
+    """Serve the app in one mode and benchmark it at every concurrency level"""
+    env = dict(os.environ, DATABASE_URL=args.database_url, AUTO_MIGRATE='false')
+    if args.bcrypt_rounds:
+        env['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    process = start_server(mode, args.port, args.workers, env)
+    try:
+        wait_until_healthy(args.port, process)
+        reports = {}
+        for concurrency in levels:
+            reports[concurrency] = run_benchmark(SimpleNamespace(
+                url=f'http://127.0.0.1:{args.port}', mix=args.mix, concurrency=concurrency, duration=args.duration,
+                warmup=args.warmup, users=args.users, session_length=args.session_length, seed=args.seed
+            ))
+            summary = reports[concurrency]['summary']
+            print(f"{mode:<5} concurrency={concurrency:<4} {summary['throughput_rps']:>8.1f} rps  p95 {summary['p95_ms']:.1f} ms", file=sys.stderr)
+        return reports
+    finally:
+        stop_server(process)
+
+def print_comparison(results, levels):
+    print(f"{'concurrency':>11} {'mode':<5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in levels:
+        for mode in MODES:
+            row = results[mode][concurrency]['summary']
+            print(f"{concurrency:>11} {mode:<5} {row['throughput_rps']:>9.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>7}")
+        sync_rps = results['sync'][concurrency]['summary']['throughput_rps']
+        asgi_rps = results['asgi'][concurrency]['summary']['throughput_rps']
+        if sync_rps:
+            print(f"{'':>11} asgi/sync throughput {asgi_rps / sync_rps:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--workers', type=int, default=2, help='worker processes in both modes')
+    parser.add_argument('--concurrency', default='8,32,128', help='comma-separated client counts')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds per level')
+    parser.add_argument('--users', type=int, default=100, help='number of bench users created by datagen.py')
+    parser.add_argument('--session-length', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help='server BCRYPT_ROUNDS, so session logins do not dominate the comparison (0 keeps the server default)')
+    parser.add_argument('--out', help='write all reports as JSON here')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    results = {mode: run_mode(mode, args, levels) for mode in MODES}
+    print_comparison(results, levels)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'meta': {'database': args.database_url.split('://', 1)[0], 'workers': args.workers, 'mix': args.mix, 'git_commit': git_commit()},
+                'results': {mode: {str(level): report for level, report in reports.items()} for mode, reports in results.items()}
+            }, f, indent=2)
+        print(f'Report written to {args.out}')
+    errors = [error for reports in results.values() for report in reports.values() for error in report['meta']['client_errors']]
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
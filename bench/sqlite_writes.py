@@ -0,0 +1,113 @@
+"""Compare SQLite write throughput with library defaults and with SQLITE_TUNED
+
+Generates one data set, then serves a copy of it per mode with the same
+gunicorn command (threaded workers, so each process has concurrent writers)
+and drives it with loadtest.py's write-heavy mix. Prints write requests per
+second, latency and errors side by side.
+
+    python bench/sqlite_writes.py --users 100 --concurrency 8,32 --out bench/results/sqlite_writes.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from loadtest import git_commit, run_benchmark
+from serving import stop_server, wait_until_healthy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SQLITE_TUNED per mode; 'default' is the rollback journal with full syncs
+MODES = {'default': 'false', 'tuned': 'true'}
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def write_summary(report):
+    """Throughput, errors and worst p95/p99 over the write endpoints (logins excluded)"""
+    rows = [row for label, row in report['endpoints'].items()
+            if label.startswith(WRITE_METHODS) and '/api/auth/' not in label]
+    return {
+        'write_rps': sum(row['throughput_rps'] for row in rows),
+        'write_errors': sum(row['errors'] for row in rows),
+        'p95_ms': max((row['p95_ms'] for row in rows), default=0.0),
+        'p99_ms': max((row['p99_ms'] for row in rows), default=0.0),
+    }
+
+def run_mode(mode, args, levels, base_db, workdir):
+    """Serve a fresh copy of the data set in one mode and benchmark every concurrency level"""
+    database = os.path.join(workdir, f'{mode}.db')
+    shutil.copyfile(base_db, database)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', SQLITE_TUNED=MODES[mode], AUTO_MIGRATE='false',
+               CACHE_PATH=os.path.join(workdir, f'{mode}-cache.db'), BCRYPT_ROUNDS=str(args.bcrypt_rounds))
+    command = ['gunicorn', 'app:app', '--worker-class', 'gthread', '--threads', str(args.threads), '--workers', str(args.workers),
+               '--bind', f'127.0.0.1:{args.port}', '--timeout', '120']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(args.port, process)
+        reports = {}
+        for concurrency in levels:
+            reports[concurrency] = run_benchmark(SimpleNamespace(
+                url=f'http://127.0.0.1:{args.port}', mix='write-heavy', concurrency=concurrency, duration=args.duration,
+                warmup=args.warmup, users=args.users, session_length=args.session_length, seed=args.seed
+            ))
+            summary = write_summary(reports[concurrency])
+            print(f"{mode:<7} concurrency={concurrency:<4} {summary['write_rps']:>8.1f} writes/s  p95 {summary['p95_ms']:.1f} ms", file=sys.stderr)
+        return reports
+    finally:
+        stop_server(process)
+
+def print_comparison(results, levels):
+    print(f"{'concurrency':>11} {'mode':<7} {'writes/s':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in levels:
+        for mode in MODES:
+            row = write_summary(results[mode][concurrency])
+            print(f"{concurrency:>11} {mode:<7} {row['write_rps']:>9.1f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['write_errors']:>7}")
+        before = write_summary(results['default'][concurrency])['write_rps']
+        after = write_summary(results['tuned'][concurrency])['write_rps']
+        if before:
+            print(f"{'':>11} tuned/default write throughput {after / before:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help='bench users to generate')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes in both modes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker')
+    parser.add_argument('--concurrency', default='8,32', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds per level')
+    parser.add_argument('--session-length', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='server BCRYPT_ROUNDS, so logins stay out of the picture')
+    parser.add_argument('--out', help='write all reports as JSON here')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='sqlite_writes_')
+    try:
+        # Generated with the defaults, so the file starts out in rollback-journal mode
+        base_db = os.path.join(workdir, 'base.db')
+        subprocess.run([sys.executable, os.path.join(ROOT, 'bench', 'datagen.py'), '--database-url', f'sqlite:///{base_db}',
+                        '--users', str(args.users)], env=dict(os.environ, SQLITE_TUNED='false', BCRYPT_ROUNDS=str(args.bcrypt_rounds)),
+                       check=True, stdout=subprocess.DEVNULL)
+        results = {mode: run_mode(mode, args, levels, base_db, workdir) for mode in MODES}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_comparison(results, levels)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'meta': {'database': 'sqlite', 'workers': args.workers, 'threads': args.threads, 'mix': 'write-heavy', 'git_commit': git_commit()},
+                'results': {mode: {str(level): report for level, report in reports.items()} for mode, reports in results.items()}
+            }, f, indent=2)
+        print(f'Report written to {args.out}')
+    errors = [error for reports in results.values() for report in reports.values() for error in report['meta']['client_errors']]
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,19 @@
+# Gunicorn picks this file up automatically from the working directory.
+import os
+import tempfile
+
+# Workers share metric snapshots through this directory so /api/metrics can
+# report the whole server. It is keyed on the master pid so restarts start clean.
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'task_manager_metrics_{os.getpid()}'))
+
+def on_starting(server):
+    """Apply schema migrations once in the master, before any worker forks"""
+    import app
+    app.metrics.reset_directory()
+    if os.getenv('AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes'):
+        app.migrate_db()
+
+def post_worker_init(worker):
+    """Warn loudly when a worker starts against an out-of-date schema"""
+    import app
+    app.check_schema()
@@ -0,0 +1,44 @@
+"""Run the app in-process against a fresh database seeded with the sample data
+
+    python -m pytest tests                                                  # temporary SQLite file
+    DATABASE_URL=postgresql://localhost/task_manager_test python -m pytest tests   # an empty database
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+workdir = tempfile.mkdtemp(prefix='task_manager_tests_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'test.db')}")
+os.environ['CACHE_PATH'] = os.path.join(workdir, 'cache.db')
+os.environ['BCRYPT_ROUNDS'] = '4'
+# Background jobs would race the assertions; tests run them directly
+os.environ['RESET_INTERVAL'] = '0'
+os.environ['PURGE_INTERVAL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+app_module.init_db()
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+@pytest.fixture
+def headers(client):
+    response = client.post('/api/auth/login', json={'email': 'rob.vandijk@example.com', 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+@pytest.fixture
+def track(client, headers):
+    return client.post('/api/tracks', json={'name': 'Test track'}, headers=headers).get_json()
+
+@pytest.fixture
+def goal(client, headers, track):
+    return client.post('/api/goals', json={'track_id': track['id'], 'title': 'Test goal'}, headers=headers).get_json()
+
+@pytest.fixture
+def task(client, headers, goal):
+    return client.post('/api/tasks', json={'goal_id': goal['id'], 'title': 'Test task'}, headers=headers).get_json()
@@ -0,0 +1,61 @@
+"""Goal payload validation, updates and the recurring reset schedule"""
+import pytest
+
+import app as app_module
+
+def goal_schedule(goal_id):
+    with app_module.db_session():
+        row = app_module.execute_query(
+            f'SELECT recurrence, next_reset_at FROM goals WHERE id = {app_module.PARAM}', (goal_id,), fetch_one=True
+        )
+    return row['recurrence'], str(row['next_reset_at'])
+
+def set_next_reset(goal_id, value):
+    with app_module.db_session():
+        app_module.execute_query(f'UPDATE goals SET next_reset_at = {app_module.PARAM} WHERE id = {app_module.PARAM}', (value, goal_id))
+
+def recurring_goal(client, headers, track):
+    body = {'track_id': track['id'], 'title': 'Weekly', 'recurrence': 'weekly'}
+    return client.post('/api/goals', json=body, headers=headers).get_json()
+
+def test_put_without_recurrence_keeps_schedule(client, headers, track):
+    goal = recurring_goal(client, headers, track)
+    before = goal_schedule(goal['id'])
+    assert before[0] == 'weekly'
+    response = client.put(f"/api/goals/{goal['id']}", json={'title': 'Renamed'}, headers=headers)
+    assert response.status_code == 200 and response.get_json()['title'] == 'Renamed'
+    assert goal_schedule(goal['id']) == before
+
+def test_resending_recurrence_keeps_a_due_reset(client, headers, track):
+    goal = recurring_goal(client, headers, track)
+    set_next_reset(goal['id'], '2000-01-03 00:00:00')
+    client.put(f"/api/goals/{goal['id']}", json={'title': 'Weekly', 'recurrence': 'weekly'}, headers=headers)
+    client.patch(f"/api/goals/{goal['id']}", json={'recurrence': 'weekly'}, headers=headers)
+    assert goal_schedule(goal['id']) == ('weekly', '2000-01-03 00:00:00')
+
+def test_changing_recurrence_reschedules(client, headers, track):
+    goal = recurring_goal(client, headers, track)
+    set_next_reset(goal['id'], '2000-01-03 00:00:00')
+    client.put(f"/api/goals/{goal['id']}", json={'title': 'Daily', 'recurrence': 'daily'}, headers=headers)
+    recurrence, next_reset_at = goal_schedule(goal['id'])
+    assert recurrence == 'daily' and next_reset_at > '2000-01-03 00:00:00'
+    client.put(f"/api/goals/{goal['id']}", json={'title': 'Once', 'recurrence': None}, headers=headers)
+    assert goal_schedule(goal['id']) == (None, 'None')
+
+@pytest.mark.parametrize('body, error', [
+    ({'target_value': 'abc'}, 'Target value must be an integer'),
+    ({'target_value': 2.5}, 'Target value must be an integer'),
+    ({'current_value': None}, 'Current value must be an integer'),
+    ({'current_value': True}, 'Current value must be an integer'),
+])
+def test_values_must_be_integers(client, headers, track, goal, body, error):
+    created = client.post('/api/goals', json={'track_id': track['id'], 'title': 'Goal', **body}, headers=headers)
+    updated = client.put(f"/api/goals/{goal['id']}", json={'title': 'Goal', **body}, headers=headers)
+    batch = client.post('/api/batch', json={'operations': [
+        {'action': 'create', 'type': 'goal', 'data': {'track_id': track['id'], 'title': 'Goal', **body}},
+    ]}, headers=headers)
+    for response in (created, updated, batch):
+        assert response.status_code == 400
+        assert error in response.get_json()['error']
+    goals = client.get('/api/goals', query_string={'track_id': track['id']}, headers=headers).get_json()
+    assert [(g['title'], g['version']) for g in goals] == [(goal['title'], goal['version'])]
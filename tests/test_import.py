@@ -0,0 +1,38 @@
+"""POST /api/import validation"""
+import json
+
+import pytest
+
+def import_lines(client, headers, lines):
+    return client.post('/api/import', data=''.join(json.dumps(line) + '\n' for line in lines), headers=headers)
+
+@pytest.mark.parametrize('lines, line, error', [
+    ([{'type': 'track', 'id': [1], 'name': 'T'}], 1, 'id must be an integer'),
+    ([{'type': 'track', 'id': {'a': 1}, 'name': 'T'}], 1, 'id must be an integer'),
+    ([{'type': 'track', 'id': 1, 'name': 'T'},
+      {'type': 'goal', 'id': 1, 'track_id': [1], 'title': 'G'}], 2, 'track_id must be an integer'),
+    ([{'type': 'track', 'id': 1, 'name': 'T'},
+      {'type': 'goal', 'id': {'a': 1}, 'track_id': 1, 'title': 'G'}], 2, 'id must be an integer'),
+    ([{'type': 'track', 'id': 1, 'name': 'T'},
+      {'type': 'goal', 'id': 1, 'track_id': 1, 'title': 'G'},
+      {'type': 'task', 'goal_id': {'a': 1}, 'title': 'K'}], 3, 'goal_id must be an integer'),
+    ([{'type': 'track', 'id': True, 'name': 'T'}], 1, 'id must be an integer'),
+])
+def test_non_integer_ids(client, headers, lines, line, error):
+    response = import_lines(client, headers, lines)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error, 'line': line}
+
+def test_goal_values_must_be_integers(client, headers):
+    response = import_lines(client, headers, [
+        {'type': 'track', 'id': 1, 'name': 'T'},
+        {'type': 'goal', 'id': 1, 'track_id': 1, 'title': 'G', 'target_value': '5'},
+    ])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Target value must be an integer', 'line': 2}
+
+def test_export_imports_back(client, headers, task):
+    client.patch(f"/api/tasks/{task['id']}", json={'completed': True}, headers=headers)
+    exported = client.get('/api/export', headers=headers).get_data(as_text=True)
+    response = client.post('/api/import', data=exported, headers=headers)
+    assert response.status_code == 201
@@ -0,0 +1,47 @@
+"""PATCH /api/{tracks,goals,tasks}/<id> field validation"""
+import pytest
+
+@pytest.mark.parametrize('body, error', [
+    ({'name': ['a']}, 'Name must be a string'),
+    ({'name': 5}, 'Name must be a string'),
+    ({'description': {'a': 1}}, 'Description must be a string or null'),
+    ({'color': 123}, 'Color must be a hex value like #3B82F6'),
+])
+def test_track_field_types(client, headers, track, body, error):
+    response = client.patch(f"/api/tracks/{track['id']}", json=body, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+@pytest.mark.parametrize('body, error', [
+    ({'title': ['a']}, 'Title must be a string'),
+    ({'unit': 3}, 'Unit must be a string'),
+    ({'target_value': 'abc'}, 'Target value must be an integer'),
+    ({'target_value': 2.5}, 'Target value must be an integer'),
+    ({'current_value': None}, 'Current value must be an integer'),
+    ({'current_value': True}, 'Current value must be an integer'),
+])
+def test_goal_field_types(client, headers, goal, body, error):
+    response = client.patch(f"/api/goals/{goal['id']}", json=body, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+@pytest.mark.parametrize('body, error', [
+    ({'title': ['a']}, 'Title must be a string'),
+    ({'completed': 'yes'}, 'Completed must be true or false'),
+])
+def test_task_field_types(client, headers, task, body, error):
+    response = client.patch(f"/api/tasks/{task['id']}", json=body, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+def test_rejected_patch_changes_nothing(client, headers, goal):
+    client.patch(f"/api/goals/{goal['id']}", json={'title': 'Kept', 'target_value': 'abc'}, headers=headers)
+    goals = client.get(f"/api/goals?track_id={goal['track_id']}", headers=headers).get_json()
+    assert [(g['title'], g['target_value'], g['version']) for g in goals] == [('Test goal', goal['target_value'], goal['version'])]
+
+def test_valid_values_are_saved(client, headers, track, goal):
+    response = client.patch(f"/api/goals/{goal['id']}", json={'target_value': 10, 'current_value': 2, 'description': None}, headers=headers)
+    assert response.status_code == 200
+    assert (response.get_json()['target_value'], response.get_json()['description']) == (10, None)
+    response = client.patch(f"/api/tracks/{track['id']}", json={'name': 'Renamed'}, headers=headers)
+    assert response.status_code == 200 and response.get_json()['name'] == 'Renamed'
@@ -0,0 +1,11 @@
+"""Per-request query and connection accounting behind X-DB-Connections and @query_budget"""
+import app as app_module
+
+def test_write_route_counts_its_connection(client, headers, monkeypatch):
+    monkeypatch.setattr(app_module, 'QUERY_DEBUG_HEADERS', True)
+    # The first request of a process also loads the token revocation list
+    client.post('/api/tracks', json={'name': 'Warm-up'}, headers=headers)
+    response = client.post('/api/tracks', json={'name': 'Counted'}, headers=headers)
+    assert response.status_code == 201
+    assert response.headers['X-DB-Connections'] == '1'
+    assert int(response.headers['X-Query-Count']) >= 1
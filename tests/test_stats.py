@@ -0,0 +1,74 @@
+"""Completion history behind /api/stats"""
+import json
+
+import app as app_module
+
+def heatmap_total(client, headers, **scope):
+    tracks = client.get('/api/stats/heatmap', query_string=scope, headers=headers).get_json()['tracks']
+    return sum(track['total'] for track in tracks)
+
+def history_rows(track_id):
+    with app_module.db_session():
+        return sum(
+            app_module.execute_query(f'SELECT COUNT(*) AS n FROM {table} WHERE track_id = {app_module.PARAM}', (track_id,), fetch_one=True)['n']
+            for table in app_module.PURGE_HISTORY_TABLES
+        )
+
+def test_task_created_completed_is_history(client, headers, goal):
+    response = client.post('/api/tasks', json={'goal_id': goal['id'], 'title': 'Done already', 'completed': True}, headers=headers)
+    assert response.status_code == 201
+    assert heatmap_total(client, headers, goal_id=goal['id']) == 1
+    assert client.get('/api/stats/streaks', query_string={'goal_id': goal['id']}, headers=headers).get_json()['current'] == 1
+
+def test_imported_completed_task_is_history(client, headers):
+    lines = [
+        {'type': 'track', 'id': 1, 'name': 'Imported'},
+        {'type': 'goal', 'id': 1, 'track_id': 1, 'title': 'Goal'},
+        {'type': 'task', 'goal_id': 1, 'title': 'Done', 'completed': True},
+        {'type': 'task', 'goal_id': 1, 'title': 'Open', 'completed': False},
+    ]
+    response = client.post('/api/import', data=''.join(json.dumps(line) + '\n' for line in lines), headers=headers)
+    assert response.status_code == 201
+    track = [t for t in client.get('/api/tracks', headers=headers).get_json() if t['name'] == 'Imported'][-1]
+    assert heatmap_total(client, headers, track_id=track['id']) == 1
+
+def test_deleted_track_leaves_stats(client, headers, track, goal, task):
+    client.patch(f"/api/tasks/{task['id']}", json={'completed': True}, headers=headers)
+    before = heatmap_total(client, headers)
+    assert heatmap_total(client, headers, track_id=track['id']) == 1
+
+    assert client.delete(f"/api/tracks/{track['id']}", headers=headers).status_code == 200
+    heatmap = client.get('/api/stats/heatmap', headers=headers).get_json()
+    assert track['id'] not in [row['track_id'] for row in heatmap['tracks']]
+    assert heatmap_total(client, headers) == before - 1
+    assert client.get('/api/stats/heatmap', query_string={'goal_id': goal['id']}, headers=headers).status_code == 404
+    assert history_rows(track['id']) > 0
+
+    app_module.purge_deleted()
+    assert history_rows(track['id']) == 0
+    assert heatmap_total(client, headers) == before - 1
+
+def test_deleted_goal_leaves_stats(client, headers, track, goal, task):
+    other = client.post('/api/goals', json={'track_id': track['id'], 'title': 'Kept'}, headers=headers).get_json()
+    kept = client.post('/api/tasks', json={'goal_id': other['id'], 'title': 'Kept', 'completed': True}, headers=headers)
+    assert kept.status_code == 201
+    client.patch(f"/api/tasks/{task['id']}", json={'completed': True}, headers=headers)
+    before = heatmap_total(client, headers)
+    assert heatmap_total(client, headers, track_id=track['id']) == 2
+
+    assert client.delete(f"/api/goals/{goal['id']}", headers=headers).status_code == 200
+    assert heatmap_total(client, headers) == before - 1
+    assert heatmap_total(client, headers, track_id=track['id']) == 1
+    weekly = client.get('/api/stats/weekly', query_string={'track_id': track['id']}, headers=headers).get_json()
+    assert sum(week['completions'] for week in weekly['weeks']) == 1
+    for route in ('streaks', 'weekly', 'heatmap'):
+        assert client.get(f'/api/stats/{route}', query_string={'goal_id': goal['id']}, headers=headers).status_code == 404
+
+    app_module.purge_deleted()
+    with app_module.db_session():
+        events = app_module.execute_query(
+            f'SELECT goal_id FROM completion_events WHERE track_id = {app_module.PARAM}', (track['id'],), fetch_all=True
+        )
+    assert [row['goal_id'] for row in events] == [other['id']]
+    assert heatmap_total(client, headers, track_id=track['id']) == 1
+    assert heatmap_total(client, headers, goal_id=other['id']) == 1
@@ -0,0 +1,35 @@
+"""Task payload validation on create, update, batch and import"""
+import json
+
+import pytest
+
+COMPLETED_ERROR = 'Completed must be true or false'
+
+@pytest.mark.parametrize('completed', ['false', 'true', 0, 1, None, []])
+def test_create_rejects_non_boolean_completed(client, headers, goal, completed):
+    response = client.post('/api/tasks', json={'goal_id': goal['id'], 'title': 'Task', 'completed': completed}, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == COMPLETED_ERROR
+    assert client.get('/api/tasks', query_string={'goal_id': goal['id']}, headers=headers).get_json() == []
+
+def test_update_rejects_non_boolean_completed(client, headers, task):
+    response = client.put(f"/api/tasks/{task['id']}", json={'title': 'Task', 'completed': 'false'}, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == COMPLETED_ERROR
+
+def test_batch_rejects_non_boolean_completed(client, headers, goal):
+    response = client.post('/api/batch', json={'operations': [
+        {'action': 'create', 'type': 'task', 'data': {'goal_id': goal['id'], 'title': 'Task', 'completed': 'false'}},
+    ]}, headers=headers)
+    assert response.status_code == 400
+    assert COMPLETED_ERROR in response.get_json()['error']
+
+def test_import_rejects_non_boolean_completed(client, headers):
+    lines = [
+        {'type': 'track', 'id': 1, 'name': 'Imported'},
+        {'type': 'goal', 'id': 1, 'track_id': 1, 'title': 'Goal'},
+        {'type': 'task', 'goal_id': 1, 'title': 'Task', 'completed': 'false'},
+    ]
+    response = client.post('/api/import', data=''.join(json.dumps(line) + '\n' for line in lines), headers=headers)
+    assert response.status_code == 400
+    assert COMPLETED_ERROR in response.get_json()['error']